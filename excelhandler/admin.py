@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Student, Test, Question, StudentResponse, Institution,Batch,StudentTestPerformance,StudentSubjectPerformance
+from .models import Student, Test, Question, StudentResponse, Institution,Batch,StudentTestPerformance,StudentSubjectPerformance,IngestionJob,IngestionRun
 
 # -----------------------
 # ADMIN: Institution
@@ -78,3 +78,23 @@ class StudentSubjectPerformanceAdmin(admin.ModelAdmin):
     list_display = ('student','test','subject_tag','subject_score','subject_rank')
     
 
+# -----------------------
+# ADMIN: IngestionJob
+# -----------------------
+@admin.register(IngestionJob)
+class IngestionJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'status', 'workers', 'phase', 'rows_processed', 'rows_per_sec', 'created_at', 'finished_at')
+    list_filter = ('status',)
+
+    def get_queryset(self, request):
+        # Scratch jobs only own staged rows while an answer key update runs.
+        return super().get_queryset(request).exclude(status=IngestionJob.STATUS_SCRATCH)
+
+
+# -----------------------
+# ADMIN: IngestionRun
+# -----------------------
+@admin.register(IngestionRun)
+class IngestionRunAdmin(admin.ModelAdmin):
+    list_display = ('id', 'status', 'workers', 'student_responses_written', 'wall_seconds', 'created_at')
+    list_filter = ('status',)
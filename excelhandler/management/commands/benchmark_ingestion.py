@@ -0,0 +1,201 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+from django.db.models.expressions import Window
+from django.db.models.functions import DenseRank
+
+from excelhandler.models import (
+    Institution, Batch, Student, Test, StudentResponse, StudentTestPerformance, StudentSubjectPerformance, IngestionJob,
+)
+from excelhandler.views.bulk_load import FACT_BATCH_SIZE
+from excelhandler.views.staging import _IngestionCheckpoint, _stage_answer_sheets, _stage_questions, _publish_test
+from excelhandler.views.staged_scoring import _score_staged_test
+
+BENCHMARKS = ('fact-load', 'ranking')
+SUBJECTS = ('Physics', 'Chemistry', 'Botany', 'Zoology')
+
+
+class _Rollback(Exception):
+    """Raised to discard the synthetic dataset once a benchmark has finished."""
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks ingestion paths on a synthetic dataset and reports throughput. "
+        "Everything runs inside a transaction that is rolled back, so the database is left untouched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=100, help='Synthetic students per test.')
+        parser.add_argument('--tests', type=int, default=1, help='Number of synthetic tests.')
+        parser.add_argument('--questions', type=int, default=180, help='Answer columns per SR row.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--only', choices=BENCHMARKS, action='append',
+            help='Run only the given benchmark (repeatable). Defaults to all of them.',
+        )
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        try:
+            with transaction.atomic():
+                students, tests = self._create_dimensions(options['students'], options['tests'])
+                answer_sheets = {
+                    (student.sturecid, test.test_code): [random.randint(0, 4) for _ in range(options['questions'])]
+                    for test in tests
+                    for student in students
+                }
+                answer_key = {
+                    (test.test_code, question_number): (SUBJECTS[question_number % len(SUBJECTS)], random.randint(1, 4))
+                    for test in tests
+                    for question_number in range(1, options['questions'] + 1)
+                }
+                benchmarks = options['only'] or BENCHMARKS
+                if 'fact-load' in benchmarks:
+                    self._benchmark_fact_load(answer_sheets, answer_key, students, tests)
+                if 'ranking' in benchmarks:
+                    self._benchmark_ranking(answer_sheets, answer_key, tests)
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+    def _create_dimensions(self, student_count, test_count):
+        institution = Institution.objects.create(name='__benchmark_institution__')
+        batch = Batch.objects.create(name='__benchmark_batch__', institution=institution)
+        students = Student.objects.bulk_create([
+            Student(sturecid=900000000 + i, name=f'Benchmark Student {i}', student_class='XII', section='A')
+            for i in range(student_count)
+        ])
+        tests = Test.objects.bulk_create([
+            Test(test_code=f'__benchmark_{i}__', test_type='BENCHMARK', institution=institution, batch=batch)
+            for i in range(test_count)
+        ])
+        return students, tests
+
+    def _report(self, label, rows, seconds):
+        rate = rows / seconds if seconds > 0 else 0.0
+        self.stdout.write(f"    {label:<32} {rows:>9} rows in {seconds:8.2f}s  ->  {rate:>10.0f} rows/sec")
+        return rate
+
+    def _benchmark_fact_load(self, answer_sheets, answer_key, students, tests):
+        self.stdout.write("\n--- Fact load (Phase 1 staging + publish of responses) ---")
+        students_by_id = {student.sturecid: student for student in students}
+        tests_by_code = {test.test_code: test for test in tests}
+
+        # Previous path: one update_or_create per answer column.
+        with transaction.atomic():
+            started = time.perf_counter()
+            written = 0
+            for (sturecid, test_code), options in answer_sheets.items():
+                for question_number, selected_option in enumerate(options, start=1):
+                    StudentResponse.objects.update_or_create(
+                        sturecid=students_by_id[sturecid],
+                        test_code=tests_by_code[test_code],
+                        question_number=question_number,
+                        defaults={'selected_option': selected_option, 'is_correct': False, 'score_awarded': 0.0},
+                    )
+                    written += 1
+            orm_rate = self._report('update_or_create (insert)', written, time.perf_counter() - started)
+            transaction.set_rollback(True)
+
+        # Ingestion path, first load (all inserts) and re-load (unchanged rows left alone):
+        # COPY into staging in FACT_BATCH_SIZE batches, then score and publish each test.
+        # Rolled back like the path above, so the ranking benchmark starts without totals.
+        with transaction.atomic():
+            for label in ('stage + publish (insert)', 'stage + publish (re-load)'):
+                bulk_rate = self._staged_load(label, answer_sheets, answer_key, tests)
+            transaction.set_rollback(True)
+
+        if orm_rate > 0:
+            self.stdout.write(f"    Speedup (staged re-load vs update_or_create): {bulk_rate / orm_rate:.1f}x")
+
+    def _stage_job(self, answer_sheets, answer_key):
+        """Stages `answer_sheets` and `answer_key` for a fresh job; returns (job, sheets staged)."""
+        job = IngestionJob.objects.create(status=IngestionJob.STATUS_SCRATCH)
+        _IngestionCheckpoint(job).save()
+        staged = 0
+        batch = {}
+        for key, options in answer_sheets.items():
+            batch[key] = options
+            if len(batch) >= FACT_BATCH_SIZE:
+                staged += _stage_answer_sheets(job, batch)
+                batch = {}
+        if batch:
+            staged += _stage_answer_sheets(job, batch)
+        _stage_questions(job, answer_key)
+        return job, staged
+
+    def _staged_load(self, label, answer_sheets, answer_key, tests):
+        """One ingestion-path load of `answer_sheets` as a fresh job; returns its rate."""
+        started = time.perf_counter()
+        job, staged = self._stage_job(answer_sheets, answer_key)
+        stage_seconds = time.perf_counter() - started
+        written = sum(_publish_test(test.test_code, job.pk, {})['student_responses_written'] for test in tests)
+        seconds = time.perf_counter() - started
+        self.stdout.write(
+            f"    ({staged} sheets staged in {stage_seconds:.2f}s, scored and published in {seconds - stage_seconds:.2f}s)"
+        )
+        return self._report(label, written, seconds)
+
+    def _benchmark_ranking(self, answer_sheets, answer_key, tests):
+        self.stdout.write("\n--- Ranking (Phase 4/5 totals and ranks) ---")
+        row_count = len(answer_sheets) * (1 + len(SUBJECTS))
+
+        # Previous path: a DenseRank query per test / (test, subject) and a save() per row,
+        # over totals already written.
+        with transaction.atomic():
+            StudentTestPerformance.objects.bulk_create([
+                StudentTestPerformance(student_id=sturecid, test_id=test_code, total_score=sum(options))
+                for (sturecid, test_code), options in answer_sheets.items()
+            ])
+            StudentSubjectPerformance.objects.bulk_create([
+                StudentSubjectPerformance(
+                    student_id=sturecid, test_id=test_code, subject_tag=subject,
+                    subject_score=sum(options[position::len(SUBJECTS)]),
+                )
+                for (sturecid, test_code), options in answer_sheets.items()
+                for position, subject in enumerate(SUBJECTS)
+            ])
+            started = time.perf_counter()
+            self._legacy_rank({test_code for _, test_code in answer_sheets})
+            legacy_rate = self._report('per-row save()', row_count, time.perf_counter() - started)
+            transaction.set_rollback(True)
+
+        # Ingestion path: _score_staged_test computes totals, subject totals and their dense
+        # ranks in staging (scoring the responses on the way), and _publish_test merges them.
+        with transaction.atomic():
+            job, _ = self._stage_job(answer_sheets, answer_key)
+            started = time.perf_counter()
+            ranked = 0
+            for test in tests:
+                _, performance_records, subject_performance_records, _ = _score_staged_test(job.pk, test.test_code)
+                ranked += performance_records + subject_performance_records
+            bulk_rate = self._report('score + dense-rank in staging', ranked, time.perf_counter() - started)
+            started = time.perf_counter()
+            for test in tests:
+                _publish_test(test.test_code, job.pk, {})
+            self._report('publish (merge into live tables)', ranked, time.perf_counter() - started)
+            transaction.set_rollback(True)
+
+        if legacy_rate > 0:
+            self.stdout.write(f"    Speedup (staged ranks vs per-row save): {bulk_rate / legacy_rate:.1f}x")
+
+    def _legacy_rank(self, test_codes):
+        for test_code in test_codes:
+            ranked = StudentTestPerformance.objects.filter(test_id=test_code).annotate(
+                calculated_rank=Window(expression=DenseRank(), order_by=models.F('total_score').desc())
+            )
+            for performance_obj in ranked:
+                if performance_obj.rank != performance_obj.calculated_rank:
+                    performance_obj.rank = performance_obj.calculated_rank
+                    performance_obj.save(update_fields=['rank'])
+        for combo in StudentSubjectPerformance.objects.filter(test_id__in=test_codes).values('test', 'subject_tag').distinct():
+            ranked = StudentSubjectPerformance.objects.filter(test_id=combo['test'], subject_tag=combo['subject_tag']).annotate(
+                calculated_rank=Window(expression=DenseRank(), order_by=models.F('subject_score').desc())
+            )
+            for performance_obj in ranked:
+                if performance_obj.subject_rank != performance_obj.calculated_rank:
+                    performance_obj.subject_rank = performance_obj.calculated_rank
+                    performance_obj.save(update_fields=['subject_rank'])
@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from excelhandler.models import StudentResponse, StudentAnswerSheet, UnpackedStudentResponse
+from excelhandler.views.response_store import RESPONSE_STORAGE_ROWS, RESPONSE_STORAGE_SHEETS
+
+_ROWS_TABLE = StudentResponse._meta.db_table
+_SHEETS_TABLE = StudentAnswerSheet._meta.db_table
+_UNPACKED_VIEW = UnpackedStudentResponse._meta.db_table
+
+
+class Command(BaseCommand):
+    help = (
+        "Copies student responses between the per-question StudentResponse rows and the packed "
+        "StudentAnswerSheet storage, and reports the size of both. Switch RESPONSE_STORAGE afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--to', choices=[RESPONSE_STORAGE_ROWS, RESPONSE_STORAGE_SHEETS], required=True, help='Target storage.')
+        parser.add_argument('--delete-source', action='store_true', help='Empty the source storage once the copy is done.')
+
+    def handle(self, *args, **options):
+        self._report_sizes("Before")
+        with transaction.atomic(), connection.cursor() as cursor:
+            if options['to'] == RESPONSE_STORAGE_SHEETS:
+                # Question numbers are contiguous from 1, so ordering by them packs question i at index i.
+                cursor.execute(
+                    f"""
+                    INSERT INTO {_SHEETS_TABLE} (sturecid_id, test_code_id, selected_options, is_correct, score_awarded)
+                    SELECT sturecid_id, test_code_id,
+                           array_agg(selected_option ORDER BY question_number),
+                           array_agg(is_correct ORDER BY question_number),
+                           array_agg(score_awarded ORDER BY question_number)
+                    FROM {_ROWS_TABLE}
+                    GROUP BY sturecid_id, test_code_id
+                    ON CONFLICT (sturecid_id, test_code_id) DO UPDATE
+                    SET selected_options = EXCLUDED.selected_options,
+                        is_correct = EXCLUDED.is_correct,
+                        score_awarded = EXCLUDED.score_awarded
+                    """
+                )
+                self.stdout.write(f"Packed responses into {cursor.rowcount} answer sheets.")
+                source_table = _ROWS_TABLE
+            else:
+                cursor.execute(
+                    f"""
+                    INSERT INTO {_ROWS_TABLE} (sturecid_id, test_code_id, question_number, selected_option, is_correct, score_awarded)
+                    SELECT sturecid_id, test_code_id, question_number, selected_option, is_correct, score_awarded
+                    FROM {_UNPACKED_VIEW}
+                    ON CONFLICT (sturecid_id, test_code_id, question_number) DO UPDATE
+                    SET selected_option = EXCLUDED.selected_option,
+                        is_correct = EXCLUDED.is_correct,
+                        score_awarded = EXCLUDED.score_awarded
+                    """
+                )
+                self.stdout.write(f"Unpacked answer sheets into {cursor.rowcount} StudentResponse rows.")
+                source_table = _SHEETS_TABLE
+            if options['delete_source']:
+                cursor.execute(f"TRUNCATE {source_table}")
+                self.stdout.write(f"Emptied {source_table}.")
+        self._report_sizes("After")
+        self.stdout.write(self.style.SUCCESS(f"Set RESPONSE_STORAGE={options['to']} to read and write the converted storage."))
+
+    def _report_sizes(self, label):
+        with connection.cursor() as cursor:
+            for table in (_ROWS_TABLE, _SHEETS_TABLE):
+                cursor.execute(
+                    "SELECT pg_size_pretty(pg_total_relation_size(%s)), pg_size_pretty(pg_indexes_size(%s))",
+                    [table, table],
+                )
+                total_size, index_size = cursor.fetchone()
+                self.stdout.write(f"{label}: {table} {total_size} (indexes {index_size})")
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from excelhandler.models import IngestionJob
+from excelhandler.views.deletion import _delete_test
+from excelhandler.views.jobs import _run_job
+from excelhandler.views.pipeline import _IngestionInputError
+from excelhandler.views.row_readers import _open_mapped
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes a test with its responses, totals, subject totals and answer key using set-based deletes. "
+        "With --sr and --ak the test is replaced instead: reloaded from the files in the same transaction as the delete."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('test_code', help='Code of the test to delete or replace.')
+        parser.add_argument('--sr', help='Path to an SR.csv (or .xlsx) holding the replacement rows; other tests in it are ignored.')
+        parser.add_argument('--ak', help='Path to the matching AK.csv (or .xlsx).')
+
+    def handle(self, *args, **options):
+        test_code = options['test_code']
+        if (options['sr'] is None) != (options['ak'] is None):
+            raise CommandError("Pass both --sr and --ak to replace the test, or neither to delete it.")
+        if options['sr'] is None:
+            result = _delete_test(test_code)
+            if result is None:
+                raise CommandError(f"Test '{test_code}' not found.")
+            self.stdout.write(self.style.SUCCESS(
+                f"Deleted test '{test_code}' in {result['elapsed_seconds']:.2f}s: "
+                + ', '.join(f"{count} {table}" for table, count in result['deleted'].items())
+            ))
+            return
+
+        try:
+            with _open_mapped(options['sr']) as sr_file, _open_mapped(options['ak']) as ak_file:
+                job = IngestionJob.objects.create(
+                    replace_test_code=test_code, status=IngestionJob.STATUS_RUNNING, started_at=timezone.now(),
+                )
+                try:
+                    job = _run_job(job, raise_errors=True, sr_file=sr_file, ak_file=ak_file)
+                except _IngestionInputError as e:
+                    raise CommandError(str(e))
+                except Exception as e:
+                    raise CommandError(f"Replacing test '{test_code}' failed (ingestion job {job.pk}): {e}")
+        except OSError as e:
+            raise CommandError(f"Cannot read input file: {e}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Replaced test '{test_code}' in {job.result['wall_seconds']:.2f}s: "
+            f"{job.result['student_responses_written']} student responses written."
+        ))
@@ -0,0 +1,93 @@
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from excelhandler.models import IngestionJob
+from excelhandler.views.jobs import _run_job
+from excelhandler.views.pipeline import _IngestionInputError
+from excelhandler.views.row_readers import _open_mapped
+
+
+class Command(BaseCommand):
+    help = (
+        "Loads an SR/AK file pair (or a .zip archive of pairs) from disk through the ingestion pipeline, without the web tier. "
+        "The files are memory-mapped rather than uploaded, and the phase metrics are printed at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sr', help='Path to SR.csv (or .xlsx).')
+        parser.add_argument('--ak', help='Path to AK.csv (or .xlsx).')
+        parser.add_argument('--archive', help='Path to a .zip of SR/AK pairs, instead of --sr and --ak.')
+        parser.add_argument('--workers', type=int, default=settings.INGESTION_WORKERS, help='Processes publishing tests in parallel.')
+        parser.add_argument('--full-rebuild', action='store_true', help='Recompute every test, not only the ones in the files.')
+        parser.add_argument(
+            '--resume', type=int, metavar='JOB_ID',
+            help='Resume a failed or interrupted `ingest` job from its checkpoint. Pass the same files as the first run.',
+        )
+        parser.add_argument(
+            '--trace-memory', action='store_true',
+            help='Trace peak Python memory per phase (tracemalloc), like INGESTION_TRACE_MEMORY. Slows the run down.',
+        )
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError(f"--workers must be a positive integer, got {options['workers']}.")
+        if options['archive'] is None and (options['sr'] is None or options['ak'] is None):
+            raise CommandError("Pass --sr and --ak, or --archive.")
+        if options['trace_memory']:
+            settings.INGESTION_TRACE_MEMORY = True
+        try:
+            with ExitStack() as stack:
+                if options['archive'] is not None:
+                    files = {'archive_file': stack.enter_context(_open_mapped(options['archive']))}
+                else:
+                    files = {
+                        'sr_file': stack.enter_context(_open_mapped(options['sr'])),
+                        'ak_file': stack.enter_context(_open_mapped(options['ak'])),
+                    }
+                job = self._job(options)
+                try:
+                    job = _run_job(job, raise_errors=True, **files)
+                except _IngestionInputError as e:
+                    raise CommandError(str(e))
+                except Exception as e:
+                    raise CommandError(f"Ingestion job {job.pk} failed: {e}. Re-run with --resume {job.pk} to continue from its checkpoint.")
+        except OSError as e:
+            raise CommandError(f"Cannot read input file: {e}")
+        self._report(job.result)
+
+    def _job(self, options):
+        if options['resume'] is None:
+            return IngestionJob.objects.create(
+                full_rebuild=options['full_rebuild'], workers=options['workers'],
+                status=IngestionJob.STATUS_RUNNING, started_at=timezone.now(),
+            )
+        try:
+            job = IngestionJob.objects.get(pk=options['resume'])
+        except IngestionJob.DoesNotExist:
+            raise CommandError(f"Ingestion job {options['resume']} not found.")
+        # A killed `ingest` process leaves its job 'running'.
+        if job.status not in (IngestionJob.STATUS_FAILED, IngestionJob.STATUS_RUNNING):
+            raise CommandError(f"Only failed or interrupted jobs can be resumed; job {job.pk} is '{job.status}'.")
+        job.status = IngestionJob.STATUS_RUNNING
+        job.error = ''
+        job.finished_at = None
+        job.save(update_fields=['status', 'error', 'finished_at'])
+        return job
+
+    def _report(self, result):
+        self.stdout.write(
+            f"\nIngestion job {result['job_id']}: {result['student_responses_written']} student responses written, "
+            f"{result['tests_recomputed']} tests recomputed, {result['tests_skipped']} skipped, "
+            f"{result['workers']} workers, {result['wall_seconds']:.2f}s."
+        )
+        self.stdout.write(f"\n    {'phase':<28} {'wall s':>9} {'queries':>8} {'query s':>9} {'rows':>10} {'rows/sec':>11} {'peak MB':>8}")
+        for phase in result['metrics']['phases']:
+            peak = phase['peak_memory_bytes']
+            self.stdout.write(
+                f"    {phase['phase']:<28} {phase['wall_seconds']:>9.2f} {phase['queries']:>8} {phase['query_seconds']:>9.2f} "
+                f"{phase['rows']:>10} {phase['rows_per_sec']:>11.0f} {peak / 2**20 if peak is not None else float('nan'):>8.1f}"
+            )
+        self.stdout.write(self.style.SUCCESS("All data loaded successfully."))
@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from excelhandler.models import IngestionJob
+from excelhandler.views.jobs import _run_job
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes correctness, scores, StudentTestPerformance, StudentSubjectPerformance and all ranks of every test "
+        "from the stored responses and answer keys, without re-uploading files (e.g. after a scoring change). "
+        "Tests are rebuilt in parallel, each published in its own short transaction, so the API keeps serving meanwhile."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.INGESTION_WORKERS, help='Processes rebuilding tests in parallel.')
+        parser.add_argument(
+            '--resume', type=int, metavar='JOB_ID',
+            help='Resume a failed or interrupted rebuild from its checkpoint, skipping the tests it already rebuilt.',
+        )
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError(f"--workers must be a positive integer, got {options['workers']}.")
+        job = self._job(options)
+        try:
+            job = _run_job(job, raise_errors=True)
+        except Exception as e:
+            raise CommandError(f"Rebuild job {job.pk} failed: {e}. Re-run with --resume {job.pk} to continue from its checkpoint.")
+        result = job.result
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuild job {result['job_id']}: {result['tests_recomputed']} tests, {result['student_responses_scored']} responses scored "
+            f"({result['student_responses_rescored']} changed, {result['ranks_updated']} ranks and {result['subject_ranks_updated']} "
+            f"subject ranks updated) with {result['workers']} workers in {result['wall_seconds']:.2f}s "
+            f"({result['responses_per_sec']:.0f} responses/sec)."
+        ))
+
+    def _job(self, options):
+        if options['resume'] is None:
+            return IngestionJob.objects.create(
+                rebuild_only=True, full_rebuild=True, workers=options['workers'],
+                status=IngestionJob.STATUS_RUNNING, started_at=timezone.now(),
+            )
+        try:
+            job = IngestionJob.objects.get(pk=options['resume'], rebuild_only=True)
+        except IngestionJob.DoesNotExist:
+            raise CommandError(f"Rebuild job {options['resume']} not found.")
+        if job.status not in (IngestionJob.STATUS_FAILED, IngestionJob.STATUS_RUNNING):
+            raise CommandError(f"Only failed or interrupted jobs can be resumed; job {job.pk} is '{job.status}'.")
+        job.status = IngestionJob.STATUS_RUNNING
+        job.error = ''
+        job.finished_at = None
+        job.save(update_fields=['status', 'error', 'finished_at'])
+        return job
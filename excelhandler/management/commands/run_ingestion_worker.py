@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from excelhandler.views.jobs import _claim_next_job, _run_job, _requeue_interrupted_jobs
+
+
+class Command(BaseCommand):
+    help = "Runs queued ingestion jobs (POST /api/ingestion-jobs/) from the database-backed queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds to wait when the queue is empty.')
+        parser.add_argument('--once', action='store_true', help='Process the jobs currently queued, then exit.')
+        parser.add_argument(
+            '--resume-interrupted', action='store_true',
+            help="Requeue jobs left 'running' by a worker that died, so they resume from their checkpoint. "
+                 "Only use it when no other worker is running.",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Ingestion worker started.")
+        if options['resume_interrupted']:
+            self.stdout.write(f"Requeued {_requeue_interrupted_jobs()} interrupted ingestion jobs.")
+        while True:
+            close_old_connections()
+            job = _claim_next_job()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+            self.stdout.write(f"Running ingestion job {job.pk}...")
+            job = _run_job(job)
+            self.stdout.write(f"Ingestion job {job.pk} finished with status '{job.status}'.")
+        self.stdout.write("Ingestion worker stopped.")
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:20
+
+import django.contrib.postgres.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('excelhandler', '0003_ingestionjob_full_rebuild'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnpackedStudentResponse',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('question_number', models.PositiveIntegerField()),
+                ('selected_option', models.PositiveIntegerField()),
+                ('is_correct', models.BooleanField()),
+                ('score_awarded', models.FloatField()),
+            ],
+            options={
+                'db_table': 'excelhandler_unpackedstudentresponse',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='StudentAnswerSheet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('selected_options', django.contrib.postgres.fields.ArrayField(base_field=models.SmallIntegerField(), size=None)),
+                ('is_correct', django.contrib.postgres.fields.ArrayField(base_field=models.BooleanField(null=True), size=None)),
+                ('score_awarded', django.contrib.postgres.fields.ArrayField(base_field=models.FloatField(), size=None)),
+                ('sturecid', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='excelhandler.student')),
+                ('test_code', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='excelhandler.test')),
+            ],
+            options={
+                'unique_together': {('sturecid', 'test_code')},
+            },
+        ),
+        # Compatibility layer: StudentAnswerSheet exposed with StudentResponse's columns.
+        # Filters on sturecid_id/test_code_id are pushed down to the sheet table.
+        migrations.RunSQL(
+            sql="""
+                CREATE VIEW excelhandler_unpackedstudentresponse AS
+                SELECT s.id * 1000 + u.question_number AS id,
+                       s.sturecid_id,
+                       s.test_code_id,
+                       u.question_number::integer AS question_number,
+                       u.selected_option::integer AS selected_option,
+                       COALESCE(s.is_correct[u.question_number], FALSE) AS is_correct,
+                       COALESCE(s.score_awarded[u.question_number], 0.0) AS score_awarded
+                FROM excelhandler_studentanswersheet AS s
+                CROSS JOIN LATERAL unnest(s.selected_options) WITH ORDINALITY AS u(selected_option, question_number)
+            """,
+            reverse_sql="DROP VIEW IF EXISTS excelhandler_unpackedstudentresponse",
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('excelhandler', '0004_studentanswersheet'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='test',
+            name='answer_key_fingerprint',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='test',
+            name='responses_fingerprint',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:56
+
+import django.contrib.postgres.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('excelhandler', '0006_ingestionrun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestionjob',
+            name='checkpoint',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='ingestionjob',
+            name='workers',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.CreateModel(
+            name='StagedAnswerSheet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('test_code', models.CharField(max_length=255)),
+                ('sturecid', models.BigIntegerField()),
+                ('selected_options', django.contrib.postgres.fields.ArrayField(base_field=models.SmallIntegerField(), size=None)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='excelhandler.ingestionjob')),
+            ],
+            options={
+                'unique_together': {('job', 'test_code', 'sturecid')},
+            },
+        ),
+        migrations.CreateModel(
+            name='StagedQuestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('test_code', models.CharField(max_length=255)),
+                ('question_number', models.PositiveIntegerField()),
+                ('correct_option', models.PositiveIntegerField()),
+                ('subject_tag', models.CharField(blank=True, max_length=50, null=True)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='excelhandler.ingestionjob')),
+            ],
+            options={
+                'unique_together': {('job', 'test_code', 'question_number')},
+            },
+        ),
+        migrations.CreateModel(
+            name='StagedTest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('test_code', models.CharField(max_length=255)),
+                ('test_date', models.DateField(blank=True, null=True)),
+                ('test_type', models.CharField(max_length=50)),
+                ('batch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='excelhandler.batch')),
+                ('institution', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='excelhandler.institution')),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='excelhandler.ingestionjob')),
+            ],
+            options={
+                'unique_together': {('job', 'test_code')},
+            },
+        ),
+    ]
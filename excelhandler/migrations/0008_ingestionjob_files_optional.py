@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('excelhandler', '0007_ingestion_checkpoints'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ingestionjob',
+            name='ak_file',
+            field=models.FileField(blank=True, upload_to='ingestion/%Y/%m/%d/'),
+        ),
+        migrations.AlterField(
+            model_name='ingestionjob',
+            name='sr_file',
+            field=models.FileField(blank=True, upload_to='ingestion/%Y/%m/%d/'),
+        ),
+    ]
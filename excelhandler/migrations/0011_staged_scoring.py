@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:36
+
+import django.contrib.postgres.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('excelhandler', '0010_ingestionjob_archive_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stagedanswersheet',
+            name='carried',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='stagedanswersheet',
+            name='is_correct',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.BooleanField(null=True), null=True, size=None),
+        ),
+        migrations.AddField(
+            model_name='stagedanswersheet',
+            name='score_awarded',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.FloatField(), null=True, size=None),
+        ),
+        migrations.CreateModel(
+            name='StagedSubjectPerformance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('test_code', models.CharField(max_length=255)),
+                ('sturecid', models.BigIntegerField()),
+                ('subject_tag', models.CharField(max_length=50)),
+                ('subject_score', models.FloatField()),
+                ('subject_rank', models.PositiveIntegerField()),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='excelhandler.ingestionjob')),
+            ],
+            options={
+                'unique_together': {('job', 'test_code', 'sturecid', 'subject_tag')},
+            },
+        ),
+        migrations.CreateModel(
+            name='StagedTestPerformance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('test_code', models.CharField(max_length=255)),
+                ('sturecid', models.BigIntegerField()),
+                ('total_score', models.FloatField()),
+                ('rank', models.PositiveIntegerField()),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='excelhandler.ingestionjob')),
+            ],
+            options={
+                'unique_together': {('job', 'test_code', 'sturecid')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('excelhandler', '0011_staged_scoring'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestionjob',
+            name='replace_test_code',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
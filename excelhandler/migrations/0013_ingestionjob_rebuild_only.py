@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('excelhandler', '0012_ingestionjob_replace_test_code'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestionjob',
+            name='rebuild_only',
+            field=models.BooleanField(default=False),
+        ),
+    ]
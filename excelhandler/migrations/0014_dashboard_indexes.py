@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('excelhandler', '0013_ingestionjob_rebuild_only'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['test_code', 'subject_tag'], include=('question_number',), name='question_test_subject_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['section'], name='student_section_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['student_class', 'section'], name='student_class_section_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentresponse',
+            index=models.Index(fields=['test_code', 'question_number'], name='response_test_question_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentsubjectperformance',
+            index=models.Index(fields=['test', 'subject_tag', 'subject_score'], include=('student',), name='subject_perf_test_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studenttestperformance',
+            index=models.Index(fields=['test', 'total_score'], include=('student', 'rank'), name='performance_test_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='test',
+            index=models.Index(fields=['institution', 'batch', 'test_type', 'test_date'], name='test_inst_batch_type_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='test',
+            index=models.Index(fields=['test_type', 'test_date'], name='test_type_date_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_response_cube(apps, schema_editor):
+    """Aggregates the responses already stored, in the configured storage, into the cube."""
+    responses = 'excelhandler_unpackedstudentresponse' if settings.RESPONSE_STORAGE == 'sheets' else 'excelhandler_studentresponse'
+    schema_editor.execute(
+        f"""
+        INSERT INTO excelhandler_responsecube (test_id, student_class, section, subject_tag, attempted, correct, incorrect, total)
+        SELECT r.test_code_id, s.student_class, s.section, q.subject_tag,
+               count(*) FILTER (WHERE r.selected_option > 0),
+               count(*) FILTER (WHERE r.selected_option > 0 AND r.is_correct),
+               count(*) FILTER (WHERE r.selected_option > 0 AND r.is_correct IS NOT TRUE),
+               count(*)
+        FROM {responses} AS r
+        JOIN excelhandler_student AS s ON s.sturecid = r.sturecid_id
+        LEFT JOIN excelhandler_question AS q
+            ON q.test_code_id = r.test_code_id AND q.question_number = r.question_number
+        GROUP BY r.test_code_id, s.student_class, s.section, q.subject_tag
+        """
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('excelhandler', '0014_dashboard_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResponseCube',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('student_class', models.CharField(max_length=50)),
+                ('section', models.CharField(blank=True, max_length=50, null=True)),
+                ('subject_tag', models.CharField(blank=True, max_length=50, null=True)),
+                ('attempted', models.PositiveIntegerField()),
+                ('correct', models.PositiveIntegerField()),
+                ('incorrect', models.PositiveIntegerField()),
+                ('total', models.PositiveIntegerField()),
+                ('test', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='excelhandler.test')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('test', 'student_class', 'section', 'subject_tag'), name='response_cube_cell_unique', nulls_distinct=False)],
+            },
+        ),
+        migrations.RunPython(fill_response_cube, migrations.RunPython.noop),
+    ]
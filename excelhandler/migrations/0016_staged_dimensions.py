@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_dimension_names(apps, schema_editor):
+    StagedTest = apps.get_model('excelhandler', 'StagedTest')
+    for staged_test in StagedTest.objects.select_related('institution', 'batch'):
+        staged_test.institution_name = staged_test.institution.name
+        staged_test.batch_name = staged_test.batch.name
+        staged_test.save(update_fields=['institution_name', 'batch_name'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('excelhandler', '0015_responsecube'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stagedtest',
+            name='institution_name',
+            field=models.CharField(default='', max_length=255),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='stagedtest',
+            name='batch_name',
+            field=models.CharField(default='', max_length=255),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_dimension_names, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='stagedtest',
+            name='institution',
+        ),
+        migrations.RemoveField(
+            model_name='stagedtest',
+            name='batch',
+        ),
+        migrations.CreateModel(
+            name='StagedStudent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sturecid', models.BigIntegerField()),
+                ('name', models.CharField(max_length=255)),
+                ('student_class', models.CharField(max_length=50)),
+                ('section', models.CharField(blank=True, max_length=50, null=True)),
+                ('claid', models.CharField(blank=True, max_length=50, null=True)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='excelhandler.ingestionjob')),
+            ],
+            options={
+                'unique_together': {('job', 'sturecid')},
+            },
+        ),
+    ]
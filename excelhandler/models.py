@@ -1,3 +1,4 @@
+from django.contrib.postgres.fields import ArrayField
 from django.db import models
 
 # -------------------------
@@ -32,6 +33,13 @@ class Student(models.Model):
     section = models.CharField(max_length=50, blank=True, null=True)
     claid = models.CharField(max_length=50, blank=True, null=True)
 
+    class Meta:
+        # Dashboard filters on section, and on class (with or without section).
+        indexes = [
+            models.Index(fields=['section'], name='student_section_idx'),
+            models.Index(fields=['student_class', 'section'], name='student_class_section_idx'),
+        ]
+
     def __str__(self):
         return f"{self.name} ({self.sturecid})"
 
@@ -45,6 +53,16 @@ class Test(models.Model):
     test_type = models.CharField(max_length=50)  # E.g., 'WEEKLY', 'GRAND', etc.
     institution = models.ForeignKey(Institution, on_delete=models.CASCADE) # Now non-nullable
     batch = models.ForeignKey(Batch, on_delete=models.CASCADE)           # Now non-nullable
+    responses_fingerprint = models.CharField(max_length=64, blank=True, default='')   # SHA-256 of the test's SR.csv rows last loaded
+    answer_key_fingerprint = models.CharField(max_length=64, blank=True, default='')  # SHA-256 of the test's AK.csv slice last loaded
+
+    class Meta:
+        # Dashboard filters narrow tests by institution > batch > test type > date range,
+        # or by test type and date range alone.
+        indexes = [
+            models.Index(fields=['institution', 'batch', 'test_type', 'test_date'], name='test_inst_batch_type_date_idx'),
+            models.Index(fields=['test_type', 'test_date'], name='test_type_date_idx'),
+        ]
 
     def __str__(self):
         return self.test_code
@@ -61,6 +79,10 @@ class Question(models.Model):
 
     class Meta:
         unique_together = (('test_code', 'question_number'),)
+        # Subject filters: the questions of a test with a given tag.
+        indexes = [
+            models.Index(fields=['test_code', 'subject_tag'], include=['question_number'], name='question_test_subject_idx'),
+        ]
 
     def __str__(self):
         return f"Q{self.question_number} ({self.test_code})"
@@ -80,10 +102,55 @@ class StudentResponse(models.Model):
 
     class Meta:
         unique_together = (('sturecid', 'test_code', 'question_number'),)
+        # Question analytics and subject filters: the responses to one question of a test.
+        indexes = [
+            models.Index(fields=['test_code', 'question_number'], name='response_test_question_idx'),
+        ]
 
     def __str__(self):
         return f"{self.sturecid.sturecid} - {self.test_code.test_code} Q{self.question_number}"
 
+# -------------------------------------------------
+# FACT (COMPACT): ONE ANSWER SHEET PER STUDENT/TEST
+# -------------------------------------------------
+class StudentAnswerSheet(models.Model):
+    """
+    Packed alternative to StudentResponse, used when RESPONSE_STORAGE = 'sheets'.
+    Element i of each array holds question i + 1.
+    """
+    sturecid = models.ForeignKey(Student, on_delete=models.CASCADE, to_field='sturecid')
+    test_code = models.ForeignKey(Test, on_delete=models.CASCADE, to_field='test_code')
+    selected_options = ArrayField(models.SmallIntegerField())          # 1–4, 0 = unattempted
+    is_correct = ArrayField(models.BooleanField(null=True))            # NULL until the question has an answer key
+    score_awarded = ArrayField(models.FloatField())
+
+    class Meta:
+        unique_together = (('sturecid', 'test_code'),)
+
+    def __str__(self):
+        return f"{self.sturecid_id} - {self.test_code_id} ({len(self.selected_options)} answers)"
+
+
+class UnpackedStudentResponse(models.Model):
+    """
+    Read-only database view that unnests StudentAnswerSheet into one row per question,
+    with the same columns as StudentResponse, so analytics can query either storage.
+    """
+    id = models.BigIntegerField(primary_key=True)  # sheet id * 1000 + question_number
+    sturecid = models.ForeignKey(Student, on_delete=models.DO_NOTHING, to_field='sturecid', related_name='+')
+    test_code = models.ForeignKey(Test, on_delete=models.DO_NOTHING, to_field='test_code', related_name='+')
+    question_number = models.PositiveIntegerField()
+    selected_option = models.PositiveIntegerField()
+    is_correct = models.BooleanField()
+    score_awarded = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'excelhandler_unpackedstudentresponse'
+
+    def __str__(self):
+        return f"{self.sturecid_id} - {self.test_code_id} Q{self.question_number}"
+
 # ----------------------------------------
 # AGGREGATED FACT/SUMMARY: STUDENT TEST PERFORMANCE
 # ----------------------------------------
@@ -96,6 +163,10 @@ class StudentTestPerformance(models.Model):
     class Meta:
         unique_together = (('student', 'test'),) # A student can only have one performance record per test
         ordering = ['test', '-total_score'] # Default ordering for easier rank calculation
+        # Totals of the filtered tests, sorted by score (averages, top/bottom 10%, ranks) without visiting the table.
+        indexes = [
+            models.Index(fields=['test', 'total_score'], include=['student', 'rank'], name='performance_test_score_idx'),
+        ]
 
     def __str__(self):
         return f"Performance for {self.student.name} on {self.test.test_code}: Score={self.total_score}, Rank={self.rank if self.rank else 'N/A'}"
@@ -112,7 +183,232 @@ class StudentSubjectPerformance(models.Model):
         # A student can only have one performance record for a specific subject on a specific test
         unique_together = (('student', 'test', 'subject_tag'),) 
         ordering = ['test', 'subject_tag', '-subject_score'] # Default ordering for easier rank calculation
+        indexes = [
+            models.Index(fields=['test', 'subject_tag', 'subject_score'], include=['student'], name='subject_perf_test_score_idx'),
+        ]
 
     def __str__(self):
         return f"Perf for {self.student.name} on {self.test.test_code} ({self.subject_tag}): Score={self.subject_score}, Rank={self.subject_rank if self.subject_rank else 'N/A'}"
-    
\ No newline at end of file
+
+
+# ----------------------------------------
+# AGGREGATED FACT/SUMMARY: RESPONSE CUBE
+# ----------------------------------------
+class ResponseCube(models.Model):
+    """
+    Response counts of a test per class, section and subject tag of its responses, rebuilt
+    from the stored responses whenever the test is published or rescored, so dashboard
+    accuracy and attempt rates are summed from these rows instead of every response.
+    """
+    test = models.ForeignKey(Test, on_delete=models.CASCADE)
+    student_class = models.CharField(max_length=50)
+    section = models.CharField(max_length=50, blank=True, null=True)
+    subject_tag = models.CharField(max_length=50, blank=True, null=True)  # NULL for untagged questions and questions missing from the answer key
+    attempted = models.PositiveIntegerField()  # selected_option > 0
+    correct = models.PositiveIntegerField()    # Attempted and is_correct
+    incorrect = models.PositiveIntegerField()  # Attempted and not is_correct
+    total = models.PositiveIntegerField()      # Every response, attempted or not
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['test', 'student_class', 'section', 'subject_tag'], nulls_distinct=False, name='response_cube_cell_unique',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.test_id} {self.student_class}/{self.section or '-'} {self.subject_tag or '-'}: {self.correct}/{self.attempted}/{self.total}"
+
+
+# ----------------------------------------
+# OPERATIONS: CHUNKED UPLOADS
+# ----------------------------------------
+class ChunkedUpload(models.Model):
+    """
+    A file uploaded as numbered chunks (PUT /api/uploads/<id>/chunks/<n>/), stored as one
+    part file per chunk under MEDIA_ROOT. Ingestion can read it while chunks still arrive.
+    """
+    STATUS_UPLOADING = 'uploading'
+    STATUS_COMPLETE = 'complete'
+    STATUS_CHOICES = [
+        (STATUS_UPLOADING, 'Uploading'),
+        (STATUS_COMPLETE, 'Complete'),
+    ]
+
+    filename = models.CharField(max_length=255)                  # Client file name; its extension selects CSV or .xlsx parsing
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_UPLOADING)
+    chunk_count = models.PositiveIntegerField(null=True, blank=True)  # Set when the upload is finalized
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Upload {self.pk} {self.filename} ({self.status})"
+
+
+# ----------------------------------------
+# OPERATIONS: BACKGROUND INGESTION JOBS
+# ----------------------------------------
+class IngestionJob(models.Model):
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    # Only owns staged rows (e.g. of an answer key update): never queued, resumed or listed.
+    STATUS_SCRATCH = 'scratch'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+        (STATUS_SCRATCH, 'Scratch'),
+    ]
+
+    sr_file = models.FileField(upload_to='ingestion/%Y/%m/%d/', blank=True)  # Empty when read from disk by `manage.py ingest`
+    ak_file = models.FileField(upload_to='ingestion/%Y/%m/%d/', blank=True)
+    archive_file = models.FileField(upload_to='ingestion/%Y/%m/%d/', blank=True)  # A .zip of SR/AK pairs, instead of sr_file/ak_file
+    sr_upload = models.ForeignKey(ChunkedUpload, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')  # Instead of sr_file
+    ak_upload = models.ForeignKey(ChunkedUpload, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')  # Instead of ak_file
+    full_rebuild = models.BooleanField(default=False)            # Recompute every test, not only the uploaded ones
+    replace_test_code = models.CharField(max_length=255, blank=True)  # Only load this test, replacing everything stored for it
+    rebuild_only = models.BooleanField(default=False)            # Read no files: recompute every test from its stored responses
+    workers = models.PositiveIntegerField(default=1)             # Processes publishing tests in parallel
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED, db_index=True)
+    phase = models.CharField(max_length=50, blank=True)          # Phase currently being run by the worker
+    rows_processed = models.PositiveBigIntegerField(default=0)   # Rows handled so far in the current phase
+    rows_per_sec = models.FloatField(default=0.0)                # Throughput of the current phase
+    result = models.JSONField(null=True, blank=True)             # Pipeline summary once the job has finished
+    checkpoint = models.JSONField(default=dict, blank=True)      # Committed progress a failed job resumes from
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+
+    def __str__(self):
+        return f"Ingestion job {self.pk} ({self.status})"
+
+
+# ----------------------------------------
+# OPERATIONS: INGESTION STAGING
+# ----------------------------------------
+# Parsed rows of a job wait here, committed chunk by chunk, until their test is
+# published into the tables above in one transaction. Before that, each test is scored
+# and ranked here, so publishing only merges finished rows. Dimensions are staged by
+# name and created only once the upload has passed validation.
+class StagedTest(models.Model):
+    job = models.ForeignKey(IngestionJob, on_delete=models.CASCADE)
+    test_code = models.CharField(max_length=255)
+    test_date = models.DateField(blank=True, null=True)
+    test_type = models.CharField(max_length=50)
+    institution_name = models.CharField(max_length=255)
+    batch_name = models.CharField(max_length=255)
+
+    class Meta:
+        unique_together = (('job', 'test_code'),)
+
+    def __str__(self):
+        return f"{self.test_code} (job {self.job_id})"
+
+
+class StagedStudent(models.Model):
+    job = models.ForeignKey(IngestionJob, on_delete=models.CASCADE)
+    sturecid = models.BigIntegerField()
+    name = models.CharField(max_length=255)
+    student_class = models.CharField(max_length=50)
+    section = models.CharField(max_length=50, blank=True, null=True)
+    claid = models.CharField(max_length=50, blank=True, null=True)
+
+    class Meta:
+        unique_together = (('job', 'sturecid'),)
+
+    def __str__(self):
+        return f"{self.sturecid} (job {self.job_id})"
+
+
+class StagedQuestion(models.Model):
+    job = models.ForeignKey(IngestionJob, on_delete=models.CASCADE)
+    test_code = models.CharField(max_length=255)
+    question_number = models.PositiveIntegerField()
+    correct_option = models.PositiveIntegerField()
+    subject_tag = models.CharField(max_length=50, blank=True, null=True)
+
+    class Meta:
+        unique_together = (('job', 'test_code', 'question_number'),)
+
+    def __str__(self):
+        return f"Q{self.question_number} ({self.test_code}, job {self.job_id})"
+
+
+class StagedAnswerSheet(models.Model):
+    job = models.ForeignKey(IngestionJob, on_delete=models.CASCADE)
+    test_code = models.CharField(max_length=255)
+    sturecid = models.BigIntegerField()
+    selected_options = ArrayField(models.SmallIntegerField())          # Element i holds question i + 1
+    is_correct = ArrayField(models.BooleanField(null=True), null=True)  # Set when the test is scored in staging
+    score_awarded = ArrayField(models.FloatField(), null=True)
+    carried = models.BooleanField(default=False)                       # Copied from the live tables for rescoring, not uploaded
+
+    class Meta:
+        unique_together = (('job', 'test_code', 'sturecid'),)
+
+    def __str__(self):
+        return f"{self.sturecid} - {self.test_code} (job {self.job_id})"
+
+
+class StagedTestPerformance(models.Model):
+    job = models.ForeignKey(IngestionJob, on_delete=models.CASCADE)
+    test_code = models.CharField(max_length=255)
+    sturecid = models.BigIntegerField()
+    total_score = models.FloatField()
+    rank = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = (('job', 'test_code', 'sturecid'),)
+
+    def __str__(self):
+        return f"{self.sturecid} - {self.test_code}: {self.total_score} (job {self.job_id})"
+
+
+class StagedSubjectPerformance(models.Model):
+    job = models.ForeignKey(IngestionJob, on_delete=models.CASCADE)
+    test_code = models.CharField(max_length=255)
+    sturecid = models.BigIntegerField()
+    subject_tag = models.CharField(max_length=50)
+    subject_score = models.FloatField()
+    subject_rank = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = (('job', 'test_code', 'sturecid', 'subject_tag'),)
+
+    def __str__(self):
+        return f"{self.sturecid} - {self.test_code} ({self.subject_tag}): {self.subject_score} (job {self.job_id})"
+
+
+# ----------------------------------------
+# OPERATIONS: INGESTION HISTORY
+# ----------------------------------------
+class IngestionRun(models.Model):
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES)
+    full_rebuild = models.BooleanField(default=False)
+    workers = models.PositiveIntegerField(default=1)
+    student_responses_written = models.PositiveBigIntegerField(default=0)
+    wall_seconds = models.FloatField()
+    metrics = models.JSONField()                                 # Per-phase wall time, queries, rows/sec and peak memory
+    result = models.JSONField(null=True, blank=True)             # Pipeline summary (successful runs)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Ingestion run {self.pk} ({self.status}, {self.wall_seconds:.1f}s)"
@@ -1,3 +1,871 @@
-from django.test import TestCase
+import contextlib
+import io
+import itertools
+import json
+import os
+import tempfile
+import tracemalloc
+from datetime import date
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.db import connection
+from django.contrib.postgres.aggregates import StringAgg
+from django.db.models import Avg, Case, Count, F, FloatField, OuterRef, Q, Subquery, Value, When, Window
+from django.db.models.functions import Coalesce, DenseRank
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from excelhandler.models import (
+    Institution, Batch, Student, Test, Question, StudentResponse, StudentAnswerSheet,
+    StudentTestPerformance, StudentSubjectPerformance, ResponseCube, IngestionJob,
+    StagedTest, StagedStudent, StagedAnswerSheet, StagedQuestion,
+)
+from excelhandler.views import pipeline, staging
+from excelhandler.views.dashboard_engine import _DashboardMetrics
+from excelhandler.views.filters import (
+    _apply_filters_to_response_queryset, _apply_filters_to_performance_queryset, _apply_filters_to_test_queryset,
+)
+from excelhandler.views.jobs import _claim_next_job, _run_job
+from excelhandler.views.pipeline import _FilePair
+from excelhandler.views.response_cube import _refresh_response_cube, _response_cube_totals
+from excelhandler.views.response_store import _response_queryset
+from excelhandler.views.scoring import _scoring_policy_for
+from excelhandler.views.scoring_engine import _ResponseMatrix, _answer_key_arrays, _rescore, _subject_totals
+from excelhandler.views.staged_scoring import _dense_ranks
+from excelhandler.views.row_readers import _open_mapped
+from excelhandler.views.validation import _validate_file_pairs
+
+# Tables whose size grows with students x tests (x questions): a dashboard query must reach
+# them through an index condition, never by reading them whole.
+FACT_TABLES = {
+    model._meta.db_table
+    for model in (StudentResponse, StudentAnswerSheet, StudentTestPerformance, StudentSubjectPerformance)
+}
+
+# Filtered dashboard requests whose queries are checked, as (endpoint, query string).
+FILTERED_REQUESTS = [
+    (endpoint, filters)
+    for endpoint in ('cards', 'neet-readiness', 'trend-graph', 'risk', 'overall-performance')
+    for filters in (
+        {'institution': 'Institution 1'},
+        {'institution': 'Institution 1', 'batch': 'Batch 1'},
+        {'test_type': 'GRAND TEST'},
+        {'from': '2025-06-01', 'to': '2025-06-07'},
+        {'section': 'S1'},
+        {'student_class': 'XI'},
+        {'subject': 'Physics', 'test_type': 'GRAND TEST'},
+    )
+] + [
+    ('qndm', {'test_code': 'T03'}),
+    ('qndm', {'test_code': 'T03', 'subject_tag': 'Physics'}),
+    ('qnd', {'test_code': 'T03', 'question_number': 2}),
+]
+
+
+def _whole_table_scans(plan):
+    """Yields the fact tables a plan reads whole: sequential scans and index scans without an index condition."""
+    if plan.get('Relation Name') in FACT_TABLES:
+        if plan['Node Type'] == 'Seq Scan' or (plan['Node Type'] in ('Index Scan', 'Index Only Scan') and 'Index Cond' not in plan):
+            yield f"{plan['Node Type']} on {plan['Relation Name']}"
+    for child in plan.get('Plans', []):
+        yield from _whole_table_scans(child)
+
+
+@override_settings(ALLOWED_HOSTS=['*'])
+class DashboardQueryPlanTests(TestCase):
+    """
+    Runs EXPLAIN on every query of the filtered dashboard endpoints and fails when a fact
+    table is read whole. Sequential scans, hash joins and merge joins are disabled while
+    planning, so on this small data set the planner still picks an index path whenever
+    one exists, and only a missing index shows up as a whole-table scan.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        institutions = [Institution.objects.create(name=f'Institution {i}') for i in (1, 2)]
+        batches = [Batch.objects.create(name=f'Batch {i}', institution=institution) for i, institution in enumerate(institutions * 2, start=1)]
+        students = Student.objects.bulk_create([
+            Student(sturecid=sturecid, name=f'Student {sturecid}', student_class=('XI', 'XII')[sturecid % 2], section=f'S{sturecid % 4}')
+            for sturecid in range(1, 41)
+        ])
+        tests = Test.objects.bulk_create([
+            Test(
+                test_code=f'T{number:02}', test_type=('GRAND TEST', 'WEEKLY TEST')[number % 2], test_date=date(2025, 6, number),
+                institution=batches[number % 4].institution, batch=batches[number % 4],
+            )
+            for number in range(1, 21)
+        ])
+        subjects = ('Physics', 'Chemistry', 'Botany', 'Zoology')
+        Question.objects.bulk_create([
+            Question(test_code=test, question_number=number, correct_option=number % 4 + 1, subject_tag=subjects[number % 4])
+            for test in tests for number in range(1, 9)
+        ])
+        StudentResponse.objects.bulk_create([
+            StudentResponse(
+                sturecid=student, test_code=test, question_number=number, selected_option=(student.sturecid + number) % 5,
+                is_correct=(student.sturecid + number) % 5 == number % 4 + 1, score_awarded=0.0,
+            )
+            for test in tests for student in students for number in range(1, 9)
+        ])
+        StudentAnswerSheet.objects.bulk_create([
+            StudentAnswerSheet(
+                sturecid=student, test_code=test, selected_options=[(student.sturecid + number) % 5 for number in range(1, 9)],
+                is_correct=[(student.sturecid + number) % 5 == number % 4 + 1 for number in range(1, 9)], score_awarded=[0.0] * 8,
+            )
+            for test in tests for student in students
+        ])
+        StudentTestPerformance.objects.bulk_create([
+            StudentTestPerformance(student=student, test=test, total_score=float(student.sturecid % 13), rank=1)
+            for test in tests for student in students
+        ])
+        StudentSubjectPerformance.objects.bulk_create([
+            StudentSubjectPerformance(student=student, test=test, subject_tag=subject, subject_score=1.0, subject_rank=1)
+            for test in tests for student in students for subject in subjects
+        ])
+        with connection.cursor() as cursor:
+            for table in FACT_TABLES:
+                cursor.execute(f'ANALYZE {table}')
+
+    def _assert_no_fact_table_scans(self):
+        failures = []
+        for endpoint, filters in FILTERED_REQUESTS:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(f'/api/{endpoint}', filters)
+            self.assertEqual(response.status_code, 200, f'{endpoint} {filters}: {response.content[:200]}')
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('SET LOCAL enable_hashjoin = off')
+                cursor.execute('SET LOCAL enable_mergejoin = off')
+                for query in queries.captured_queries:
+                    # Unfiltered reads (e.g. a filter the query ignores) necessarily cover the whole table.
+                    if not query['sql'].lstrip().upper().startswith('SELECT') or ' WHERE ' not in query['sql']:
+                        continue
+                    cursor.execute(f"EXPLAIN (FORMAT JSON) {query['sql']}")
+                    plan = cursor.fetchone()[0]
+                    plan = json.loads(plan) if isinstance(plan, str) else plan
+                    scans = list(_whole_table_scans(plan[0]['Plan']))
+                    if scans:
+                        failures.append(f"{endpoint} {filters} reads a fact table whole ({', '.join(scans)}):\n{query['sql']}")
+        self.assertFalse(failures, '\n\n'.join(failures))
+
+    def test_dashboard_queries_use_indexes_with_response_rows(self):
+        with self.settings(RESPONSE_STORAGE='rows'):
+            self._assert_no_fact_table_scans()
+
+    def test_dashboard_queries_use_indexes_with_answer_sheets(self):
+        with self.settings(RESPONSE_STORAGE='sheets'):
+            self._assert_no_fact_table_scans()
+
+
+class ValidationMemoryTests(TestCase):
+    """
+    Validates a synthetic 20,000-row SR file (180 answer columns, about 8 MB) under
+    tracemalloc. Rows are checked as they are streamed and never held; what still grows
+    with the file is the duplicate check, one sturecid entry per (student, test) row
+    (around a hundred bytes each), so the peak stays far below the size of the file.
+    """
+
+    SR_ROWS = 20000
+    PEAK_LIMIT_BYTES = 8 * 1024 * 1024
+
+    def _write_upload(self, directory):
+        answer_columns = [f'a{i}' for i in range(1, 181)]
+        with open(os.path.join(directory, 'SR.csv'), 'w') as sr_file:
+            sr_file.write(','.join(['Institution', 'Batch', 'sturecid', 'sname', 'class', 'sec', 'testid', 'exdate', 'subject'] + answer_columns) + '\n')
+            for row in range(self.SR_ROWS):
+                sr_file.write(','.join(
+                    ['Institution 1', 'Batch 1', str(100000 + row), 'Student', 'XI', 'S1', f'T{row % 4}', '01-06-2025', 'GRAND TEST - Physics']
+                    + [str((row + question) % 5) for question in range(180)]
+                ) + '\n')
+        with open(os.path.join(directory, 'AK.csv'), 'w') as ak_file:
+            ak_file.write('Question Number,Test Code,Subject,Correct Ans\n')
+            for test in range(4):
+                for question in range(1, 181):
+                    ak_file.write(f'{question},T{test},Physics,{question % 4 + 1}\n')
+
+    def test_peak_memory_stays_bounded(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self._write_upload(directory)
+            with _open_mapped(os.path.join(directory, 'SR.csv')) as sr_file, _open_mapped(os.path.join(directory, 'AK.csv')) as ak_file:
+                tracemalloc.start()
+                try:
+                    report = _validate_file_pairs([_FilePair('SR.csv', sr_file, 'AK.csv', ak_file)])
+                    peak = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+        self.assertTrue(report['valid'], report['errors'])
+        self.assertEqual(report['files'][0]['rows'], self.SR_ROWS)
+        self.assertLess(peak, self.PEAK_LIMIT_BYTES, f'validation peaked at {peak / 1e6:.1f} MB')
+
+
+def _create_dashboard_data():
+    """
+    Small dashboard data set with the awkward cases: students without a section, a batch
+    name shared by two institutions, unattempted answers, an untagged question, answers to
+    questions missing from the answer key (T02), a test without any questions (T06) and
+    total scores tied within and across tests, a few of them at or above 400. Responses
+    are stored both as StudentResponse rows and as StudentAnswerSheets.
+    """
+    institutions = [Institution.objects.create(name=name) for name in ('Institution A', 'Institution B')]
+    batches = [
+        Batch.objects.create(name=name, institution=institution)
+        for name, institution in (('Batch 1', institutions[0]), ('Batch 2', institutions[0]), ('Batch 1', institutions[1]))
+    ]
+    students = Student.objects.bulk_create([
+        Student(sturecid=sturecid, name=f'Student {sturecid}', student_class=('XI', 'XII')[sturecid % 2], section=('S1', 'S2', None)[sturecid % 3])
+        for sturecid in range(1, 25)
+    ])
+    tests = Test.objects.bulk_create([
+        Test(
+            test_code=f'T{number:02}', test_type=('GRAND TEST', 'WEEKLY TEST')[number % 2], test_date=date(2025, 6, number * 3),
+            institution=batches[number % 3].institution, batch=batches[number % 3],
+        )
+        for number in range(1, 7)
+    ])
+    subjects = ('Physics', 'Chemistry', 'Botany', 'Zoology')
+    # T02's answer key stops at question 6 and T06 has none; T01's question 8 is untagged.
+    question_counts = {'T02': 6, 'T06': 0}
+    answer_key = {
+        (test.test_code, number): (number % 4 + 1, None if (test.test_code, number) == ('T01', 8) else subjects[number % 4])
+        for test in tests for number in range(1, question_counts.get(test.test_code, 8) + 1)
+    }
+    Question.objects.bulk_create([
+        Question(test_code_id=test_code, question_number=number, correct_option=correct_option, subject_tag=subject_tag)
+        for (test_code, number), (correct_option, subject_tag) in answer_key.items()
+    ])
+
+    def selected(student, test_index, number):
+        return (student.sturecid * 3 + number + test_index) % 5
+
+    def is_correct(student, test_index, test, number):
+        key = answer_key.get((test.test_code, number))
+        return None if key is None else selected(student, test_index, number) == key[0]
+
+    StudentResponse.objects.bulk_create([
+        StudentResponse(
+            sturecid=student, test_code=test, question_number=number, selected_option=selected(student, test_index, number),
+            is_correct=bool(is_correct(student, test_index, test, number)), score_awarded=0.0,
+        )
+        for test_index, test in enumerate(tests) for student in students for number in range(1, 9)
+    ])
+    StudentAnswerSheet.objects.bulk_create([
+        StudentAnswerSheet(
+            sturecid=student, test_code=test, selected_options=[selected(student, test_index, number) for number in range(1, 9)],
+            is_correct=[is_correct(student, test_index, test, number) for number in range(1, 9)], score_awarded=[0.0] * 8,
+        )
+        for test_index, test in enumerate(tests) for student in students
+    ])
+    StudentTestPerformance.objects.bulk_create([
+        StudentTestPerformance(
+            student=student, test=test, rank=1,
+            total_score=412.0 if (test.test_code, student.sturecid) in (('T03', 1), ('T03', 2), ('T05', 3)) else float((student.sturecid * 7 + test_index * 3) % 13 * 3),
+        )
+        for test_index, test in enumerate(tests) for student in students
+    ])
+    return tests
+
+
+def _legacy_response_totals(request):
+    """The response aggregates the dashboard computed before the response cube, over every filtered response."""
+    responses = _apply_filters_to_response_queryset(_response_queryset(), request)
+    counts = responses.aggregate(
+        correct=Count(Case(When(is_correct=True, selected_option__gt=0, then=1), output_field=FloatField())),
+        attempted=Count(Case(When(selected_option__gt=0, then=1), output_field=FloatField())),
+        total=Count('id'),
+    )
+    return {'tests': responses.values('test_code').distinct().count(), **counts}
+
+
+class ResponseCubeTests(TestCase):
+    """
+    Checks that the response cube sums the same tests, attempted, correct and total
+    responses as the per-response aggregates it replaced, for every dashboard filter and
+    pair of filters, with and without a date range, in both response storages.
+    """
+
+    FILTER_VALUES = {
+        'institution': ('Institution A', 'Institution B'),
+        'batch': ('Batch 1', 'Batch 2'),
+        'student_class': ('XI',),
+        'section': ('S1', 'S2'),
+        'test_type': ('GRAND TEST', 'WEEKLY TEST'),
+        'subject': ('Physics', 'Botany'),
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_codes = [test.test_code for test in _create_dashboard_data()]
+
+    def _assert_cube_matches_responses(self):
+        _refresh_response_cube(self.test_codes)
+        factory = RequestFactory()
+        for keys in itertools.chain([()], itertools.combinations(self.FILTER_VALUES, 1), itertools.combinations(self.FILTER_VALUES, 2)):
+            for values in itertools.product(*(self.FILTER_VALUES[key] for key in keys)):
+                filters = dict(zip(keys, values))
+                for date_range in ({}, {'from': '2025-06-05', 'to': '2025-06-15'}):
+                    request = factory.get('/api/cards', {**filters, **date_range})
+                    with self.subTest(**filters, **date_range):
+                        self.assertEqual(_response_cube_totals(request), _legacy_response_totals(request))
+        self.assertEqual(_response_cube_totals(factory.get('/api/cards'))['tests'], len(self.test_codes))
+
+    def test_cube_matches_response_rows(self):
+        with self.settings(RESPONSE_STORAGE='rows'):
+            self._assert_cube_matches_responses()
+
+    def test_cube_matches_answer_sheets(self):
+        with self.settings(RESPONSE_STORAGE='sheets'):
+            self._assert_cube_matches_responses()
+
+
+def _legacy_dashboard(request):
+    """
+    The dashboard sections as the separate views computed them before _DashboardMetrics,
+    query for query, with the top 10 tie order introduced with the engine (dense rank,
+    score, then sturecid and test code).
+    """
+    performances = _apply_filters_to_performance_queryset(StudentTestPerformance.objects.all(), request)
+    tests = _apply_filters_to_test_queryset(Test.objects.all(), request)
+    max_score = Question.objects.filter(test_code=tests.first()).count() * 4 if tests.exists() else 0
+
+    totals = _legacy_response_totals(request)
+    average_score = performances.aggregate(score=Coalesce(Avg('total_score'), 0.0, output_field=FloatField()))['score']
+    records = performances.count()
+    top_10_average = bottom_10_average = 0.0
+    if records > 0:
+        tail = max(1, int(records * 0.10))
+        top_10_average = performances.order_by('-total_score')[:tail].aggregate(score=Coalesce(Avg('total_score'), 0.0, output_field=FloatField()))['score']
+        bottom_10_average = performances.order_by('total_score')[:tail].aggregate(score=Coalesce(Avg('total_score'), 0.0, output_field=FloatField()))['score']
+    display_max = int(max_score or 1)
+    metrics = {
+        'total_tests_conducted': totals['tests'],
+        'average_accuracy_percent': round(totals['correct'] / totals['attempted'] * 100 if totals['attempted'] else 0.0, 1),
+        'average_total_score': f"{round(average_score, 1)} / {display_max}",
+        'average_attempt_rate_percent': round(totals['attempted'] / totals['total'] * 100 if totals['total'] else 0.0, 1),
+        'top_10_avg_score': f"{round(top_10_average, 1)} / {display_max}",
+        'bottom_10_avg_score': f"{round(bottom_10_average, 1)} / {display_max}",
+    }
+
+    neet = performances.aggregate(records=Count('id'), ready=Count(Case(When(total_score__gte=400, then=1), output_field=FloatField())))
+    neet_readiness = {'percentage_students_above_400': round(neet['ready'] / neet['records'] * 100 if neet['records'] else 0.0, 1)}
+
+    question_count = Subquery(
+        Question.objects.filter(test_code=OuterRef('test_id')).values('test_code').annotate(count=Count('id')).values('count')[:1],
+        output_field=FloatField(),
+    )
+    student_averages = performances.annotate(
+        max_possible_score=Coalesce(question_count, 0.0) * 4.0,
+    ).annotate(
+        percentage_score=Case(
+            When(max_possible_score__gt=0, then=F('total_score') * 100.0 / F('max_possible_score')),
+            default=Value(0.0, output_field=FloatField()), output_field=FloatField(),
+        ),
+    ).values('student').annotate(avg_percentage_score=Avg('percentage_score'))
+    risk = student_averages.aggregate(
+        students=Count('student'),
+        safe=Count(Case(When(avg_percentage_score__gt=70, then=1), output_field=FloatField())),
+        medium_risk=Count(Case(When(Q(avg_percentage_score__gte=40) & Q(avg_percentage_score__lt=70), then=1), output_field=FloatField())),
+        at_risk=Count(Case(When(avg_percentage_score__lt=40, then=1), output_field=FloatField())),
+    )
+    risk_breakdown = {
+        key: {'count': risk[key], 'percentage': round(risk[key] / risk['students'] * 100 if risk['students'] else 0.0, 1)}
+        for key in ('safe', 'medium_risk', 'at_risk')
+    }
+    risk_breakdown['total_students_considered'] = risk['students']
+
+    trend_graph = [
+        {
+            'test_code': entry['test__test_code'],
+            'test_date': entry['test__test_date'],
+            'test_type': entry['test__test_type'],
+            'institution': entry['test__institution__name'],
+            'batch': entry['test__batch__name'],
+            'average_score': round(entry['average_score'], 1) if entry['average_score'] is not None else 0.0,
+            'subjects': entry['subjects_covered'] or "N/A",
+        }
+        for entry in performances.values(
+            'test__test_code', 'test__test_date', 'test__test_type', 'test__institution__name', 'test__batch__name',
+        ).annotate(
+            average_score=Avg('total_score'),
+            subjects_covered=StringAgg('test__question__subject_tag', delimiter=', ', distinct=True),
+        ).order_by('test__test_date', 'test__test_code')
+    ]
+
+    overall_performance = []
+    if max_score or performances.exists():
+        top_performances = performances.select_related('student', 'test').annotate(
+            dynamic_rank=Window(expression=DenseRank(), order_by=F('total_score').desc()),
+        ).order_by('dynamic_rank', '-total_score', 'student__sturecid', 'test__test_code')[:10]
+        overall_performance = [
+            {
+                'rank': performance.dynamic_rank,
+                'name': performance.student.name,
+                'section': performance.student.section,
+                'overall_score': f"{performance.total_score} / {max_score or 1}",
+                'sturecid': performance.student.sturecid,
+                'test_code': performance.test.test_code,
+            }
+            for performance in top_performances
+        ]
+
+    return {
+        'metrics': metrics,
+        'neet_readiness': neet_readiness,
+        'risk_breakdown': risk_breakdown,
+        'trend_graph': trend_graph,
+        'overall_performance': overall_performance,
+    }
+
+
+@override_settings(ALLOWED_HOSTS=['*'])
+class DashboardMetricsTests(TestCase):
+    """
+    Checks that _DashboardMetrics gives the output of the separate dashboard views it
+    replaced, and pins the order of tied performances in the top 10.
+    """
+
+    FILTERS = [
+        {},
+        {'institution': 'Institution A'},
+        {'institution': 'Institution A', 'batch': 'Batch 1'},
+        {'batch': 'Batch 1'},
+        {'student_class': 'XII'},
+        {'section': 'S1'},
+        {'section': 'S2', 'student_class': 'XI'},
+        {'test_type': 'GRAND TEST'},
+        {'subject': 'Physics'},
+        {'subject': 'Botany', 'test_type': 'WEEKLY TEST'},
+        {'subject': 'Zoology', 'section': 'S2'},
+        {'subject': 'Physics', 'institution': 'Institution B'},
+        {'from': '2025-06-05', 'to': '2025-06-15'},
+        {'from': '2025-06-05', 'to': '2025-06-15', 'subject': 'Chemistry'},
+        {'from': '2025-06-17', 'to': '2025-06-18'},
+        {'institution': 'Institution C'},
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        _refresh_response_cube([test.test_code for test in _create_dashboard_data()])
+
+    def test_sections_match_the_previous_views(self):
+        factory = RequestFactory()
+        for filters in self.FILTERS:
+            request = factory.get('/api/dashboard-all-metrics', filters)
+            with self.subTest(**filters):
+                self.assertEqual(_DashboardMetrics(request).all_sections(), _legacy_dashboard(request))
+
+    def test_tied_performances_are_listed_by_sturecid_then_test_code(self):
+        for filters in ({}, {'section': 'S1'}, {'subject': 'Physics'}):
+            performances = _apply_filters_to_performance_queryset(StudentTestPerformance.objects.all(), RequestFactory().get('/', filters))
+            records = sorted(set(performances.values_list('total_score', 'student_id', 'test_id')), key=lambda record: (-record[0], record[1], record[2]))
+            scores = sorted({score for score, _, _ in records}, reverse=True)
+            expected = [[scores.index(score) + 1, sturecid, test_code] for score, sturecid, test_code in records[:10]]
+            # The cut-off at 10 falls inside a group of tied scores, so the tie order decides which records are listed.
+            self.assertEqual(records[9][0], records[10][0])
+            response = self.client.get('/api/overall-performance', filters)
+            with self.subTest(**filters):
+                self.assertEqual([[entry['rank'], entry['sturecid'], entry['test_code']] for entry in response.json()], expected)
+
+
+def _legacy_dense_ranks(scores):
+    """DENSE_RANK() OVER (ORDER BY score DESC), one score at a time."""
+    distinct_scores = sorted(set(scores), reverse=True)
+    return [distinct_scores.index(score) + 1 for score in scores]
+
+
+@override_settings(SCORING_POLICIES={'WEEKLY TEST': {'correct': 3, 'incorrect': -0.5, 'unattempted': 0.25}})
+class ScoringEngineTests(SimpleTestCase):
+    """
+    Checks the vectorized scoring against the per-response scoring it replaced: each
+    response with an answer-key entry is marked correct when its option matches the key
+    and scored by the policy of its test type (unattempted when the option is 0);
+    responses without an entry keep their correctness and score. Totals, subject totals
+    and their dense ranks follow.
+    """
+
+    STUDENTS = 40
+    QUESTIONS = 12
+
+    def setUp(self):
+        generator = np.random.default_rng(7)
+        shape = (self.STUDENTS, self.QUESTIONS)
+        self.sturecids = np.arange(1001, 1001 + self.STUDENTS, dtype=np.int64)
+        # Mostly 0 (unattempted) and 1-2, so that totals tie.
+        self.selected = generator.choice([0, 0, 1, 1, 2, 3, 4], size=shape).astype(np.int16)
+        self.present = generator.random(shape) > 0.05
+        self.selected[~self.present] = 0
+        self.stored_correct = generator.random(shape) > 0.5
+        self.stored_scores = generator.choice([0.0, 4.0, -1.0], size=shape)
+        # Question 5 has no key entry, question 7's key is 0 (no valid option) and
+        # question 14 lies beyond every answer sheet.
+        self.answer_key = [
+            (number, 0 if number == 7 else number % 2 + 1, ('Physics', 'Chemistry', None)[number % 3])
+            for number in (*range(1, 5), *range(6, 13), 14)
+        ]
+
+    def _matrix(self):
+        return _ResponseMatrix(
+            self.sturecids.copy(), self.selected.copy(), self.present.copy(), self.stored_correct.copy(), self.stored_scores.copy(),
+        )
+
+    def _legacy_scores(self, test_type):
+        """{(row, question_number): (is_correct, score)} for every stored response, scored one at a time."""
+        policy = _scoring_policy_for(test_type)
+        correct_options = {number: correct_option for number, correct_option, _ in self.answer_key}
+        scored = {}
+        for row in range(self.STUDENTS):
+            for column in range(self.QUESTIONS):
+                if not self.present[row, column]:
+                    continue
+                selected, number = int(self.selected[row, column]), column + 1
+                if number not in correct_options:
+                    scored[row, number] = (bool(self.stored_correct[row, column]), float(self.stored_scores[row, column]))
+                    continue
+                is_correct = selected == correct_options[number]
+                if selected == 0:
+                    score = policy.unattempted
+                elif is_correct:
+                    score = policy.correct
+                else:
+                    score = policy.incorrect
+                scored[row, number] = (is_correct, score)
+        return scored
+
+    def _assert_matches_legacy_scoring(self, test_type):
+        legacy = self._legacy_scores(test_type)
+        matrix = self._matrix()
+        changed, has_key, subject_tags, totals = _rescore(matrix, test_type, *_answer_key_arrays(self.answer_key))
+
+        for (row, number), (is_correct, score) in legacy.items():
+            self.assertEqual((bool(matrix.is_correct[row, number - 1]), float(matrix.score_awarded[row, number - 1])), (is_correct, score))
+            was = (bool(self.stored_correct[row, number - 1]), float(self.stored_scores[row, number - 1]))
+            self.assertEqual(bool(changed[row, number - 1]), was != (is_correct, score))
+        self.assertFalse(changed[:, :self.QUESTIONS][~self.present].any())
+
+        legacy_totals = [sum(score for (row, _), (_, score) in legacy.items() if row == student) for student in range(self.STUDENTS)]
+        self.assertEqual(totals.tolist(), legacy_totals)
+        self.assertLess(len(set(legacy_totals)), len(legacy_totals), 'the data set should have tied totals')
+        self.assertEqual(_dense_ranks(totals).tolist(), _legacy_dense_ranks(legacy_totals))
+
+        tags = {number: tag for number, _, tag in self.answer_key}
+        subjects = {}
+        for (row, number), (_, score) in sorted(legacy.items()):
+            if tags.get(number):
+                student_scores = subjects.setdefault(tags[number], {})
+                student_scores[self.sturecids[row]] = student_scores.get(self.sturecids[row], 0.0) + score
+        subject_totals = list(_subject_totals(matrix, subject_tags))
+        self.assertEqual({tag: dict(zip(sturecids.tolist(), subject_scores.tolist())) for tag, sturecids, subject_scores in subject_totals}, subjects)
+        for _, _, subject_scores in subject_totals:
+            self.assertEqual(_dense_ranks(subject_scores).tolist(), _legacy_dense_ranks(subject_scores.tolist()))
+
+    def test_default_policy_matches_per_response_scoring(self):
+        self._assert_matches_legacy_scoring('GRAND TEST')
+
+    def test_configured_policy_matches_per_response_scoring(self):
+        self._assert_matches_legacy_scoring('WEEKLY TEST')
+
+    def test_dense_ranks_of_tied_scores(self):
+        scores = np.array([12.0, -1.0, 12.0, 0.0, 7.5, -1.0, 12.0, 7.5])
+        self.assertEqual(_dense_ranks(scores).tolist(), [1, 4, 1, 3, 2, 4, 1, 2])
+        self.assertEqual(_dense_ranks(np.array([], dtype=np.float64)).tolist(), [])
+
+
+@override_settings(ALLOWED_HOSTS=['*'])
+class _IngestionTestCase(TestCase):
+    """
+    Base class for tests that load SR/AK uploads through the API. Uploaded files are
+    kept in a temporary MEDIA_ROOT; the console output and run log of ingestion are
+    captured.
+    Job progress goes through the 'jobs' connection, a mirror of 'default' under test.
+    """
+
+    databases = {'default', 'jobs'}
+    TESTS = ('T01', 'T02', 'T03')
+    STUDENTS = range(1001, 1013)
+    QUESTIONS = 20
+    SUBJECTS = ('Physics', 'Chemistry', 'Botany', 'Zoology')
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        media_root = self.settings(MEDIA_ROOT=os.path.join(self.directory, 'media'))
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+
+    @staticmethod
+    def _selected_option(sturecid, test_code, number):
+        return (sturecid + 2 * number + int(test_code[1:])) % 5
+
+    @staticmethod
+    def _correct_option(test_code, number):
+        return number % 4 + 1
+
+    def _write_upload(self, name, tests=None, students=None, selected_option=None, correct_option=None):
+        """Writes <name>_SR.csv and <name>_AK.csv for `tests` and `students` and returns their paths."""
+        tests = tests or self.TESTS
+        students = students or self.STUDENTS
+        selected_option = selected_option or self._selected_option
+        correct_option = correct_option or self._correct_option
+        sr_path, ak_path = os.path.join(self.directory, f'{name}_SR.csv'), os.path.join(self.directory, f'{name}_AK.csv')
+        with open(sr_path, 'w') as sr_file:
+            sr_file.write(','.join(['Institution', 'Batch', 'sturecid', 'sname', 'class', 'sec', 'testid', 'exdate', 'subject'] + [f'a{i}' for i in range(1, self.QUESTIONS + 1)]) + '\n')
+            for test_code in tests:
+                number = int(test_code[1:])
+                for sturecid in students:
+                    sr_file.write(','.join(
+                        [f'Institution {number % 2 + 1}', 'Batch 1', str(sturecid), f'Student {sturecid}', ('XI', 'XII')[sturecid % 2],
+                         ('S1', 'S2', '')[sturecid % 3], test_code, f'{number:02}-06-2025', 'GRAND TEST - Physics']
+                        + [str(selected_option(sturecid, test_code, number)) for number in range(1, self.QUESTIONS + 1)]
+                    ) + '\n')
+        with open(ak_path, 'w') as ak_file:
+            ak_file.write('Question Number,Test Code,Subject,Correct Ans\n')
+            for test_code in tests:
+                for number in range(1, self.QUESTIONS + 1):
+                    ak_file.write(f'{number},{test_code},{self.SUBJECTS[number % 4]},{correct_option(test_code, number)}\n')
+        return sr_path, ak_path
+
+    def _post_upload(self, url, sr_path, ak_path):
+        with open(sr_path, 'rb') as sr_file, open(ak_path, 'rb') as ak_file, contextlib.redirect_stdout(io.StringIO()):
+            with self.assertLogs('excelhandler.ingestion'):
+                response = self.client.post(url, {'sr_file': sr_file, 'ak_file': ak_file})
+        return response
+
+    def _load(self, sr_path, ak_path):
+        response = self._post_upload('/api/load-all-data/', sr_path, ak_path)
+        self.assertEqual(response.status_code, 200, response.content[:500])
+        return response.json()
+
+    def _live_rows(self, test_codes=None, ids=True):
+        """
+        The stored rows of `test_codes` (every test by default) per table, with their
+        database ids unless `ids` is False, so a comparison also shows rows rewritten
+        with the same values.
+        """
+        test_codes = sorted(test_codes or Test.objects.values_list('test_code', flat=True))
+        id_field = ('pk',) if ids else ()
+
+        def rows(queryset, *fields):
+            return sorted(queryset.values_list(*id_field, *fields), key=repr)
+
+        return {
+            'tests': rows(Test.objects.filter(test_code__in=test_codes), 'test_code', 'test_type', 'test_date', 'institution__name', 'batch__name'),
+            'questions': rows(Question.objects.filter(test_code__in=test_codes), 'test_code', 'question_number', 'correct_option', 'subject_tag'),
+            'responses': rows(
+                _response_queryset().filter(test_code__in=test_codes),
+                'sturecid', 'test_code', 'question_number', 'selected_option', 'is_correct', 'score_awarded',
+            ),
+            'performances': rows(StudentTestPerformance.objects.filter(test__in=test_codes), 'student', 'test', 'total_score', 'rank'),
+            'subject_performances': rows(
+                StudentSubjectPerformance.objects.filter(test__in=test_codes), 'student', 'test', 'subject_tag', 'subject_score', 'subject_rank',
+            ),
+            'response_cube': rows(
+                ResponseCube.objects.filter(test__in=test_codes), 'test', 'student_class', 'section', 'subject_tag', 'attempted', 'correct', 'incorrect', 'total',
+            ),
+        }
+
+    def _dimensions(self):
+        return (
+            sorted(Institution.objects.values_list('name', flat=True)),
+            sorted(Batch.objects.values_list('name', 'institution__name')),
+            sorted(Student.objects.values_list('sturecid', 'name', 'student_class', 'section')),
+        )
+
+    def _load_and_clear(self, sr_path, ak_path):
+        """The rows (without ids) and dimensions the upload loads into an empty database, which is then emptied again."""
+        self._load(sr_path, ak_path)
+        expected = self._live_rows(ids=False), self._dimensions()
+        Test.objects.all().delete()
+        for model in (Student, Institution, IngestionJob):
+            model.objects.all().delete()
+        return expected
+
+
+class IncrementalIngestionTests(_IngestionTestCase):
+    """Re-uploads skip tests whose rows and answer key are unchanged (content fingerprints)."""
+
+    def test_identical_upload_leaves_every_row_unchanged(self):
+        sr_path, ak_path = self._write_upload('first')
+        first = self._load(sr_path, ak_path)
+        self.assertEqual(first['tests_reloaded'], len(self.TESTS))
+        before = self._live_rows()
+        self.assertEqual(len(before['responses']), len(self.TESTS) * len(self.STUDENTS) * 180)
+
+        second = self._load(sr_path, ak_path)
+
+        self.assertEqual((second['tests_skipped'], second['tests_reloaded'], second['tests_recomputed']), (len(self.TESTS), 0, 0))
+        self.assertEqual(second['student_responses_written'], 0)
+        self.assertEqual(self._live_rows(), before)
+
+    def test_changed_answer_key_rescores_only_its_test(self):
+        sr_path, ak_path = self._write_upload('first')
+        self._load(sr_path, ak_path)
+        before = self._live_rows()
+
+        # Question 3 of T02 gets another correct option; SR.csv is unchanged.
+        def correct_option(test_code, number):
+            return 1 if (test_code, number) == ('T02', 3) else self._correct_option(test_code, number)
+
+        sr_path, ak_path = self._write_upload('second', correct_option=correct_option)
+        result = self._load(sr_path, ak_path)
+
+        self.assertEqual((result['tests_touched'], result['tests_recomputed'], result['tests_skipped']), (['T02'], 1, 2))
+        self.assertEqual(result['student_responses_written'], 0)
+        self.assertEqual(self._live_rows(['T01', 'T03']), {
+            table: [row for row in table_rows if 'T02' not in row] for table, table_rows in before.items()
+        })
+        responses = _response_queryset().filter(test_code='T02')
+        for sturecid, number, selected_option, is_correct, score_awarded in responses.values_list(
+            'sturecid', 'question_number', 'selected_option', 'is_correct', 'score_awarded',
+        ):
+            expected_correct = selected_option == correct_option('T02', number) if number <= self.QUESTIONS else False
+            self.assertEqual(is_correct, expected_correct)
+            self.assertEqual(score_awarded, 0.0 if selected_option == 0 else (4.0 if is_correct else -1.0))
+        totals = dict(StudentTestPerformance.objects.filter(test='T02').values_list('student', 'total_score'))
+        self.assertEqual(totals, {
+            sturecid: sum(responses.filter(sturecid=sturecid).values_list('score_awarded', flat=True)) for sturecid in self.STUDENTS
+        })
+        self.assertNotEqual(totals, {student: score for student, test, score, _ in (row[1:] for row in before['performances']) if test == 'T02'})
+
+
+def _failing_on_call(function, call_number):
+    """Wraps `function` so that its `call_number`-th call raises instead of running."""
+    calls = itertools.count(1)
+
+    def wrapper(*args, **kwargs):
+        if next(calls) == call_number:
+            raise RuntimeError('injected failure')
+        return function(*args, **kwargs)
+
+    return wrapper
+
+
+class ResumableIngestionTests(_IngestionTestCase):
+    """
+    Interrupts an upload while its SR rows are being staged and while its tests are being
+    published, resumes the job from its checkpoint, and compares the stored rows with
+    those of the same upload loaded in one go.
+    """
+
+    def _resume(self, job_id):
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = self.client.post(f'/api/ingestion-jobs/{job_id}/resume/')
+            self.assertEqual(response.status_code, 202, response.content[:500])
+            with self.assertLogs('excelhandler.ingestion'):
+                job = _run_job(_claim_next_job())
+        self.assertEqual(job.status, IngestionJob.STATUS_SUCCEEDED, job.error)
+        self.assertTrue(job.result['resumed'])
+        return job
+
+    def _assert_loaded_once(self, expected, job):
+        self.assertEqual((self._live_rows(ids=False), self._dimensions()), expected)
+        self.assertEqual(job.result['student_responses_written'], len(expected[0]['responses']))
+        for model in (StagedTest, StagedStudent, StagedAnswerSheet, StagedQuestion):
+            self.assertFalse(model.objects.exists(), f'{model.__name__} rows were left staged')
+
+    def test_resume_after_failure_while_staging(self):
+        sr_path, ak_path = self._write_upload('upload')
+        expected = self._load_and_clear(sr_path, ak_path)
+
+        # SR rows are staged 10 at a time; the third batch fails after rows 1-20 are committed.
+        with mock.patch.object(pipeline, 'FACT_BATCH_SIZE', 10), \
+                mock.patch.object(pipeline, '_stage_response_rows', _failing_on_call(pipeline._stage_response_rows, 3)):
+            response = self._post_upload('/api/load-all-data/', sr_path, ak_path)
+        self.assertEqual(response.status_code, 500)
+        job = IngestionJob.objects.get(pk=response.json()['job_id'])
+        self.assertEqual((job.status, job.checkpoint['sr_rows_staged']), (IngestionJob.STATUS_FAILED, 20))
+        self.assertEqual(StagedAnswerSheet.objects.filter(job=job).count(), 20)
+        self.assertFalse(Test.objects.exists())
+
+        with mock.patch.object(pipeline, 'FACT_BATCH_SIZE', 10):
+            job = self._resume(job.pk)
+        self._assert_loaded_once(expected, job)
+
+    def test_resume_after_failure_while_publishing(self):
+        sr_path, ak_path = self._write_upload('upload')
+        expected = self._load_and_clear(sr_path, ak_path)
+
+        # The first test is published, then scoring the second one fails.
+        with mock.patch.object(staging, '_score_staged_test', _failing_on_call(staging._score_staged_test, 2)):
+            response = self._post_upload('/api/load-all-data/', sr_path, ak_path)
+        self.assertEqual(response.status_code, 500)
+        job = IngestionJob.objects.get(pk=response.json()['job_id'])
+        published = job.checkpoint['tests_published']
+        self.assertEqual((job.status, len(published)), (IngestionJob.STATUS_FAILED, 1))
+        # The published test is complete; the others are not visible at all.
+        self.assertEqual(list(Test.objects.values_list('test_code', flat=True)), published)
+        self.assertEqual(self._live_rows(published, ids=False), {
+            table: [row for row in table_rows if published[0] in row] for table, table_rows in expected[0].items()
+        })
+
+        job = self._resume(job.pk)
+        self._assert_loaded_once(expected, job)
+
+
+class TestDeletionTests(_IngestionTestCase):
+    """
+    Deleting or replacing one test removes or rewrites everything stored for it, and
+    leaves the facts, cube cells, totals and ranks of the other tests as they were.
+    """
+
+    def _assert_other_tests_untouched(self, before, test_code):
+        others = [other for other in self.TESTS if other != test_code]
+        self.assertEqual(self._live_rows(others), {
+            table: [row for row in table_rows if test_code not in row] for table, table_rows in before.items()
+        })
+
+    def _assert_delete(self):
+        self._load(*self._write_upload('upload'))
+        before = self._live_rows()
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = self.client.delete('/api/tests/T02/')
+        self.assertEqual(response.status_code, 200, response.content[:500])
+
+        self.assertEqual(self._live_rows(['T02']), {table: [] for table in before})
+        self.assertFalse(Test.objects.filter(test_code='T02').exists())
+        self.assertFalse(StudentResponse.objects.filter(test_code='T02').exists())
+        self.assertFalse(StudentAnswerSheet.objects.filter(test_code='T02').exists())
+        self._assert_other_tests_untouched(before, 'T02')
+        self.assertEqual(self.client.delete('/api/tests/T02/').status_code, 404)
+
+    def _assert_replace(self):
+        # T02 is reloaded with other answers and answer key, and without its last student.
+        def selected_option(sturecid, test_code, number):
+            return (sturecid * number + 3) % 5
+
+        def correct_option(test_code, number):
+            return 4 - number % 4
+
+        students = self.STUDENTS[:-1]
+        expected, _ = self._load_and_clear(*self._write_upload(
+            'expected', tests=['T02'], students=students, selected_option=selected_option, correct_option=correct_option,
+        ))
+        self._load(*self._write_upload('upload'))
+        before = self._live_rows()
+
+        # The replacement files change every test; only T02 is read from them.
+        sr_path, ak_path = self._write_upload('replacement', students=students, selected_option=selected_option, correct_option=correct_option)
+        response = self._post_upload('/api/tests/T02/replace/', sr_path, ak_path)
+        self.assertEqual(response.status_code, 200, response.content[:500])
+        self.assertEqual(response.json()['replaced_test_code'], 'T02')
+
+        self.assertEqual(self._live_rows(['T02'], ids=False), expected)
+        self.assertFalse(StudentTestPerformance.objects.filter(test='T02', student=self.STUDENTS[-1]).exists())
+        self._assert_other_tests_untouched(before, 'T02')
+
+    def test_delete_with_response_rows(self):
+        with self.settings(RESPONSE_STORAGE='rows'):
+            self._assert_delete()
+
+    def test_delete_with_answer_sheets(self):
+        with self.settings(RESPONSE_STORAGE='sheets'):
+            self._assert_delete()
+
+    def test_replace_with_response_rows(self):
+        with self.settings(RESPONSE_STORAGE='rows'):
+            self._assert_replace()
+
+    def test_replace_with_answer_sheets(self):
+        with self.settings(RESPONSE_STORAGE='sheets'):
+            self._assert_replace()
@@ -1,10 +1,22 @@
 from django.urls import path
-from .views import upload_and_process_data,get_overall_performance,get_dashboard_metrics,get_neet_readiness,get_trend_graph,get_risk_breakdown,get_question_detail_analytics,get_question_analytics_matrix,get_dashboard_all_metrics
+from .views import upload_and_process_data,validate_upload,upload_answer_key,create_ingestion_job,get_ingestion_job,resume_ingestion_job,delete_test_data,replace_test_data,get_overall_performance,get_dashboard_metrics,get_neet_readiness,get_trend_graph,get_risk_breakdown,get_question_detail_analytics,get_question_analytics_matrix,get_dashboard_all_metrics
+from .views.uploads import create_upload, get_upload, put_upload_chunk, finalize_upload
 from .views.slicers import InstitutionListView, BatchListView, ClassListView, SectionListView, TestTypeListView, SubjectListView, DateRangeView
 
 
 urlpatterns = [
     path('load-all-data/',upload_and_process_data),
+    path('validate-upload/', validate_upload),
+    path('answer-key/', upload_answer_key),
+    path('ingestion-jobs/', create_ingestion_job),
+    path('ingestion-jobs/<int:job_id>/', get_ingestion_job),
+    path('ingestion-jobs/<int:job_id>/resume/', resume_ingestion_job),
+    path('tests/<str:test_code>/', delete_test_data),
+    path('tests/<str:test_code>/replace/', replace_test_data),
+    path('uploads/', create_upload),
+    path('uploads/<int:upload_id>/', get_upload),
+    path('uploads/<int:upload_id>/chunks/<int:number>/', put_upload_chunk),
+    path('uploads/<int:upload_id>/finalize/', finalize_upload),
     path('overall-performance', get_overall_performance),
     path('dashboard-all-metrics', get_dashboard_all_metrics),
     path('cards', get_dashboard_metrics),
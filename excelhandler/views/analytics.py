@@ -2,7 +2,8 @@ from django.http import JsonResponse
 from django.db.models import Count, Q, F, Value
 from django.db.models.functions import Coalesce
 from django.db.models.expressions import Subquery, OuterRef
-from excelhandler.models import StudentResponse, Question
+from excelhandler.models import Question
+from .response_store import _response_queryset
 from datetime import datetime
 
 def get_question_analytics_matrix(request):
@@ -17,7 +18,7 @@ def get_question_analytics_matrix(request):
         test_code_filter = request.GET.get('test_code')
         subject_tag_filter = request.GET.get('subject_tag')
 
-        queryset = StudentResponse.objects.select_related('test_code', 'sturecid')
+        queryset = _response_queryset().select_related('test_code', 'sturecid')
 
         if test_type and test_type.lower() != 'all':
             queryset = queryset.filter(test_code__test_type=test_type)
@@ -96,7 +97,7 @@ def get_question_detail_analytics(request):
             question_obj = Question.objects.get(test_code__test_code=test_code, question_number=question_number)
         except Question.DoesNotExist:
             return JsonResponse({'error': 'Question not found for the given test code and question number.'}, status=404)
-        responses = StudentResponse.objects.filter(
+        responses = _response_queryset().filter(
             test_code__test_code=test_code,
             question_number=question_number
         )
@@ -0,0 +1,61 @@
+# archives.py
+# Multi-test archives: one .zip holding many SR/AK file pairs (e.g. one pair per
+# institution or test), ingested as a single job. Members are streamed straight out of
+# the archive, never extracted to disk.
+import os
+import re
+import zipfile
+from contextlib import ExitStack, contextmanager
+
+from .pipeline import _FilePair, _IngestionInputError
+from .row_readers import XLSX_EXTENSIONS
+
+ARCHIVE_MEMBER_EXTENSIONS = ('.csv',) + XLSX_EXTENSIONS
+# The standalone SR/AK marker in a member's file name: SR.csv, inst1_SR_201.csv, AK-2.xlsx...
+_PAIR_MARKER = re.compile(r'(?<![a-z])(sr|ak)(?![a-z])', re.IGNORECASE)
+
+
+def _pair_members(member_names):
+    """
+    Pairs the SR and AK members of an archive: two files pair up when they sit in the same
+    directory and their names only differ by the SR/AK marker (e.g. inst1/SR.csv and
+    inst1/AK.csv). Returns [(sr_member, ak_member)] ordered by SR member name.
+    Raises _IngestionInputError for duplicated or unpaired members, or an archive without pairs.
+    """
+    members = {}
+    for member_name in member_names:
+        directory, file_name = os.path.split(member_name)
+        if not file_name or directory.startswith('__MACOSX') or not file_name.lower().endswith(ARCHIVE_MEMBER_EXTENSIONS):
+            continue
+        marker = _PAIR_MARKER.search(file_name)
+        if marker is None:
+            print(f"    Warning: Skipping archive member '{member_name}': its name does not mark it as SR or AK.")
+            continue
+        key = (directory, (file_name[:marker.start()] + '\0' + file_name[marker.end():]).lower())
+        slot = members.setdefault(key, {})
+        kind = marker.group(1).upper()
+        if kind in slot:
+            raise _IngestionInputError(f"Archive members '{slot[kind]}' and '{member_name}' are both the {kind} file of one pair.")
+        slot[kind] = member_name
+    unpaired = sorted(name for slot in members.values() if len(slot) == 1 for name in slot.values())
+    if unpaired:
+        raise _IngestionInputError(f"Archive members without a matching SR/AK file: {', '.join(unpaired)}.")
+    if not members:
+        raise _IngestionInputError('The archive contains no SR/AK file pairs.')
+    return sorted((slot['SR'], slot['AK']) for slot in members.values())
+
+
+@contextmanager
+def _open_archive_pairs(archive_file):
+    """Opens an uploaded .zip and yields its SR/AK pairs as _FilePairs over the (unextracted) members."""
+    try:
+        archive = zipfile.ZipFile(archive_file)
+    except zipfile.BadZipFile:
+        raise _IngestionInputError('The archive is not a valid .zip file.')
+    with archive, ExitStack() as stack:
+        file_pairs = [
+            _FilePair(sr_member, stack.enter_context(archive.open(sr_member)), ak_member, stack.enter_context(archive.open(ak_member)))
+            for sr_member, ak_member in _pair_members(archive.namelist())
+        ]
+        print(f"Archive holds {len(file_pairs)} SR/AK pairs: {', '.join(pair.sr_name for pair in file_pairs)}")
+        yield file_pairs
@@ -0,0 +1,25 @@
+# bulk_load.py
+# Set-based loading: rows are streamed into tables with PostgreSQL COPY instead of
+# per-row INSERTs. Ingestion COPYs SR rows into staging (see staging.py) and scores
+# them there (see staged_scoring.py) with these helpers.
+import csv
+import io
+
+# Number of SR rows (each expanding to one fact per answer column) buffered before a COPY.
+FACT_BATCH_SIZE = 500
+
+
+def _copy_rows(cursor, table, columns, rows):
+    """
+    Streams rows into `table` with COPY ... FROM STDIN (CSV format).
+    Works with both psycopg2 (copy_expert) and psycopg 3 (cursor.copy).
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    if hasattr(cursor, 'copy_expert'):
+        cursor.copy_expert(sql, buffer)
+    else:
+        with cursor.copy(sql) as copy:
+            copy.write(buffer.getvalue())
@@ -0,0 +1,203 @@
+# dashboard_engine.py
+# One computation layer behind the dashboard endpoints. _DashboardMetrics resolves the
+# filters of a request once and computes each shared input (filtered performances,
+# response cube totals, the combined performance statistics, the representative max
+# score) at most once, on first use. The individual endpoints and
+# get_dashboard_all_metrics are projections of the same instance, so a combined request
+# runs every query once instead of once per section.
+from functools import cached_property
+
+from django.db.models import Avg, Count, Q, F, Value, FloatField, Window, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Cast, DenseRank, Floor, Greatest, NullIf, RowNumber
+from django.contrib.postgres.aggregates import StringAgg
+
+from excelhandler.models import StudentTestPerformance, Question, Test
+from .filters import _apply_filters_to_performance_queryset, _apply_filters_to_test_queryset, _requested_subject
+from .response_cube import _response_cube_totals
+
+NEET_READINESS_SCORE = 400
+MARKS_PER_QUESTION = 4
+
+
+class _DashboardMetrics:
+    """The dashboard metrics for the filters of one request; each method returns a JSON-ready section."""
+
+    def __init__(self, request):
+        self.request = request
+
+    # --- Shared inputs ---
+
+    @cached_property
+    def performances(self):
+        """StudentTestPerformance records matching the filters."""
+        return _apply_filters_to_performance_queryset(StudentTestPerformance.objects.all(), self.request)
+
+    @cached_property
+    def distinct_performances(self):
+        """
+        The filtered records, each once. The subject filter joins questions and de-duplicates
+        with DISTINCT, which window functions and grouping would see through, so it is
+        applied as a semi-join here.
+        """
+        if self.performances.query.distinct:
+            return StudentTestPerformance.objects.filter(pk__in=self.performances.values('pk'))
+        return self.performances
+
+    @cached_property
+    def response_totals(self):
+        """Distinct tests and attempted, correct and total responses, from the response cube."""
+        return _response_cube_totals(self.request)
+
+    @cached_property
+    def performance_stats(self):
+        """
+        Count, average, NEET-ready count, and top/bottom 10% average (at least one record
+        each) of the filtered total scores, in one aggregate query over window functions.
+        """
+        records = self.distinct_performances.order_by().annotate(
+            records=Window(Count('id')),
+            from_top=Window(RowNumber(), order_by=F('total_score').desc()),
+            from_bottom=Window(RowNumber(), order_by=F('total_score').asc()),
+            tail_size=Greatest(Value(1.0), Floor(Cast('records', FloatField()) * Value(0.1)), output_field=FloatField()),
+        )
+        return records.aggregate(
+            records=Count('id'),
+            average_score=Coalesce(Avg('total_score'), 0.0, output_field=FloatField()),
+            neet_ready=Count('id', filter=Q(total_score__gte=NEET_READINESS_SCORE)),
+            top_10_average=Coalesce(Avg('total_score', filter=Q(from_top__lte=F('tail_size'))), 0.0, output_field=FloatField()),
+            bottom_10_average=Coalesce(Avg('total_score', filter=Q(from_bottom__lte=F('tail_size'))), 0.0, output_field=FloatField()),
+        )
+
+    @cached_property
+    def max_score(self):
+        """
+        Maximum score of the first filtered test (by test code), taken as the denominator
+        for every displayed score; None when no test matches the filters.
+        """
+        question_count = Question.objects.filter(test_code=OuterRef('pk')).values('test_code').annotate(count=Count('id')).values('count')
+        first_test = (
+            _apply_filters_to_test_queryset(Test.objects.all(), self.request)
+            .annotate(question_count=Coalesce(Subquery(question_count), 0))
+            .order_by('pk')
+            .values_list('question_count', flat=True)
+            .first()
+        )
+        return None if first_test is None else first_test * MARKS_PER_QUESTION
+
+    # --- Sections ---
+
+    def cards(self):
+        totals = self.response_totals
+        stats = self.performance_stats
+        average_accuracy = (totals['correct'] / totals['attempted'] * 100) if totals['attempted'] > 0 else 0.0
+        average_attempt_rate = (totals['attempted'] / totals['total'] * 100) if totals['total'] > 0 else 0.0
+        max_score = self.max_score or 1
+        return {
+            'total_tests_conducted': totals['tests'],
+            'average_accuracy_percent': round(average_accuracy, 1),
+            'average_total_score': f"{round(stats['average_score'], 1)} / {max_score}",
+            'average_attempt_rate_percent': round(average_attempt_rate, 1),
+            'top_10_avg_score': f"{round(stats['top_10_average'], 1)} / {max_score}",
+            'bottom_10_avg_score': f"{round(stats['bottom_10_average'], 1)} / {max_score}",
+        }
+
+    def neet_readiness(self):
+        stats = self.performance_stats
+        percentage = (stats['neet_ready'] / stats['records'] * 100) if stats['records'] > 0 else 0.0
+        return {'percentage_students_above_400': round(percentage, 1)}
+
+    def risk_breakdown(self):
+        """Students by their average percentage score over the filtered tests: safe (> 70), medium (40-70), at risk (< 40)."""
+        question_count = Subquery(
+            Question.objects.filter(test_code=OuterRef('test_id')).values('test_code').annotate(count=Count('id')).values('count')[:1],
+            output_field=FloatField(),
+        )
+        # 0% for tests without questions; NULLIF keeps the question count to one subquery per record.
+        student_averages = self.performances.annotate(
+            percentage_score=Coalesce(
+                F('total_score') * 100.0 / NullIf(question_count * float(MARKS_PER_QUESTION), 0.0), 0.0, output_field=FloatField(),
+            ),
+        ).values('student').annotate(avg_percentage_score=Avg('percentage_score'))
+        stats = student_averages.aggregate(
+            students=Count('student'),
+            safe=Count('student', filter=Q(avg_percentage_score__gt=70)),
+            medium_risk=Count('student', filter=Q(avg_percentage_score__gte=40, avg_percentage_score__lt=70)),
+            at_risk=Count('student', filter=Q(avg_percentage_score__lt=40)),
+        )
+        students = stats['students']
+
+        def share(count):
+            return {'count': count, 'percentage': round(count / students * 100, 1) if students > 0 else 0.0}
+
+        return {
+            'safe': share(stats['safe']),
+            'medium_risk': share(stats['medium_risk']),
+            'at_risk': share(stats['at_risk']),
+            'total_students_considered': students,
+        }
+
+    def trend_graph(self):
+        """
+        The filtered tests by date, with their average score and subjects (only the filtered
+        subject when there is one). Subjects come from a per-test subquery, so the records
+        are not multiplied by the questions of their test.
+        """
+        questions = Question.objects.filter(test_code=OuterRef('test_id'))
+        if _requested_subject(self.request):
+            questions = questions.filter(subject_tag=_requested_subject(self.request))
+        subjects_covered = questions.values('test_code').annotate(
+            subjects=StringAgg('subject_tag', delimiter=', ', distinct=True),
+        ).values('subjects')
+        tests = self.distinct_performances.values(
+            'test__test_code', 'test__test_date', 'test__test_type', 'test__institution__name', 'test__batch__name',
+        ).annotate(
+            average_score=Avg('total_score'),
+            subjects_covered=Subquery(subjects_covered),
+        ).order_by('test__test_date', 'test__test_code')
+        return [
+            {
+                'test_code': entry['test__test_code'],
+                'test_date': entry['test__test_date'],
+                'test_type': entry['test__test_type'],
+                'institution': entry['test__institution__name'],
+                'batch': entry['test__batch__name'],
+                'average_score': round(entry['average_score'], 1) if entry['average_score'] is not None else 0.0,
+                'subjects': entry['subjects_covered'] or "N/A",
+            }
+            for entry in tests
+        ]
+
+    def overall_performance(self):
+        """
+        The top 10 filtered performances by dense rank of total score. Performances tied on
+        score are listed by sturecid, then test code, so the same filters always list (and
+        cut off at 10) the same records.
+        """
+        max_score = self.max_score
+        if not max_score:
+            if self.performance_stats['records'] == 0:
+                return []
+            max_score = 1
+        top_performances = self.performances.select_related('student').annotate(
+            dynamic_rank=Window(expression=DenseRank(), order_by=F('total_score').desc()),
+        ).order_by('dynamic_rank', '-total_score', 'student__sturecid', 'test__test_code')[:10]
+        return [
+            {
+                'rank': performance.dynamic_rank,
+                'name': performance.student.name,
+                'section': performance.student.section,
+                'overall_score': f"{performance.total_score} / {max_score}",
+                'sturecid': performance.student_id,
+                'test_code': performance.test_id,
+            }
+            for performance in top_performances
+        ]
+
+    def all_sections(self):
+        return {
+            'metrics': self.cards(),
+            'neet_readiness': self.neet_readiness(),
+            'risk_breakdown': self.risk_breakdown(),
+            'trend_graph': self.trend_graph(),
+            'overall_performance': self.overall_performance(),
+        }
@@ -0,0 +1,52 @@
+# deletion.py
+# Test-level delete. A test's responses, totals, subject totals, answer key and Test row
+# are removed with one set-based DELETE per table, through the test_code indexes, instead
+# of Test.delete(), whose Python-side cascade loads every related row into the ORM
+# collector first. Replacing a test reuses _delete_test_facts inside its publishing
+# transaction (see staging._publish_test).
+import time
+
+from django.db import connection, transaction
+
+from excelhandler.models import (
+    Test, Question, StudentResponse, StudentAnswerSheet, StudentTestPerformance, StudentSubjectPerformance, ResponseCube,
+)
+from .locks import _lock_tests_for_transaction
+
+# (result key, model, column holding the test code), children first.
+_TEST_FACT_TABLES = (
+    ('response_cube', ResponseCube, 'test_id'),
+    ('subject_performance', StudentSubjectPerformance, 'test_id'),
+    ('performance', StudentTestPerformance, 'test_id'),
+    ('student_responses', StudentResponse, 'test_code_id'),
+    ('answer_sheets', StudentAnswerSheet, 'test_code_id'),
+)
+
+
+def _delete_test_facts(cursor, test_code):
+    """Deletes a test's responses (in both storages), response cube cells, totals and subject totals. Returns {table: rows deleted}."""
+    deleted = {}
+    for key, model, column in _TEST_FACT_TABLES:
+        cursor.execute(f"DELETE FROM {model._meta.db_table} WHERE {column} = %s", [test_code])
+        deleted[key] = cursor.rowcount
+    return deleted
+
+
+def _delete_test(test_code):
+    """
+    Deletes a test and everything stored for it in one transaction. Returns the rows
+    deleted per table and the elapsed time, or None when the test does not exist.
+    """
+    started = time.perf_counter()
+    with transaction.atomic(), connection.cursor() as cursor:
+        # A concurrent publish of the same test waits for the delete, and the other way round.
+        _lock_tests_for_transaction([test_code])
+        if not Test.objects.filter(test_code=test_code).exists():
+            return None
+        deleted = _delete_test_facts(cursor, test_code)
+        cursor.execute(f"DELETE FROM {Question._meta.db_table} WHERE test_code_id = %s", [test_code])
+        deleted['questions'] = cursor.rowcount
+        cursor.execute(f"DELETE FROM {Test._meta.db_table} WHERE test_code = %s", [test_code])
+    elapsed = time.perf_counter() - started
+    print(f"Deleted test '{test_code}' in {elapsed:.2f}s: {', '.join(f'{count} {key}' for key, count in deleted.items())}.")
+    return {'test_code': test_code, 'deleted': deleted, 'elapsed_seconds': round(elapsed, 3)}
@@ -0,0 +1,77 @@
+# dimensions.py
+# Institution, Batch and Student dimensions of an ingestion. While the files are read they
+# are only staged: each staged test carries the names of its institution and batch, and
+# each student the values of its first row. _create_staged_dimensions creates the missing
+# ones with one set-based upsert per dimension once the upload has passed validation, so a
+# rejected upload leaves nothing behind. Tests are written when they are published (see
+# staging.py).
+from django.db import connection
+
+from excelhandler.models import Institution, Batch, Student, StagedTest, StagedStudent
+
+
+class _DimensionCache:
+    """
+    Collects the dimensions referenced by batches of parsed SR rows for staging.
+
+    Semantics match the previous per-row calls: institutions, batches and students are
+    get-or-created (an existing student keeps its name/class/section), while a test takes
+    the type, date, institution and batch of the last row that mentions it
+    (see latest_test_values).
+    """
+
+    def __init__(self):
+        self.staged_sturecids = set()
+
+    def new_students(self, records):
+        """Returns {sturecid: student defaults} of the students of `records` not staged yet by this run, from their first row."""
+        new_students = {}
+        for r in records:
+            if r.sturecid not in self.staged_sturecids and r.sturecid not in new_students:
+                new_students[r.sturecid] = r.student_defaults
+        self.staged_sturecids.update(new_students)
+        return new_students
+
+    def latest_test_values(self, records):
+        """Returns {test_code: (test_type, test_date, institution_name, batch_name)} from the last record of each test."""
+        return {r.test_code: (r.test_type, r.test_date, r.institution_name, r.batch_name) for r in records}
+
+
+def _create_staged_dimensions(job):
+    """
+    Creates the institutions, batches and students staged by `job` that do not exist yet;
+    existing rows are left untouched, like get_or_create. Safe to repeat.
+    """
+    staged_test_table = StagedTest._meta.db_table
+    institution_table = Institution._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {institution_table} (name)
+            SELECT DISTINCT institution_name FROM {staged_test_table} WHERE job_id = %s
+            ORDER BY institution_name
+            ON CONFLICT (name) DO NOTHING
+            """,
+            [job.pk],
+        )
+        cursor.execute(
+            f"""
+            INSERT INTO {Batch._meta.db_table} (name, institution_id)
+            SELECT DISTINCT st.batch_name, i.id
+            FROM {staged_test_table} AS st
+            JOIN {institution_table} AS i ON i.name = st.institution_name
+            WHERE st.job_id = %s
+            ORDER BY st.batch_name, i.id
+            ON CONFLICT (name, institution_id) DO NOTHING
+            """,
+            [job.pk],
+        )
+        cursor.execute(
+            f"""
+            INSERT INTO {Student._meta.db_table} (sturecid, name, student_class, section, claid)
+            SELECT sturecid, name, student_class, section, claid FROM {StagedStudent._meta.db_table} WHERE job_id = %s
+            ORDER BY sturecid
+            ON CONFLICT (sturecid) DO NOTHING
+            """,
+            [job.pk],
+        )
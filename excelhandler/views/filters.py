@@ -1,7 +1,7 @@
 # filters.py (Corrected subject lookup path in all relevant functions)
 from datetime import datetime
 import logging
-from django.db.models import Q, F
+from django.db.models import F
 
 # Get an instance of a logger for this module
 logger = logging.getLogger(__name__)
@@ -53,6 +53,44 @@ def _apply_filters_to_response_queryset(queryset, request):
     return queryset
 
 
+def _apply_filters_to_cube_queryset(queryset, request):
+    """
+    Applies the filters of _apply_filters_to_response_queryset to a ResponseCube queryset,
+    so sums over the cube match aggregates over the filtered responses. Like that filter,
+    it ignores student_class.
+    """
+    institution_name = request.GET.get('institution')
+    batch_name = request.GET.get('batch')
+    section_name = request.GET.get('section')
+    test_type = request.GET.get('test_type')
+    subject_tag = request.GET.get('subject')
+    start_date_str = request.GET.get('from')
+    end_date_str = request.GET.get('to')
+
+    if institution_name and institution_name.lower() != 'all institutions':
+        queryset = queryset.filter(test__institution__name=institution_name)
+    if batch_name and batch_name.lower() != 'all batches':
+        queryset = queryset.filter(test__batch__name=batch_name)
+    if section_name and section_name.lower() != 'all sections':
+        queryset = queryset.filter(section=section_name)
+    if test_type and test_type.lower() != 'all test types':
+        queryset = queryset.filter(test__test_type=test_type)
+    # Cells hold the subject tag of their questions, so no join to Question is needed.
+    if subject_tag and subject_tag.lower() != 'all subjects':
+        queryset = queryset.filter(subject_tag=subject_tag)
+
+    if start_date_str and end_date_str:
+        try:
+            start_date = datetime.strptime(start_date_str, "%Y-%m-%d").date()
+            end_date = datetime.strptime(end_date_str, "%Y-%m-%d").date()
+            queryset = queryset.filter(test__test_date__range=(start_date, end_date))
+        except ValueError:
+            logger.warning(f"Invalid date format received in _apply_filters_to_cube_queryset: start_date={start_date_str}, end_date={end_date_str}")
+            pass
+
+    return queryset
+
+
 def _apply_filters_to_performance_queryset(queryset, request):
     institution_name = request.GET.get('institution')
     batch_name = request.GET.get('batch')
@@ -130,4 +168,12 @@ def _apply_filters_to_test_queryset(queryset, request):
         except ValueError:
             logger.warning(f"Invalid date format received in _apply_filters_to_test_queryset: start_date={start_date_str}, end_date={end_date_str}")
             pass
-    return queryset
\ No newline at end of file
+    return queryset
+
+
+def _requested_subject(request):
+    """The subject tag the filters above restrict to, or None when every subject is selected."""
+    subject_tag = request.GET.get('subject')
+    if subject_tag and subject_tag.lower() != 'all subjects':
+        return subject_tag
+    return None
@@ -0,0 +1,107 @@
+# fingerprints.py
+# Content fingerprints of each test's SR.csv rows and AK.csv slice, computed row by row in
+# the pass that stages an upload. They are stored on Test when the test is published, so
+# a re-upload of the same files can drop what it staged for every test whose content has
+# not changed and skip rescoring and publishing it.
+import hashlib
+
+from excelhandler.models import Test
+from .row_readers import _RowIndex
+
+
+class _RowFingerprints:
+    """
+    Incremental {test_code: sha256} over the header and, in file order, the rows of each
+    test of one file, fed one row at a time as the file is read; `test_code_of(row)`
+    names the test of a row.
+    """
+
+    def __init__(self, headers, test_code_of):
+        self._header_bytes = '\x1f'.join(headers).encode('utf-8') + b'\x1e'
+        self._test_code_of = test_code_of
+        self._digests = {}
+
+    def add(self, row):
+        test_code = self._test_code_of(row)
+        if not test_code:
+            return
+        digest = self._digests.get(test_code)
+        if digest is None:
+            digest = self._digests[test_code] = hashlib.sha256(self._header_bytes)
+        digest.update('\x1f'.join(row).encode('utf-8'))
+        digest.update(b'\x1e')
+
+    def digests(self):
+        return {test_code: digest.hexdigest() for test_code, digest in self._digests.items()}
+
+
+def _answer_key_fingerprints(headers):
+    """Fingerprints of the AK.csv slices of each test (test code in the second column)."""
+    return _RowFingerprints(headers, lambda row: row[1].strip() if len(row) > 1 else '')
+
+
+def _response_fingerprints(headers):
+    """Fingerprints of the SR.csv rows of each test (grouped by the 'testid' column)."""
+    row_index = _RowIndex(headers)
+    return _RowFingerprints(headers, lambda row: str(row_index.get(row, 'testid', '')).strip())
+
+
+def _combine_fingerprints(fingerprints_per_file):
+    """
+    Merges the {test_code: digest} of several files. A test found in one file keeps its
+    digest, so it matches a single upload of the same rows; a test spread over several
+    files gets a digest over its per-file digests, in file order.
+    """
+    digests = {}
+    for fingerprints in fingerprints_per_file:
+        for test_code, fingerprint in fingerprints.items():
+            digests.setdefault(test_code, []).append(fingerprint)
+    return {
+        test_code: parts[0] if len(parts) == 1 else hashlib.sha256(''.join(parts).encode('ascii')).hexdigest()
+        for test_code, parts in digests.items()
+    }
+
+
+class _UploadFingerprints:
+    """
+    Fingerprints of the SR/AK files of an upload (one {test_code: digest} per file, see
+    _RowFingerprints) compared with the ones stored on Test. A test's SR rows (or AK
+    slice) are unchanged when their fingerprint equals the stored one; a test is skipped
+    when everything the upload holds for it is unchanged. With `ignore_stored` (full
+    rebuilds) nothing is considered unchanged. With `replace_test_code` only that test
+    counts as changed, whatever is stored for it.
+    """
+
+    def __init__(self, response_fingerprints, answer_key_fingerprints, ignore_stored=False, replace_test_code=''):
+        self.responses = _combine_fingerprints(response_fingerprints)
+        self.answer_keys = _combine_fingerprints(answer_key_fingerprints)
+        self.test_codes = set(self.responses) | set(self.answer_keys)
+        stored = {} if ignore_stored else {
+            test_code: (responses_fingerprint, answer_key_fingerprint)
+            for test_code, responses_fingerprint, answer_key_fingerprint in Test.objects.filter(
+                test_code__in=self.test_codes
+            ).values_list('test_code', 'responses_fingerprint', 'answer_key_fingerprint')
+        }
+        self.unchanged_responses = {
+            test_code for test_code, fingerprint in self.responses.items() if stored.get(test_code, ('', ''))[0] == fingerprint
+        }
+        self.unchanged_answer_keys = {
+            test_code for test_code, fingerprint in self.answer_keys.items() if stored.get(test_code, ('', ''))[1] == fingerprint
+        }
+        if replace_test_code:
+            self.unchanged_responses = set(self.responses) - {replace_test_code}
+            self.unchanged_answer_keys = set(self.answer_keys) - {replace_test_code}
+        self.skipped_test_codes = {
+            test_code for test_code in self.test_codes
+            if (test_code not in self.responses or test_code in self.unchanged_responses)
+            and (test_code not in self.answer_keys or test_code in self.unchanged_answer_keys)
+        }
+
+    def changed_fields(self, test_code):
+        """The Test fingerprint fields to store once `test_code` is published: those of its changed slices."""
+        fields = {}
+        if test_code in self.responses and test_code not in self.unchanged_responses:
+            fields['responses_fingerprint'] = self.responses[test_code]
+        if test_code in self.answer_keys and test_code not in self.unchanged_answer_keys:
+            fields['answer_key_fingerprint'] = self.answer_keys[test_code]
+        return fields
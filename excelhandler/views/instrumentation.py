@@ -0,0 +1,71 @@
+# instrumentation.py
+# Per-phase metrics of an ingestion run: wall time, SQL query count and time (through a
+# database execute wrapper), rows per second and peak traced memory (tracemalloc).
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+
+class _PhaseMetrics:
+    """Collects one metrics record per phase while `collect()` is active."""
+
+    def __init__(self):
+        self.phases = []
+        self._current = None
+        self._trace_memory = False
+
+    @contextmanager
+    def collect(self):
+        """Counts queries on the default connection and, if enabled, traces memory for the duration of the block."""
+        self._trace_memory = settings.INGESTION_TRACE_MEMORY and not tracemalloc.is_tracing()
+        if self._trace_memory:
+            tracemalloc.start()
+        try:
+            with connection.execute_wrapper(self._time_query):
+                yield self
+        finally:
+            if self._trace_memory:
+                tracemalloc.stop()
+
+    def _time_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if self._current is not None:
+                self._current['queries'] += 1
+                self._current['query_seconds'] += time.perf_counter() - started
+
+    def start_phase(self, phase):
+        self._current = {'phase': phase, 'started': time.perf_counter(), 'queries': 0, 'query_seconds': 0.0}
+        if self._trace_memory:
+            tracemalloc.reset_peak()
+
+    def finish_phase(self, rows):
+        """Closes the current phase, which handled `rows` rows."""
+        if self._current is None:
+            return
+        current, self._current = self._current, None
+        wall_seconds = time.perf_counter() - current['started']
+        self.phases.append({
+            'phase': current['phase'],
+            'wall_seconds': round(wall_seconds, 3),
+            'queries': current['queries'],
+            'query_seconds': round(current['query_seconds'], 3),
+            'rows': rows,
+            'rows_per_sec': round(rows / wall_seconds, 1) if wall_seconds > 0 else 0.0,
+            'peak_memory_bytes': tracemalloc.get_traced_memory()[1] if self._trace_memory else None,
+        })
+
+    def summary(self):
+        peaks = [phase['peak_memory_bytes'] for phase in self.phases if phase['peak_memory_bytes'] is not None]
+        return {
+            'wall_seconds': round(sum(phase['wall_seconds'] for phase in self.phases), 3),
+            'queries': sum(phase['queries'] for phase in self.phases),
+            'query_seconds': round(sum(phase['query_seconds'] for phase in self.phases), 3),
+            'peak_memory_bytes': max(peaks) if peaks else None,
+            'phases': self.phases,
+        }
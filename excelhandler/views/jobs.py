@@ -0,0 +1,174 @@
+# jobs.py
+# Database-backed queue for background ingestion. Uploads are persisted as IngestionJob
+# rows; the `run_ingestion_worker` management command claims queued jobs and runs the
+# pipeline outside the request/response cycle. A failed job keeps its files and
+# checkpoint, and resumes from it once requeued.
+import time
+import traceback
+from contextlib import ExitStack
+
+from django.db import transaction
+from django.utils import timezone
+
+from excelhandler.models import IngestionJob
+from .pipeline import _FilePair, _IngestionProgress, _IngestionValidationError, _run_ingestion
+from .archives import _open_archive_pairs
+from .uploads import _ChunkedUploadFile, _delete_upload_files
+
+# Progress is written through its own connection (see DATABASES['jobs'] in settings) so
+# status readers can see it while a transaction on 'default' is still open.
+JOB_PROGRESS_DB_ALIAS = 'jobs'
+# Minimum number of seconds between two progress writes for the same job.
+JOB_PROGRESS_INTERVAL = 1.0
+
+
+class _JobProgress(_IngestionProgress):
+    """Mirrors pipeline progress onto the IngestionJob row, throttled to one write per interval."""
+
+    def __init__(self, job, interval=JOB_PROGRESS_INTERVAL):
+        super().__init__()
+        self.job = job
+        self.interval = interval
+        self._last_write = 0.0
+
+    def start_phase(self, phase):
+        super().start_phase(phase)
+        self._write()
+
+    def add_rows(self, count):
+        super().add_rows(count)
+        if time.monotonic() - self._last_write >= self.interval:
+            self._write()
+
+    def _write(self):
+        self._last_write = time.monotonic()
+        IngestionJob.objects.using(JOB_PROGRESS_DB_ALIAS).filter(pk=self.job.pk).update(
+            phase=self.phase or '',
+            rows_processed=self.rows_processed,
+            rows_per_sec=round(self.rows_per_sec, 1),
+        )
+
+
+def _claim_next_job():
+    """
+    Atomically moves the oldest queued job to 'running' and returns it, or None when the
+    queue is empty (scratch jobs are never queued). SKIP LOCKED lets several workers
+    poll the same table safely.
+    """
+    with transaction.atomic():
+        job = (
+            IngestionJob.objects.select_for_update(skip_locked=True)
+            .filter(status=IngestionJob.STATUS_QUEUED)
+            .order_by('created_at')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = IngestionJob.STATUS_RUNNING
+        job.started_at = timezone.now()
+        job.save(update_fields=['status', 'started_at'])
+    return job
+
+
+def _open_job_file(stored_file, upload):
+    """Opens a job's input: its chunked upload when it has one (readable while chunks arrive), else the stored file."""
+    if upload is not None:
+        return _ChunkedUploadFile(upload)
+    return stored_file.open('rb')
+
+
+def _run_job(job, raise_errors=False, sr_file=None, ak_file=None, archive_file=None):
+    """
+    Runs the ingestion pipeline for a claimed job and records its outcome. A job with a
+    checkpoint resumes from it. The files default to the job's stored uploads (chunked
+    uploads are read while their chunks arrive); callers reading from elsewhere
+    (manage.py ingest) pass them open. A job with an archive ingests each SR/AK pair in
+    it; a rebuild_only job reads none. With `raise_errors` the failure is re-raised once
+    recorded.
+    """
+    progress = _JobProgress(job)
+    error = None
+    try:
+        with ExitStack() as stack:
+            if archive_file is None and job.archive_file:
+                archive_file = stack.enter_context(job.archive_file.open('rb'))
+            if job.rebuild_only:
+                file_pairs = []
+            elif archive_file is not None:
+                file_pairs = stack.enter_context(_open_archive_pairs(archive_file))
+            else:
+                if sr_file is None:
+                    sr_file = stack.enter_context(_open_job_file(job.sr_file, job.sr_upload))
+                if ak_file is None:
+                    ak_file = stack.enter_context(_open_job_file(job.ak_file, job.ak_upload))
+                file_pairs = [_FilePair('SR.csv', sr_file, 'AK.csv', ak_file)]
+            result = _run_ingestion(job, file_pairs, progress=progress)
+    except Exception as e:
+        print(f"Ingestion job {job.pk} failed: {e}")
+        error = e
+        job.status = IngestionJob.STATUS_FAILED
+        job.error = f"{e}\n\n{traceback.format_exc()}"
+        if isinstance(e, _IngestionValidationError):
+            job.result = {'status': 'error', 'message': str(e), 'validation': e.report}
+    else:
+        job.status = IngestionJob.STATUS_SUCCEEDED
+        job.result = result
+        # The uploaded files are only needed to (re)run the job.
+        if job.sr_file:
+            job.sr_file.delete(save=False)
+        if job.ak_file:
+            job.ak_file.delete(save=False)
+        if job.archive_file:
+            job.archive_file.delete(save=False)
+        for upload in (job.sr_upload, job.ak_upload):
+            if upload is not None:
+                _delete_upload_files(upload)
+    job.phase = progress.phase or ''
+    job.rows_processed = progress.rows_processed
+    job.rows_per_sec = round(progress.rows_per_sec, 1)
+    job.finished_at = timezone.now()
+    # The checkpoint is only written by the pipeline, in the transactions it describes.
+    job.save(update_fields=['status', 'result', 'error', 'phase', 'rows_processed', 'rows_per_sec', 'finished_at'])
+    if error is not None and raise_errors:
+        raise error
+    return job
+
+
+def _requeue_job(job):
+    """Queues a failed job again; the worker resumes it from its checkpoint."""
+    job.status = IngestionJob.STATUS_QUEUED
+    job.error = ''
+    job.finished_at = None
+    job.save(update_fields=['status', 'error', 'finished_at'])
+    return job
+
+
+def _requeue_interrupted_jobs():
+    """
+    Queues the jobs left 'running' by a worker that died, so they resume from their
+    checkpoint; scratch jobs are left alone. Only safe while no other worker is running.
+    Returns how many were queued.
+    """
+    return IngestionJob.objects.filter(status=IngestionJob.STATUS_RUNNING).update(status=IngestionJob.STATUS_QUEUED)
+
+
+def _serialize_job(job):
+    return {
+        'job_id': job.pk,
+        'status': job.status,
+        'full_rebuild': job.full_rebuild,
+        'replace_test_code': job.replace_test_code or None,
+        'rebuild_only': job.rebuild_only,
+        'workers': job.workers,
+        'sr_upload': job.sr_upload_id,
+        'ak_upload': job.ak_upload_id,
+        'phase': job.phase,
+        'rows_processed': job.rows_processed,
+        'rows_per_sec': job.rows_per_sec,
+        'result': job.result,
+        'checkpoint': job.checkpoint,
+        'error': job.error.split('\n', 1)[0] if job.error else None,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
@@ -0,0 +1,52 @@
+# locks.py
+# Per-test PostgreSQL advisory locks. Everything that writes a test's live rows (its
+# publish, an answer key update, a delete) holds the lock of that test, keyed on its
+# test_code, so jobs for different tests run side by side while jobs for the same test
+# queue behind each other. Several tests are always locked in sorted order, so two jobs
+# cannot deadlock on each other's locks.
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+
+# First key of the two-key advisory locks taken here; keeps them apart from other users of advisory locks.
+TEST_LOCK_NAMESPACE = 2021
+
+
+def _lock_key(test_code):
+    return "%s, hashtext(%s)", [TEST_LOCK_NAMESPACE, test_code]
+
+
+def _wait_for_lock(cursor, function, test_code):
+    """Takes a lock with pg_try_<function> and, when another job holds it, says so and waits with pg_<function>."""
+    key_sql, params = _lock_key(test_code)
+    cursor.execute(f"SELECT pg_try_{function}({key_sql})", params)
+    if cursor.fetchone()[0]:
+        return
+    print(f"    Test '{test_code}' is being written by another job; waiting for it...")
+    started = time.perf_counter()
+    cursor.execute(f"SELECT pg_{function}({key_sql})", params)
+    print(f"    Test '{test_code}' lock acquired after {time.perf_counter() - started:.2f}s.")
+
+
+@contextmanager
+def _test_lock(test_code):
+    """
+    Holds the session-level lock of a test around work that spans several transactions
+    (scoring in staging, then merging); waits while another job holds it.
+    """
+    with connection.cursor() as cursor:
+        _wait_for_lock(cursor, 'advisory_lock', test_code)
+    try:
+        yield
+    finally:
+        key_sql, params = _lock_key(test_code)
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT pg_advisory_unlock({key_sql})", params)
+
+
+def _lock_tests_for_transaction(test_codes):
+    """Takes the locks of `test_codes`, in sorted order, until the current transaction ends."""
+    with connection.cursor() as cursor:
+        for test_code in sorted(set(test_codes)):
+            _wait_for_lock(cursor, 'advisory_xact_lock', test_code)
@@ -0,0 +1,61 @@
+# parallel.py
+# Partitioned ingestion: tests are independent of each other once their dimensions are
+# written, so each test (partition) is published by a pool of worker processes, one
+# partition at a time and one database connection per worker.
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.db import connections
+
+
+def _run_partitions(function, partitions, workers, on_result=None):
+    """
+    Calls function(*arguments) for each argument tuple in `partitions` (its first element
+    is the test code) and returns the results ordered by test code. `on_result` is
+    called in this process as each partition finishes. With `workers` > 1 partitions run
+    in a pool of processes, in the given order; each must commit on its own, so a failing
+    test does not roll back the others. The first failure is re-raised once every
+    partition has finished.
+    """
+    results = []
+    first_error = None
+
+    def finished(test_code, result=None, error=None):
+        nonlocal first_error
+        if error is not None:
+            print(f"    Partition for test '{test_code}' failed: {error}")
+            first_error = first_error or error
+            return
+        print(
+            f"    Test '{test_code}': {result['students']} students, {result['student_responses_written']} responses written, "
+            f"{result['student_responses_scored']} scored in "
+            f"{result['seconds']:.2f}s ({result['merge_seconds']:.2f}s in the publishing transaction)."
+        )
+        if on_result is not None:
+            on_result(result)
+        results.append(result)
+
+    if workers <= 1:
+        for arguments in partitions:
+            try:
+                result = function(*arguments)
+            except Exception as e:
+                finished(arguments[0], error=e)
+                break
+            finished(arguments[0], result)
+    else:
+        # Forked workers must not share the parent's sockets: close them so each worker opens
+        # its own connection on first use (the parent reconnects lazily afterwards).
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as pool:
+            futures = {pool.submit(function, *arguments): arguments[0] for arguments in partitions}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    finished(futures[future], error=e)
+                    continue
+                finished(futures[future], result)
+    if first_error is not None:
+        raise first_error
+    return sorted(results, key=lambda result: result['test_code'])
@@ -0,0 +1,570 @@
+# pipeline.py
+# The five ingestion phases (SR load, answer key, scoring, test performance, subject
+# performance) of an IngestionJob, run synchronously by upload_and_process_data and by
+# the background ingestion worker.
+import json
+import logging
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from django.db import transaction
+from django.db.models import Count
+
+from excelhandler.models import Test, IngestionJob, IngestionRun, StudentTestPerformance
+from .bulk_load import FACT_BATCH_SIZE
+from .dimensions import _DimensionCache, _create_staged_dimensions
+from .instrumentation import _PhaseMetrics
+from .fingerprints import (
+    _UploadFingerprints, _response_fingerprints, _answer_key_fingerprints,
+)
+from .row_readers import _RowIndex, _cell, _iter_upload_rows
+from .scoring import _load_answer_key
+from .parallel import _run_partitions
+from .validation import (
+    _ValidationReport, _ResponseChecks, _AnswerKeyChecks, _file_checks, _upload_report,
+)
+from .staging import (
+    _IngestionCheckpoint, _stage_tests, _stage_students, _stage_answer_sheets, _stage_questions, _staged_test_codes,
+    _staged_sheet_counts, _discard_staging, _discard_staged_slices, _publish_test,
+)
+
+logger = logging.getLogger('excelhandler.ingestion')
+
+
+class _IngestionInputError(ValueError):
+    """Raised when an uploaded file cannot be ingested at all (e.g. it is empty)."""
+
+
+class _IngestionValidationError(_IngestionInputError):
+    """
+    Raised when an upload fails validation (see validation.py), which ingestion runs in
+    the pass that stages the files: nothing is published and the staged rows are dropped.
+    Carries the report.
+    """
+
+    def __init__(self, report):
+        counts = ', '.join(f"{count} {code}" for code, count in sorted(report['error_counts'].items()))
+        super().__init__(f"Validation found {report['error_count']} errors ({counts}); nothing was loaded.")
+        self.report = report
+
+
+def _check_validation(report):
+    """Prints the outcome of a validation and raises _IngestionValidationError when it failed."""
+    files = ', '.join(f"{file['file']} ({file['rows']} rows)" for file in report['files'])
+    print(f"Validated {files or 'no files'} in {report['seconds']:.2f}s: {report['error_count']} errors, {report['warning_count']} warnings.")
+    for issue in report['warnings']:
+        print(f"    Warning: {issue['message']} ({issue['file'] or 'upload'}: {issue['value']})")
+    for issue in report['errors']:
+        row = f" row {issue['row']}" if issue['row'] else ''
+        print(f"    Error: {issue['message']} ({issue['file']}{row}: {issue['value']})")
+    if not report['valid']:
+        raise _IngestionValidationError(report)
+
+
+class _IngestionProgress:
+    """
+    Receives progress notifications from the pipeline: the phase being run and the
+    number of rows handled in it. Subclasses persist or report them.
+    """
+
+    def __init__(self):
+        self.phase = None
+        self.rows_processed = 0
+        self._phase_started = time.perf_counter()
+        self.metrics = _PhaseMetrics()
+
+    def start_phase(self, phase):
+        self.metrics.finish_phase(self.rows_processed)
+        self.phase = phase
+        self.rows_processed = 0
+        self._phase_started = time.perf_counter()
+        self.metrics.start_phase(phase)
+
+    def finish(self):
+        self.metrics.finish_phase(self.rows_processed)
+
+    def add_rows(self, count):
+        self.rows_processed += count
+
+    @property
+    def rows_per_sec(self):
+        elapsed = time.perf_counter() - self._phase_started
+        return self.rows_processed / elapsed if elapsed > 0 else 0.0
+
+
+# One SR/AK file pair to ingest and the names used for it in messages. A single upload is
+# one pair; a multi-test archive (see archives.py) yields one pair per SR/AK member pair.
+_FilePair = namedtuple('_FilePair', ['sr_name', 'sr_file', 'ak_name', 'ak_file'])
+
+
+# One parsed SR.csv row. Only rows that passed validation (see validation.py) are parsed,
+# so every key is present and every option and date is well-formed.
+_ResponseRow = namedtuple('_ResponseRow', [
+    'institution_name', 'batch_name', 'sturecid', 'student_defaults',
+    'test_code', 'test_type', 'test_date', 'selected_options',
+])
+
+
+def _parse_response_row(row, row_index, answer_positions):
+    """Parses an SR.csv data row that passed validation into a _ResponseRow; empty answers read as 0."""
+    test_date_str = row_index.get(row, 'exdate', '').strip()
+    selected_options = []
+    for position in answer_positions:
+        selected_option_val = _cell(row, position, '').strip()
+        selected_options.append(int(float(selected_option_val)) if selected_option_val else 0)
+    return _ResponseRow(
+        institution_name=row_index.get(row, 'Institution').strip(),
+        batch_name=row_index.get(row, 'Batch').strip(),
+        sturecid=int(row_index.get(row, 'sturecid')),
+        student_defaults={
+            'name': row_index.get(row, 'sname', ''),
+            'student_class': row_index.get(row, 'class', ''),
+            'section': row_index.get(row, 'sec'),
+            'claid': row_index.get(row, 'claid'),
+        },
+        test_code=row_index.get(row, 'testid').strip(),
+        test_type=row_index.get(row, 'subject', '').split(' - ')[0].strip(),
+        test_date=datetime.strptime(test_date_str, "%d-%m-%Y").date() if test_date_str else None,
+        selected_options=selected_options,
+    )
+
+
+def _iter_response_batches(sr_reader, headers, progress, check_row, start_row=0):
+    """
+    Parses the data rows of an SR.csv reader and yields them in lists of up to
+    FACT_BATCH_SIZE _ResponseRows, each with the number of the last row it covers, so
+    dimensions and facts are staged in set-based batches. Every row read is passed to
+    `check_row(row_num, row)` first (validation and fingerprinting); rows it rejects
+    and rows up to `start_row` (already staged by an earlier attempt) are not parsed.
+    Counts every row read on `progress`.
+    """
+    row_index = _RowIndex(headers)
+    answer_positions = [row_index.position(f'a{i}') for i in range(1, 181)]
+    pending_rows = []
+    row_num = start_row
+    for row_num, row in enumerate(sr_reader, start=1):
+        progress.add_rows(1)
+        if not check_row(row_num, row) or row_num <= start_row:
+            continue
+        try:
+            pending_rows.append(_parse_response_row(row, row_index, answer_positions))
+        except Exception as e:
+            print(f"Error processing SR.csv row {row_num}: {e} (Row data: {row})")
+            raise
+        if len(pending_rows) >= FACT_BATCH_SIZE:
+            yield pending_rows, row_num
+            pending_rows = []
+    if pending_rows:
+        yield pending_rows, row_num
+
+
+def _stage_response_rows(job, parsed_rows, dimensions):
+    """Stages the students, tests and answer sheets of a batch of parsed rows."""
+    _stage_students(job, dimensions.new_students(parsed_rows))
+    _stage_tests(job, dimensions.latest_test_values(parsed_rows))
+    return _stage_answer_sheets(job, {(parsed_row.sturecid, parsed_row.test_code): parsed_row.selected_options for parsed_row in parsed_rows})
+
+
+def _run_ingestion(job, file_pairs, progress=None):
+    """
+    Runs the ingestion phases for the SR/AK file pairs (_FilePair) of an IngestionJob and
+    returns the result summary. Every pair is staged before any test is published, so a
+    test is scored and ranked once however many pairs hold its rows. Rows are staged in committed chunks and every test is published in
+    its own short transaction, with a checkpoint on the job after each chunk, phase and
+    test; running a failed job again resumes from its checkpoint (see staging.py).
+    Scoring, totals and ranks are recomputed only for the tests present in the upload
+    unless job.full_rebuild is set, in which case every test is recomputed. With
+    job.workers > 1 tests are published by a pool of processes (see parallel.py). With
+    job.replace_test_code only that test is loaded, and everything stored for it is
+    replaced when it is published. A job.rebuild_only job reads no files and rebuilds
+    every stored test instead (see _run_rebuild). Each file is read once: its rows are
+    validated (see validation.py) and fingerprinted as they are staged, and nothing is
+    published when validation finds errors: _IngestionValidationError carries the report
+    of a rejected upload, and _IngestionInputError is raised for unusable files.
+
+    Per-phase metrics are returned under 'metrics', logged as one structured record on
+    the 'excelhandler.ingestion' logger and kept in IngestionRun, for failed runs too.
+    """
+    progress = progress or _IngestionProgress()
+    started = time.perf_counter()
+    try:
+        with progress.metrics.collect():
+            try:
+                result = _run_rebuild(job, progress) if job.rebuild_only else _run_phases(job, file_pairs, progress)
+            finally:
+                progress.finish()
+    except Exception as e:
+        _record_ingestion_run(progress.metrics.summary(), time.perf_counter() - started, job.full_rebuild, job.workers, error=e)
+        raise
+    result['metrics'] = progress.metrics.summary()
+    _record_ingestion_run(result['metrics'], time.perf_counter() - started, job.full_rebuild, job.workers, result=result)
+    return result
+
+
+def _record_ingestion_run(metrics, wall_seconds, full_rebuild, workers, result=None, error=None):
+    """Logs the metrics of a finished run as one JSON record and stores it in IngestionRun."""
+    record = {
+        'status': IngestionRun.STATUS_FAILED if error else IngestionRun.STATUS_SUCCEEDED,
+        'full_rebuild': full_rebuild,
+        'workers': workers,
+        'student_responses_written': result['student_responses_written'] if result else 0,
+        'wall_seconds': round(wall_seconds, 3),
+        'metrics': metrics,
+    }
+    logger.info("ingestion_run %s", json.dumps(record))
+    IngestionRun.objects.create(
+        **record,
+        result={key: value for key, value in result.items() if key != 'metrics'} if result else None,
+        error=str(error) if error else '',
+    )
+
+
+def _discard_upload(job, checkpoint):
+    """Drops everything a rejected upload staged; the files will not load, so the job keeps nothing to resume."""
+    with transaction.atomic():
+        _discard_staging(job)
+        checkpoint.save(sr_pairs_staged=0, sr_rows_staged=0, ak_pairs_staged=0, responses_staged=False, answer_key_staged=False)
+
+
+def _run_phases(job, file_pairs, progress):
+    """
+    Body of _run_ingestion: one pass over the files that validates, fingerprints and
+    stages them (Phases 1-2), then publishing (Phases 3-5).
+    """
+    started = time.perf_counter()
+    checkpoint = _IngestionCheckpoint(job)
+    if checkpoint.resumed:
+        print(
+            f"Resuming ingestion job {job.pk}: {checkpoint['sr_pairs_staged']} file pairs and {checkpoint['sr_rows_staged']} SR rows "
+            f"staged, {len(checkpoint['tests_published'])} tests published."
+        )
+
+    # Each file is read once, while it is still arriving (see uploads.py): every row is
+    # validated and fingerprinted as it streams past, and staged while the upload is valid.
+    # Nothing is published unless the whole upload passes validation. Rows are parsed
+    # incrementally and never held in memory as a whole.
+    pass_started = time.perf_counter()
+    report = _ValidationReport()
+
+    # --- PHASE 1: Stage SR.csv (Student Responses & Core Data), one committed chunk per batch ---
+    print("\n--- PHASE 1: Loading SR.csv (Student Responses & Core Data) ---")
+    progress.start_phase('phase1_load_responses')
+    phase1_started = time.perf_counter()
+    sheets_staged = 0
+    seen_pairs, response_test_codes, response_fingerprints = {}, set(), []
+    dimensions = _DimensionCache()
+    for pair_number, pair in enumerate(file_pairs):
+        sr_reader = _iter_upload_rows(pair.sr_file)
+        headers = next(sr_reader, None)
+        checks = _file_checks(report, pair.sr_name, headers, _ResponseChecks, seen_pairs)
+        if checks is None:
+            continue
+        fingerprints = _response_fingerprints(headers)
+        # Pairs and rows staged by an earlier attempt are read again, but only checked and fingerprinted.
+        already_staged = checkpoint['responses_staged'] or pair_number < checkpoint['sr_pairs_staged']
+        start_row = checkpoint['sr_rows_staged'] if pair_number == checkpoint['sr_pairs_staged'] else 0
+        print(f"Streaming rows from {pair.sr_name}{'' if already_staged else f', staging from row {start_row + 1}'}...")
+
+        def check_row(row_num, row):
+            valid = checks.check(row_num, row)
+            fingerprints.add(row)
+            # After the first error nothing will be published, so only the report is completed.
+            return valid and report.valid and not already_staged
+
+        batches = _iter_response_batches(sr_reader, headers, progress, check_row, start_row=start_row)
+        for parsed_rows, last_row_num in batches:
+            if not report.valid:
+                continue
+            with transaction.atomic():
+                sheets_staged += _stage_response_rows(job, parsed_rows, dimensions)
+                checkpoint.save(sr_rows_staged=last_row_num)
+        response_test_codes |= checks.finish()
+        response_fingerprints.append(fingerprints.digests())
+        if report.valid and not already_staged:
+            with transaction.atomic():
+                checkpoint.save(sr_pairs_staged=pair_number + 1, sr_rows_staged=0)
+    if report.valid and not checkpoint['responses_staged']:
+        with transaction.atomic():
+            checkpoint.save(responses_staged=True)
+    phase1_seconds = time.perf_counter() - phase1_started
+    sr_rows_per_sec = progress.rows_processed / phase1_seconds if phase1_seconds > 0 else 0.0
+    print(f"--- PHASE 1: SR.csv staged. Read {progress.rows_processed} rows, staged {sheets_staged} answer sheets in {phase1_seconds:.2f}s ({sr_rows_per_sec:.0f} rows/sec). ---")
+
+    # --- PHASE 2: Stage AK.csv (Answer Key); answer keys are small, so one chunk per file ---
+    print("\n--- PHASE 2: Loading AK.csv (Answer Key) ---")
+    progress.start_phase('phase2_load_answer_key')
+    seen_questions, answer_key_rows, answer_key_fingerprints = {}, [], []
+    staged_test_codes = _staged_test_codes(job)
+    for pair_number, pair in enumerate(file_pairs):
+        ak_reader = _iter_upload_rows(pair.ak_file)
+        headers = next(ak_reader, None)
+        checks = _file_checks(report, pair.ak_name, headers, _AnswerKeyChecks, seen_questions)
+        if checks is None:
+            continue
+        fingerprints = _answer_key_fingerprints(headers)
+
+        def checked_rows():
+            for row_num, row in enumerate(ak_reader, start=1):
+                checks.check(row_num, row)
+                fingerprints.add(row)
+                yield row
+
+        print(f"Streaming rows from {pair.ak_name}...")
+        if not report.valid or checkpoint['answer_key_staged'] or pair_number < checkpoint['ak_pairs_staged']:
+            for _ in checked_rows():
+                pass
+        else:
+            with transaction.atomic():
+                answer_key_test_codes, questions_staged = _load_answer_key(
+                    checked_rows(), progress=progress, pending_test_codes=staged_test_codes,
+                    upsert_questions=lambda pending_questions: _stage_questions(job, pending_questions),
+                )
+                checkpoint.save(ak_pairs_staged=pair_number + 1, answer_key_staged=pair_number + 1 == len(file_pairs))
+            print(f"--- PHASE 2: {pair.ak_name} staged. {questions_staged} questions for {len(answer_key_test_codes)} tests. ---")
+        answer_key_rows.append((pair.ak_name, checks.finish()))
+        answer_key_fingerprints.append(fingerprints.digests())
+
+    validation = _upload_report(report, response_test_codes, answer_key_rows, pass_started)
+    if not validation['valid']:
+        _discard_upload(job, checkpoint)
+    _check_validation(validation)
+
+    upload_fingerprints = _UploadFingerprints(
+        response_fingerprints, answer_key_fingerprints, ignore_stored=job.full_rebuild, replace_test_code=job.replace_test_code,
+    )
+    if job.replace_test_code and job.replace_test_code not in upload_fingerprints.responses:
+        _discard_upload(job, checkpoint)
+        raise _IngestionInputError(f"SR.csv has no rows for test '{job.replace_test_code}', so it cannot replace it.")
+
+    # Phases 3-5 only recompute the tests this upload touched (new/changed responses or
+    # answer keys); every other test's scores, totals and ranks are already current.
+    if checkpoint['tests_to_publish'] is None:
+        # Fingerprints are complete only once every row has been read, so the rows staged for
+        # unchanged content are dropped now. No test is published before this point, so the
+        # stored fingerprints are still those the upload is compared with.
+        with transaction.atomic():
+            _discard_staged_slices(job, upload_fingerprints.unchanged_responses, upload_fingerprints.unchanged_answer_keys)
+            # The upload passed validation, so its institutions, batches and students can exist now.
+            _create_staged_dimensions(job)
+            touched_test_codes = _staged_test_codes(job)
+            checkpoint.save(
+                skipped_test_codes=sorted(upload_fingerprints.skipped_test_codes),
+                tests_reloaded=len(upload_fingerprints.test_codes - upload_fingerprints.skipped_test_codes),
+                tests_touched=sorted(touched_test_codes),
+                tests_to_publish=sorted(_scoped_test_codes(touched_test_codes, job.full_rebuild)),
+            )
+    if checkpoint['skipped_test_codes']:
+        print(f"Skipping {len(checkpoint['skipped_test_codes'])} unchanged tests: {', '.join(checkpoint['skipped_test_codes'])}")
+
+    # --- PHASES 3-5: Publish each test: responses, scores, totals and ranks in one transaction ---
+    published = set(checkpoint['tests_published'])
+    pending_test_codes = [test_code for test_code in checkpoint['tests_to_publish'] if test_code not in published]
+    sheet_counts = _staged_sheet_counts(job)
+    # Large tests go first so, with several workers, they do not end up running alone at the end.
+    pending_test_codes.sort(key=lambda test_code: (-sheet_counts.get(test_code, 0), test_code))
+    print(f"\n--- PHASES 3-5: Publishing {len(pending_test_codes)} tests with {job.workers} workers ---")
+    progress.start_phase('phase3_5_publish_tests')
+
+    def record_published(result):
+        checkpoint.published(result)
+        progress.add_rows(result['student_responses_written'])
+
+    partition_results = _run_partitions(
+        _publish_test,
+        [
+            (test_code, job.pk, upload_fingerprints.changed_fields(test_code), test_code == job.replace_test_code)
+            for test_code in pending_test_codes
+        ],
+        job.workers,
+        on_result=record_published,
+    )
+    # Rows staged for tests that were not published (e.g. an answer key skipped as unchanged).
+    _discard_staging(job)
+
+    wall_seconds = time.perf_counter() - started
+    print(f"\n✅ All data loaded successfully in {wall_seconds:.2f}s. Check server console for details.")
+    result = {
+        'status': 'success',
+        'message': 'All data loaded successfully.',
+        'job_id': job.pk,
+        'resumed': checkpoint.resumed,
+        'student_responses_written': checkpoint['student_responses_written'],
+        'phase1_rows_per_sec': round(sr_rows_per_sec, 1),
+        'tests_touched': checkpoint['tests_touched'],
+        'tests_recomputed': len(checkpoint['tests_to_publish']),
+        'full_rebuild': job.full_rebuild,
+        'replaced_test_code': job.replace_test_code or None,
+        'tests_skipped': len(checkpoint['skipped_test_codes']),
+        'tests_reloaded': checkpoint['tests_reloaded'],
+        'skipped_test_codes': checkpoint['skipped_test_codes'],
+        'workers': job.workers,
+        'file_pairs': [[pair.sr_name, pair.ak_name] for pair in file_pairs],
+        'wall_seconds': round(wall_seconds, 2),
+    }
+    if job.workers > 1:
+        result['partitions'] = partition_results
+    return result
+
+
+def _run_rebuild(job, progress):
+    """
+    Body of _run_ingestion for a rebuild_only job: recomputes the correctness, scores,
+    totals, subject totals and ranks of every stored test from its responses and answer
+    key. Each test goes through the normal publishing path with nothing staged, so it is
+    rescored in staging and merged in its own short transaction (only changed rows are
+    written) and readers keep being served while the rebuild runs. Tests run in parallel
+    with job.workers processes, largest first, and the job resumes from its checkpoint.
+    """
+    started = time.perf_counter()
+    checkpoint = _IngestionCheckpoint(job)
+    if checkpoint['tests_to_publish'] is None:
+        with transaction.atomic():
+            checkpoint.save(
+                responses_staged=True, answer_key_staged=True,
+                tests_to_publish=sorted(Test.objects.values_list('test_code', flat=True)),
+            )
+    elif checkpoint.resumed:
+        print(f"Resuming rebuild job {job.pk}: {len(checkpoint['tests_published'])} of {len(checkpoint['tests_to_publish'])} tests rebuilt.")
+
+    published = set(checkpoint['tests_published'])
+    pending_test_codes = [test_code for test_code in checkpoint['tests_to_publish'] if test_code not in published]
+    student_counts = dict(
+        StudentTestPerformance.objects.values('test_id').annotate(students=Count('id')).values_list('test_id', 'students')
+    )
+    pending_test_codes.sort(key=lambda test_code: (-student_counts.get(test_code, 0), test_code))
+    students_pending = sum(student_counts.get(test_code, 0) for test_code in pending_test_codes)
+    print(f"\n--- REBUILD: Recomputing {len(pending_test_codes)} tests ({students_pending} students) with {job.workers} workers ---")
+    progress.start_phase('rebuild_derived_tables')
+    rebuild_started = time.perf_counter()
+    students_done = 0
+
+    def record_published(result):
+        nonlocal students_done
+        checkpoint.published(result)
+        progress.add_rows(result['student_responses_scored'])
+        students_done += result['performance_records']
+        elapsed = time.perf_counter() - rebuild_started
+        remaining = elapsed / students_done * max(students_pending - students_done, 0) if students_done else 0.0
+        print(
+            f"    Rebuilt {len(checkpoint['tests_published'])}/{len(checkpoint['tests_to_publish'])} tests: "
+            f"{progress.rows_processed} responses scored ({progress.rows_per_sec:.0f} responses/sec), ~{remaining:.0f}s left."
+        )
+
+    partition_results = _run_partitions(
+        _publish_test,
+        [(test_code, job.pk, {}, False) for test_code in pending_test_codes],
+        job.workers,
+        on_result=record_published,
+    )
+    _discard_staging(job)
+
+    wall_seconds = time.perf_counter() - started
+    print(f"\n✅ Rebuilt {len(pending_test_codes)} tests in {wall_seconds:.2f}s ({progress.rows_per_sec:.0f} responses/sec).")
+    result = {
+        'status': 'success',
+        'message': 'Derived tables rebuilt.',
+        'job_id': job.pk,
+        'resumed': checkpoint.resumed,
+        'rebuild_only': True,
+        'student_responses_written': checkpoint['student_responses_written'],
+        'student_responses_scored': progress.rows_processed,
+        'student_responses_rescored': sum(result['student_responses_rescored'] for result in partition_results),
+        'ranks_updated': sum(result['ranks_updated'] for result in partition_results),
+        'subject_ranks_updated': sum(result['subject_ranks_updated'] for result in partition_results),
+        'responses_per_sec': round(progress.rows_per_sec, 1),
+        'tests_recomputed': len(checkpoint['tests_to_publish']),
+        'workers': job.workers,
+        'wall_seconds': round(wall_seconds, 2),
+    }
+    if job.workers > 1:
+        result['partitions'] = partition_results
+    return result
+
+
+def _scoped_test_codes(touched_test_codes, full_rebuild):
+    """The tests whose derived data must be recomputed: the touched ones, or all of them on a full rebuild."""
+    if full_rebuild:
+        scoped_test_codes = set(Test.objects.values_list('test_code', flat=True)) | touched_test_codes
+        print(f"\nFull rebuild requested: recomputing derived data for all {len(scoped_test_codes)} tests.")
+    else:
+        scoped_test_codes = touched_test_codes
+        print(f"\nRecomputing derived data for {len(scoped_test_codes)} touched tests: {', '.join(sorted(scoped_test_codes)) or 'none'}")
+    return scoped_test_codes
+
+
+def _run_answer_key_update(ak_file):
+    """
+    Applies a corrected AK.csv to tests that are already loaded, through the ingestion
+    publishing path: one pass over the file validates, fingerprints and stages the answer
+    key, then each test it touches is rescored in staging and published in its own short
+    transaction (see _publish_test) with its totals, subject scores, ranks, response cube
+    cells and answer key fingerprint. Cost depends on the size of those tests, not of the
+    whole fact table, and readers of other tests are never blocked. Raises
+    _IngestionValidationError, before any live write, for a file that fails validation
+    (e.g. empty, or keys for tests that are not loaded).
+    """
+    started = time.perf_counter()
+    # A scratch job only owns the staged rows; deleting it drops whatever is still staged.
+    job = IngestionJob.objects.create(status=IngestionJob.STATUS_SCRATCH)
+    try:
+        checkpoint = _IngestionCheckpoint(job)
+        checkpoint.save()
+        report = _ValidationReport()
+        ak_reader = _iter_upload_rows(ak_file)
+        headers = next(ak_reader, None)
+        checks = _file_checks(report, 'AK.csv', headers, _AnswerKeyChecks, {})
+        answer_key_rows, answer_key_fingerprints = [], {}
+        test_codes, questions_written = set(), 0
+        if checks is not None:
+            fingerprints = _answer_key_fingerprints(headers)
+
+            def checked_rows():
+                for row_num, row in enumerate(ak_reader, start=1):
+                    checks.check(row_num, row)
+                    fingerprints.add(row)
+                    yield row
+
+            print("\n--- Answer key update: staging AK.csv ---")
+            with transaction.atomic():
+                test_codes, questions_written = _load_answer_key(
+                    checked_rows(), upsert_questions=lambda pending_questions: _stage_questions(job, pending_questions),
+                )
+            answer_key_rows.append(('AK.csv', checks.finish()))
+            answer_key_fingerprints = fingerprints.digests()
+        _check_validation(_upload_report(report, set(), answer_key_rows, started))
+        print(f"    Staged {questions_written} questions for tests: {', '.join(sorted(test_codes)) or 'none'}")
+
+        with transaction.atomic():
+            checkpoint.save(tests_touched=sorted(test_codes), tests_to_publish=sorted(test_codes))
+        # Storing the fingerprint keeps later full uploads from mistaking the previous answer key for the current one.
+        results = _run_partitions(
+            _publish_test,
+            [(test_code, job.pk, {'answer_key_fingerprint': answer_key_fingerprints[test_code]}) for test_code in sorted(test_codes)],
+            job.workers,
+            on_result=checkpoint.published,
+        )
+    finally:
+        job.delete()
+
+    def total(key):
+        return sum(result[key] for result in results)
+
+    print(f"    Rescored {total('student_responses_rescored')} Student Responses.")
+    print(f"    Refreshed {total('performance_records')} test and {total('subject_performance_records')} subject performance records.")
+    print(f"    Refreshed {total('response_cube_cells')} response cube cells.")
+    elapsed = time.perf_counter() - started
+    print(f"--- Answer key update complete in {elapsed:.2f}s. ---")
+    return {
+        'status': 'success',
+        'message': 'Answer key applied successfully.',
+        'tests_rescored': sorted(test_codes),
+        'questions_written': questions_written,
+        'student_responses_rescored': total('student_responses_rescored'),
+        'performance_records_refreshed': total('performance_records'),
+        'ranks_updated': total('ranks_updated'),
+        'subject_performance_records_refreshed': total('subject_performance_records'),
+        'subject_ranks_updated': total('subject_ranks_updated'),
+        'response_cube_cells_refreshed': total('response_cube_cells'),
+        'elapsed_seconds': round(elapsed, 2),
+    }
@@ -0,0 +1,56 @@
+# response_cube.py
+# Pre-aggregated response counts for the dashboard. ResponseCube keeps, per test and per
+# (class, section, subject tag) of its responses, how many were attempted, correct,
+# incorrect and delivered. A test's cells are recomputed from its stored responses in the
+# transaction that changes them (publishing, answer key updates), so the accuracy and
+# attempt-rate metrics sum a few hundred cells instead of aggregating every response.
+from django.db import connection
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+
+from excelhandler.models import Student, Question, ResponseCube
+from .response_store import _response_table
+from .filters import _apply_filters_to_cube_queryset
+
+_CUBE_TABLE = ResponseCube._meta.db_table
+
+
+def _refresh_response_cube(test_codes):
+    """Replaces the cube cells of `test_codes` with counts of their stored responses. Returns the cells written."""
+    test_codes = sorted(set(test_codes))
+    if not test_codes:
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {_CUBE_TABLE} WHERE test_id = ANY(%s)", [test_codes])
+        # Responses to questions missing from the answer key count under a NULL subject tag.
+        cursor.execute(
+            f"""
+            INSERT INTO {_CUBE_TABLE} (test_id, student_class, section, subject_tag, attempted, correct, incorrect, total)
+            SELECT r.test_code_id, s.student_class, s.section, q.subject_tag,
+                   count(*) FILTER (WHERE r.selected_option > 0),
+                   count(*) FILTER (WHERE r.selected_option > 0 AND r.is_correct),
+                   count(*) FILTER (WHERE r.selected_option > 0 AND r.is_correct IS NOT TRUE),
+                   count(*)
+            FROM {_response_table()} AS r
+            JOIN {Student._meta.db_table} AS s ON s.sturecid = r.sturecid_id
+            LEFT JOIN {Question._meta.db_table} AS q
+                ON q.test_code_id = r.test_code_id AND q.question_number = r.question_number
+            WHERE r.test_code_id = ANY(%s)
+            GROUP BY r.test_code_id, s.student_class, s.section, q.subject_tag
+            """,
+            [test_codes],
+        )
+        return cursor.rowcount
+
+
+def _response_cube_totals(request):
+    """
+    Sums the cube cells that match the dashboard filters of `request`: the distinct tests
+    with responses, and the attempted, correct and total responses among them.
+    """
+    return _apply_filters_to_cube_queryset(ResponseCube.objects.all(), request).aggregate(
+        tests=Count('test', distinct=True),
+        attempted=Coalesce(Sum('attempted'), 0),
+        correct=Coalesce(Sum('correct'), 0),
+        total=Coalesce(Sum('total'), 0),
+    )
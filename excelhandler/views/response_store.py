@@ -0,0 +1,34 @@
+# response_store.py
+# Selects where student responses are stored (settings.RESPONSE_STORAGE). With 'rows'
+# every answer is a StudentResponse row; with 'sheets' every (student, test) attempt is
+# one StudentAnswerSheet row of packed arrays, and readers go through the
+# UnpackedStudentResponse view, which has the same columns as StudentResponse.
+from django.conf import settings
+
+from excelhandler.models import StudentResponse, StudentAnswerSheet, UnpackedStudentResponse
+
+RESPONSE_STORAGE_ROWS = 'rows'
+RESPONSE_STORAGE_SHEETS = 'sheets'
+
+
+def _uses_answer_sheets():
+    return settings.RESPONSE_STORAGE == RESPONSE_STORAGE_SHEETS
+
+
+def _response_model():
+    """The model to read per-question responses from: StudentResponse or its view over the sheets."""
+    return UnpackedStudentResponse if _uses_answer_sheets() else StudentResponse
+
+
+def _response_queryset():
+    return _response_model().objects.all()
+
+
+def _response_table():
+    """Table (or view) with sturecid_id, test_code_id, question_number, selected_option, is_correct, score_awarded."""
+    return _response_model()._meta.db_table
+
+
+def _response_query_name():
+    """Reverse lookup from Student/Test to the stored responses, e.g. for `<name>__sturecid__in` filters."""
+    return StudentAnswerSheet._meta.model_name if _uses_answer_sheets() else StudentResponse._meta.model_name
@@ -0,0 +1,169 @@
+# row_readers.py
+# Incremental readers for the SR/AK uploads: CSV files are consumed in bounded chunks and
+# .xlsx workbooks through openpyxl's read-only mode, both parsed row by row, so memory use
+# does not grow with the size of the upload.
+import codecs
+import csv
+import io
+import mmap
+from contextlib import contextmanager
+from datetime import date
+
+from openpyxl import load_workbook
+
+CSV_ENCODING = 'ISO-8859-1'
+READ_CHUNK_SIZE = 64 * 1024
+XLSX_EXTENSIONS = ('.xlsx', '.xlsm')
+# Date cells are rendered like the exdate column of the CSV exports.
+XLSX_DATE_FORMAT = '%d-%m-%Y'
+_ZIP_SIGNATURE = b'PK\x03\x04'
+
+
+def _iter_upload_chunks(uploaded_file, chunk_size=READ_CHUNK_SIZE):
+    """Yields the raw bytes of an uploaded (or opened) file in chunks of at most `chunk_size`."""
+    # Like File.chunks(), reading always starts from the beginning so a file can be streamed twice.
+    if hasattr(uploaded_file, 'chunks'):
+        yield from uploaded_file.chunks(chunk_size)
+        return
+    if hasattr(uploaded_file, 'seek'):
+        uploaded_file.seek(0)
+    while True:
+        chunk = uploaded_file.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+class _MappedFile(io.RawIOBase):
+    """Read-only, seekable file object over a memory-mapped file on disk."""
+
+    def __init__(self, path, mapped):
+        super().__init__()
+        self.name = path
+        self._mapped = mapped
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._mapped.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self._mapped.seek(offset, whence)
+        return self._mapped.tell()
+
+    def tell(self):
+        return self._mapped.tell()
+
+
+@contextmanager
+def _open_mapped(path):
+    """
+    Opens a file on disk as a read-only memory map, usable wherever an uploaded file is:
+    pages are read by the OS as the parser advances instead of being buffered up front.
+    An empty file (which cannot be mapped) is returned as an empty buffer.
+    """
+    with open(path, 'rb') as disk_file:
+        if not disk_file.seek(0, io.SEEK_END):
+            yield io.BytesIO()
+            return
+        with mmap.mmap(disk_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield _MappedFile(path, mapped)
+
+
+def _iter_text_lines(chunks, encoding=CSV_ENCODING):
+    """
+    Decodes a stream of byte chunks and yields complete lines (newline included).
+    Only the unfinished tail of the current chunk is carried over to the next one.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    pending = ''
+    for chunk in chunks:
+        lines = (pending + decoder.decode(chunk)).split('\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line + '\n'
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending
+
+
+def _iter_csv_rows(uploaded_file, encoding=CSV_ENCODING):
+    """Streams an uploaded CSV file as lists of cell values, header row first."""
+    return csv.reader(_iter_text_lines(_iter_upload_chunks(uploaded_file), encoding))
+
+
+def _is_xlsx(uploaded_file):
+    """True for .xlsx uploads: by file name, or by the zip signature when the file has no name."""
+    name = getattr(uploaded_file, 'name', None)
+    if name:
+        return name.lower().endswith(XLSX_EXTENSIONS)
+    uploaded_file.seek(0)
+    signature = uploaded_file.read(len(_ZIP_SIGNATURE))
+    uploaded_file.seek(0)
+    return signature == _ZIP_SIGNATURE
+
+
+def _xlsx_cell_text(value):
+    """Renders a worksheet cell value as the text the same cell has in a CSV export."""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, date):
+        return value.strftime(XLSX_DATE_FORMAT)
+    return str(value)
+
+
+def _iter_xlsx_rows(uploaded_file):
+    """
+    Streams the first worksheet of an .xlsx upload as lists of cell texts, header row
+    first. Read-only mode parses the sheet XML incrementally instead of building the
+    whole workbook in memory. Entirely empty rows are skipped.
+    """
+    uploaded_file.seek(0)
+    workbook = load_workbook(uploaded_file, read_only=True, data_only=True)
+    try:
+        for values in workbook.worksheets[0].iter_rows(values_only=True):
+            row = [_xlsx_cell_text(value) for value in values]
+            if any(row):
+                yield row
+    finally:
+        workbook.close()
+
+
+def _iter_upload_rows(uploaded_file):
+    """Streams an SR/AK upload (.xlsx workbook or CSV file) as lists of cell values, header row first."""
+    if _is_xlsx(uploaded_file):
+        return _iter_xlsx_rows(uploaded_file)
+    return _iter_csv_rows(uploaded_file)
+
+
+def _cell(row, position, default=None):
+    """Returns row[position], or `default` when the column is absent from the header or the row is short."""
+    if position is None or position >= len(row):
+        return default
+    return row[position]
+
+
+class _RowIndex:
+    """
+    Header-indexed access to CSV rows. Column positions are resolved once from the
+    header, so each data row stays a plain list instead of a per-row dict.
+    Behaves like dict(zip(headers, row)).get(name): duplicated headers resolve to
+    the last column and missing cells fall back to the default.
+    """
+
+    def __init__(self, headers):
+        self._positions = {name: position for position, name in enumerate(headers)}
+
+    def position(self, name):
+        return self._positions.get(name)
+
+    def get(self, row, name, default=None):
+        return _cell(row, self._positions.get(name), default)
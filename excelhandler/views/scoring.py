@@ -0,0 +1,103 @@
+# scoring.py
+# Answer-key loading and the per-test-type scoring policies applied by scoring_engine.py.
+import numpy as np
+from django.conf import settings
+
+from excelhandler.models import Test, Question
+
+class _ScoringPolicy:
+    """Marks awarded per response for a test type."""
+
+    def __init__(self, correct, incorrect, unattempted=0.0):
+        self.correct = float(correct)
+        self.incorrect = float(incorrect)
+        self.unattempted = float(unattempted)
+
+    def score(self, selected_options, is_correct):
+        """Vectorized: scores for arrays of selected options (0 = unattempted) and their correctness."""
+        return np.where(selected_options == 0, self.unattempted, np.where(is_correct, self.correct, self.incorrect))
+
+
+# NEET marking (+4 / -1 / 0), used for every test type without an entry in SCORING_POLICIES.
+DEFAULT_SCORING_POLICY = _ScoringPolicy(correct=4.0, incorrect=-1.0, unattempted=0.0)
+
+
+def _scoring_policy_for(test_type):
+    marks = settings.SCORING_POLICIES.get(test_type)
+    return _ScoringPolicy(**marks) if marks else DEFAULT_SCORING_POLICY
+
+
+# Number of distinct answer-key entries written per bulk upsert.
+ANSWER_KEY_BATCH_SIZE = 1000
+
+
+def _parse_answer_key_row(row):
+    """Returns (test_code, question_number, subject_tag, correct_option) for an AK.csv row."""
+    question_number_val = int(row[0].strip())
+    test_code_val = str(row[1]).strip()
+    subject_tag_val = str(row[2]).strip() if row[2].strip() else None
+    correct_option_val = int(float(row[3])) if row[3] and row[3].strip() else 0
+    return test_code_val, question_number_val, subject_tag_val, correct_option_val
+
+
+def _upsert_questions(pending_questions):
+    """Bulk upserts {(test_code, question_number): (subject_tag, correct_option)} into Question."""
+    questions = [
+        Question(test_code_id=test_code, question_number=question_number, subject_tag=subject_tag, correct_option=correct_option)
+        for (test_code, question_number), (subject_tag, correct_option) in pending_questions.items()
+    ]
+    Question.objects.bulk_create(
+        questions,
+        update_conflicts=True,
+        unique_fields=['test_code', 'question_number'],
+        update_fields=['correct_option', 'subject_tag'],
+    )
+    return {test_code for test_code, _ in pending_questions}, len(questions)
+
+
+def _load_answer_key(ak_reader, progress=None, pending_test_codes=frozenset(), upsert_questions=_upsert_questions):
+    """
+    Applies the data rows of an AK.csv reader (header already consumed) to Question.
+    Rows referencing a test that does not exist are skipped with a warning, malformed
+    rows are skipped, and for duplicated (test, question) rows the last one wins.
+    Tests in `pending_test_codes` (staged, not yet published) count as existing, and
+    `upsert_questions` replaces the Question upsert (e.g. to stage the rows instead).
+
+    Returns (set of test codes whose answer key was written, number of questions written).
+    """
+    known_test_codes = set()
+    warned_test_codes = set()
+    affected_test_codes = set()
+    questions_written = 0
+    pending_questions = {}
+    for row_num, row in enumerate(ak_reader, start=1):
+        if progress is not None:
+            progress.add_rows(1)
+        try:
+            test_code_val, question_number_val, subject_tag_val, correct_option_val = _parse_answer_key_row(row)
+        except ValueError as ve:
+            print(f"    Warning: Skipping AK.csv row {row_num} due to data type error: {ve} (Row data: {row})")
+            continue
+        except IndexError as ie:
+            print(f"    Warning: Skipping AK.csv row {row_num} due to missing columns: {ie} (Row data: {row}). Ensure at least 4 columns.")
+            continue
+        if test_code_val not in known_test_codes and test_code_val not in warned_test_codes:
+            if test_code_val in pending_test_codes or Test.objects.filter(test_code=test_code_val).exists():
+                known_test_codes.add(test_code_val)
+            else:
+                warned_test_codes.add(test_code_val)
+                print(f"    Warning: Test '{test_code_val}' from AK.csv row {row_num} not found in database (likely not in SR.csv). Cannot create Question without associated Test. Skipping its questions.")
+        if test_code_val in warned_test_codes:
+            continue
+        pending_questions[(test_code_val, question_number_val)] = (subject_tag_val, correct_option_val)
+        if len(pending_questions) >= ANSWER_KEY_BATCH_SIZE:
+            written_tests, written = upsert_questions(pending_questions)
+            affected_test_codes |= written_tests
+            questions_written += written
+            pending_questions = {}
+    if pending_questions:
+        written_tests, written = upsert_questions(pending_questions)
+        affected_test_codes |= written_tests
+        questions_written += written
+    return affected_test_codes, questions_written
+
@@ -0,0 +1,116 @@
+# scoring_engine.py
+# Vectorized scoring: a test's answer key is held as arrays and its responses as a
+# students x questions matrix, and correctness, scores, totals and per-subject totals are
+# computed with NumPy in one pass per test. staged_scoring.py runs it on staged tests.
+import numpy as np
+
+from .scoring import _scoring_policy_for
+
+
+class _ResponseMatrix:
+    """
+    The stored responses of one test as students x questions arrays; column i holds
+    question i + 1. `present` is False where a student has no response for a question.
+    `sheet_ids` holds the id of the answer sheet of each student row.
+    """
+
+    def __init__(self, sturecids, selected, present, is_correct, score_awarded, sheet_ids=None):
+        self.sturecids = sturecids
+        self.selected = selected
+        self.present = present
+        self.is_correct = is_correct
+        self.score_awarded = score_awarded
+        self.sheet_ids = sheet_ids
+
+    def widen(self, width):
+        """Pads the matrices with absent questions up to `width` columns."""
+        extra = width - self.selected.shape[1]
+        if extra > 0:
+            pad = ((0, 0), (0, extra))
+            self.selected = np.pad(self.selected, pad)
+            self.present = np.pad(self.present, pad)
+            self.is_correct = np.pad(self.is_correct, pad)
+            self.score_awarded = np.pad(self.score_awarded, pad)
+
+
+def _matrix_from_sheets(sheets):
+    """
+    Builds a _ResponseMatrix from (id, sturecid, selected_options, is_correct, score_awarded)
+    rows of packed answer sheets. NULL arrays read as not yet scored.
+    """
+    width = max((len(sheet[2]) for sheet in sheets), default=0)
+    selected, present, is_correct, score_awarded = _empty_matrices(len(sheets), width)
+    for row, (_, _, sheet_selected, sheet_correct, sheet_scores) in enumerate(sheets):
+        answers = len(sheet_selected)
+        selected[row, :answers] = sheet_selected
+        present[row, :answers] = True
+        # NULL (not yet scored) reads as incorrect, like in the UnpackedStudentResponse view.
+        if sheet_correct is not None:
+            is_correct[row, :answers] = [bool(value) for value in sheet_correct]
+        if sheet_scores is not None:
+            score_awarded[row, :answers] = sheet_scores
+    return _ResponseMatrix(
+        np.array([sheet[1] for sheet in sheets], dtype=np.int64),
+        selected, present, is_correct, score_awarded,
+        sheet_ids=np.array([sheet[0] for sheet in sheets], dtype=np.int64),
+    )
+
+
+def _empty_matrices(students, questions):
+    shape = (students, questions)
+    return (
+        np.zeros(shape, dtype=np.int16),
+        np.zeros(shape, dtype=bool),
+        np.zeros(shape, dtype=bool),
+        np.zeros(shape, dtype=np.float64),
+    )
+
+
+def _answer_key_arrays(questions):
+    """
+    Returns (correct_option, has_key, subject_tag) arrays indexed by question_number - 1
+    from (question_number, correct_option, subject_tag) rows.
+    """
+    width = max((question_number for question_number, _, _ in questions), default=0)
+    correct_options = np.zeros(width, dtype=np.int16)
+    has_key = np.zeros(width, dtype=bool)
+    subject_tags = np.full(width, None, dtype=object)
+    for question_number, correct_option, subject_tag in questions:
+        correct_options[question_number - 1] = correct_option
+        has_key[question_number - 1] = True
+        subject_tags[question_number - 1] = subject_tag or None
+    return correct_options, has_key, subject_tags
+
+
+def _pad(array, width):
+    return np.pad(array, (0, width - len(array))) if len(array) < width else array
+
+
+def _subject_totals(matrix, subject_tags):
+    """Yields (subject_tag, sturecids, subject_scores) over the students who answered each tagged subject."""
+    for tag in sorted({tag for tag in subject_tags if tag}):
+        columns = subject_tags == tag
+        answered = matrix.present[:, columns].any(axis=1)
+        subject_scores = np.where(matrix.present[:, columns], matrix.score_awarded[:, columns], 0.0).sum(axis=1)
+        yield tag, matrix.sturecids[answered], subject_scores[answered]
+
+
+def _rescore(matrix, test_type, correct_options, has_key, subject_tags):
+    """
+    Scores `matrix` in place against an answer key with the test type's scoring policy.
+    Returns (changed cells, has_key, subject_tags, per-student totals), the key arrays
+    padded to the matrix width.
+    """
+    policy = _scoring_policy_for(test_type)
+    width = max(matrix.selected.shape[1], len(correct_options))
+    matrix.widen(width)
+    correct_options, has_key, subject_tags = _pad(correct_options, width), _pad(has_key, width), _pad(subject_tags, width)
+
+    # Questions without an answer-key entry keep their stored correctness and score.
+    new_correct = np.where(has_key, matrix.selected == correct_options, matrix.is_correct)
+    new_scores = np.where(has_key, policy.score(matrix.selected, new_correct), matrix.score_awarded)
+    changed = matrix.present & ((new_correct != matrix.is_correct) | (new_scores != matrix.score_awarded))
+    matrix.is_correct, matrix.score_awarded = new_correct, new_scores
+    totals = np.where(matrix.present, matrix.score_awarded, 0.0).sum(axis=1)
+    return changed, has_key, subject_tags, totals
+
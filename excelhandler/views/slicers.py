@@ -11,7 +11,7 @@ from django.db.models.expressions import Subquery, OuterRef
 
 # Import all necessary models from your models.py
 from excelhandler.models import (
-    StudentResponse, Question, Test, Batch, Student, Institution
+    Question, Test, Batch, Student, Institution
 )
 
 # --- UPDATED IMPORT FOR SERIALIZERS ---
@@ -23,6 +23,7 @@ from excelhandler.serializers import (
     TestTypeSlicerSerializer,
     SubjectTagSlicerSerializer
 )
+from .response_store import _response_queryset, _response_query_name
 
 logger = logging.getLogger(__name__)
 
@@ -61,8 +62,8 @@ def _apply_filters_to_queryset(queryset, request_data, base_model_name):
             'test_code': 'test_code',
         },
         'Student': {
-            'institution_id': 'studentresponse__test_code__institution__id', # Student->StudentResponse->Test->Institution
-            'batch_id': 'studentresponse__test_code__batch__id',         # Student->StudentResponse->Test->Batch
+            'institution_id': f'{_response_query_name()}__test_code__institution__id', # Student->StudentResponse->Test->Institution
+            'batch_id': f'{_response_query_name()}__test_code__batch__id',         # Student->StudentResponse->Test->Batch
             'student_class': 'student_class',
             'section': 'section',
             'sturecid': 'sturecid',
@@ -113,11 +114,11 @@ def _apply_filters_to_queryset(queryset, request_data, base_model_name):
             # Filter these models by tests taken by students of this class
             student_sturecids_in_class = Student.objects.filter(student_class=request_data['class_name']).values('sturecid')
             if base_model_name == 'Test':
-                queryset = queryset.filter(studentresponse__sturecid__in=Subquery(student_sturecids_in_class)).distinct()
+                queryset = queryset.filter(**{f'{_response_query_name()}__sturecid__in': Subquery(student_sturecids_in_class)}).distinct()
             elif base_model_name == 'StudentResponse':
                 queryset = queryset.filter(sturecid__in=Subquery(student_sturecids_in_class))
             elif base_model_name == 'Question':
-                queryset = queryset.filter(test_code__studentresponse__sturecid__in=Subquery(student_sturecids_in_class)).distinct()
+                queryset = queryset.filter(**{f'test_code__{_response_query_name()}__sturecid__in': Subquery(student_sturecids_in_class)}).distinct()
 
     # Section Filter
     # Similar to class filter, applies to students first.
@@ -128,11 +129,11 @@ def _apply_filters_to_queryset(queryset, request_data, base_model_name):
             # Filter these models by tests taken by students of this section
             student_sturecids_in_section = Student.objects.filter(section=request_data['section_name']).values('sturecid')
             if base_model_name == 'Test':
-                queryset = queryset.filter(studentresponse__sturecid__in=Subquery(student_sturecids_in_section)).distinct()
+                queryset = queryset.filter(**{f'{_response_query_name()}__sturecid__in': Subquery(student_sturecids_in_section)}).distinct()
             elif base_model_name == 'StudentResponse':
                 queryset = queryset.filter(sturecid__in=Subquery(student_sturecids_in_section))
             elif base_model_name == 'Question':
-                queryset = queryset.filter(test_code__studentresponse__sturecid__in=Subquery(student_sturecids_in_section)).distinct()
+                queryset = queryset.filter(**{f'test_code__{_response_query_name()}__sturecid__in': Subquery(student_sturecids_in_section)}).distinct()
 
     # Test Type Filter
     if request_data.get('test_type') and request_data['test_type'].lower() != ALL_FILTER_VALUE:
@@ -234,7 +235,7 @@ class ClassListView(APIView):
             queryset = Student.objects.all()
 
             # Build a subquery for sturecids that match the institution/batch filters
-            student_id_subquery = StudentResponse.objects.values('sturecid').distinct()
+            student_id_subquery = _response_queryset().values('sturecid').distinct()
             
             if request_data.get('institution_id') and request_data['institution_id'].lower() != ALL_FILTER_VALUE:
                 student_id_subquery = student_id_subquery.filter(test_code__institution__id=int(request_data['institution_id']))
@@ -266,7 +267,7 @@ class SectionListView(APIView):
             queryset = Student.objects.all()
 
             # Build a subquery for sturecids that match the institution/batch/class filters
-            student_id_subquery = StudentResponse.objects.values('sturecid').distinct()
+            student_id_subquery = _response_queryset().values('sturecid').distinct()
             
             if request_data.get('institution_id') and request_data['institution_id'].lower() != ALL_FILTER_VALUE:
                 student_id_subquery = student_id_subquery.filter(test_code__institution__id=int(request_data['institution_id']))
@@ -0,0 +1,153 @@
+# staged_scoring.py
+# Scores a test inside the staging tables before it is published. The test's live
+# responses that the upload does not replace are carried into staging, and the whole
+# test is scored, totalled and ranked there with the vectorized engine. Publishing then
+# only merges finished rows into the live tables, so dashboards keep reading the
+# previous version at full speed until that short transaction commits.
+import numpy as np
+from django.db import connection, transaction
+
+from excelhandler.models import (
+    Test, Question, StudentResponse, StudentAnswerSheet,
+    StagedTest, StagedQuestion, StagedAnswerSheet, StagedTestPerformance, StagedSubjectPerformance,
+)
+from .bulk_load import _copy_rows
+from .response_store import _uses_answer_sheets
+from .scoring_engine import _matrix_from_sheets, _answer_key_arrays, _rescore, _subject_totals
+
+_STAGED_SHEET_TABLE = StagedAnswerSheet._meta.db_table
+_STAGED_SCORES_COPY_TABLE = 'excelhandler_stagedanswersheet_scores'
+
+
+def _dense_ranks(scores):
+    """DENSE_RANK() OVER (ORDER BY score DESC) of each score."""
+    return np.unique(-scores, return_inverse=True)[1].reshape(-1) + 1
+
+
+def _carry_live_responses(cursor, job_id, test_code):
+    """Copies the test's live answer sheets of students without an uploaded sheet into staging."""
+    if _uses_answer_sheets():
+        cursor.execute(
+            f"""
+            INSERT INTO {_STAGED_SHEET_TABLE} (job_id, test_code, sturecid, selected_options, is_correct, score_awarded, carried)
+            SELECT %s, test_code_id, sturecid_id, selected_options, is_correct, score_awarded, TRUE
+            FROM {StudentAnswerSheet._meta.db_table}
+            WHERE test_code_id = %s
+            ON CONFLICT (job_id, test_code, sturecid) DO NOTHING
+            """,
+            [job_id, test_code],
+        )
+        return
+    cursor.execute(
+        f"""
+        INSERT INTO {_STAGED_SHEET_TABLE} (job_id, test_code, sturecid, selected_options, is_correct, score_awarded, carried)
+        SELECT %s, test_code_id, sturecid_id,
+               array_agg(selected_option ORDER BY question_number),
+               array_agg(is_correct ORDER BY question_number),
+               array_agg(score_awarded ORDER BY question_number),
+               TRUE
+        FROM {StudentResponse._meta.db_table}
+        WHERE test_code_id = %s
+        GROUP BY test_code_id, sturecid_id
+        ON CONFLICT (job_id, test_code, sturecid) DO NOTHING
+        """,
+        [job_id, test_code],
+    )
+
+
+def _effective_answer_key(job_id, test_code, replace=False):
+    """The live answer key of a test with its staged questions applied; only the staged ones when replacing it."""
+    questions = {} if replace else {
+        question_number: (question_number, correct_option, subject_tag)
+        for question_number, correct_option, subject_tag in Question.objects.filter(
+            test_code_id=test_code
+        ).values_list('question_number', 'correct_option', 'subject_tag')
+    }
+    for question_number, correct_option, subject_tag in StagedQuestion.objects.filter(
+        job_id=job_id, test_code=test_code
+    ).values_list('question_number', 'correct_option', 'subject_tag'):
+        questions[question_number] = (question_number, correct_option, subject_tag)
+    return _answer_key_arrays(list(questions.values()))
+
+
+def _write_staged_scores(cursor, matrix, has_key):
+    """Stores the scored correctness and score arrays of every staged sheet of the matrix."""
+    def array_literal(values, answers):
+        return '{' + ','.join(values[:answers]) + '}'
+
+    rows = []
+    for row in range(len(matrix.sheet_ids)):
+        answers = int(matrix.present[row].sum())
+        correctness = np.where(matrix.is_correct[row], 't', 'f')
+        if _uses_answer_sheets():
+            # Packed sheets hold NULL for questions without an answer key.
+            correctness = np.where(has_key, correctness, 'NULL')
+        rows.append((
+            int(matrix.sheet_ids[row]),
+            array_literal(correctness.tolist(), answers),
+            array_literal([repr(score) for score in matrix.score_awarded[row].tolist()], answers),
+        ))
+    cursor.execute(
+        f"""
+        CREATE TEMPORARY TABLE IF NOT EXISTS {_STAGED_SCORES_COPY_TABLE} (
+            id bigint NOT NULL,
+            is_correct boolean[] NOT NULL,
+            score_awarded double precision[] NOT NULL
+        ) ON COMMIT DROP
+        """
+    )
+    _copy_rows(cursor, _STAGED_SCORES_COPY_TABLE, ['id', 'is_correct', 'score_awarded'], rows)
+    cursor.execute(
+        f"""
+        UPDATE {_STAGED_SHEET_TABLE} AS s
+        SET is_correct = st.is_correct,
+            score_awarded = st.score_awarded
+        FROM {_STAGED_SCORES_COPY_TABLE} AS st
+        WHERE s.id = st.id
+        """
+    )
+    cursor.execute(f"TRUNCATE {_STAGED_SCORES_COPY_TABLE}")
+
+
+def _score_staged_test(job_id, test_code, replace=False):
+    """
+    Builds the next version of a test in staging, in one transaction that touches only
+    staging tables: carries its remaining live responses over (unless the test is being
+    replaced), scores every sheet against the effective answer key and stages the totals,
+    subject totals and their dense ranks. Safe to repeat.
+    Returns (responses changed, performance rows, subject performance rows, responses scored).
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        if not replace:
+            _carry_live_responses(cursor, job_id, test_code)
+        matrix = _matrix_from_sheets(list(
+            StagedAnswerSheet.objects.filter(job_id=job_id, test_code=test_code)
+            .order_by('sturecid')
+            .values_list('id', 'sturecid', 'selected_options', 'is_correct', 'score_awarded')
+        ))
+        staged_test = StagedTest.objects.filter(job_id=job_id, test_code=test_code).values_list('test_type', flat=True).first()
+        test_type = staged_test if staged_test is not None else Test.objects.filter(test_code=test_code).values_list('test_type', flat=True).first()
+        changed, has_key, subject_tags, totals = _rescore(matrix, test_type, *_effective_answer_key(job_id, test_code, replace))
+        _write_staged_scores(cursor, matrix, has_key)
+
+        for model in (StagedTestPerformance, StagedSubjectPerformance):
+            model.objects.filter(job_id=job_id, test_code=test_code).delete()
+        _copy_rows(
+            cursor,
+            StagedTestPerformance._meta.db_table,
+            ['job_id', 'test_code', 'sturecid', 'total_score', 'rank'],
+            zip([job_id] * len(totals), [test_code] * len(totals), matrix.sturecids.tolist(), totals.tolist(), _dense_ranks(totals).tolist()),
+        )
+        subject_records = 0
+        for tag, sturecids, subject_scores in _subject_totals(matrix, subject_tags):
+            _copy_rows(
+                cursor,
+                StagedSubjectPerformance._meta.db_table,
+                ['job_id', 'test_code', 'sturecid', 'subject_tag', 'subject_score', 'subject_rank'],
+                (
+                    (job_id, test_code, sturecid, tag, subject_score, rank)
+                    for sturecid, subject_score, rank in zip(sturecids.tolist(), subject_scores.tolist(), _dense_ranks(subject_scores).tolist())
+                ),
+            )
+            subject_records += len(sturecids)
+    return int(changed.sum()), len(totals), subject_records, int(matrix.present.sum())
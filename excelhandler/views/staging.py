@@ -0,0 +1,393 @@
+# staging.py
+# Resumable ingestion. Parsed SR/AK rows are written to per-job staging tables in
+# bounded, committed chunks, each recording a checkpoint on the IngestionJob row. A test
+# is then published into the live tables (Test, Question, responses, scores, totals,
+# ranks, response cube, fingerprints) in one short transaction, so readers see all of it
+# or none of it.
+import time
+
+from django.db import connection, transaction
+from django.db.models import Count
+
+from excelhandler.models import (
+    Batch, Test, Question, IngestionJob, StudentResponse, StudentAnswerSheet, StudentTestPerformance, StudentSubjectPerformance,
+    StagedTest, StagedStudent, StagedQuestion, StagedAnswerSheet, StagedTestPerformance, StagedSubjectPerformance,
+)
+from .bulk_load import _copy_rows
+from .response_store import _uses_answer_sheets
+from .scoring import _upsert_questions
+from .staged_scoring import _score_staged_test
+from .deletion import _delete_test_facts
+from .response_cube import _refresh_response_cube
+from .locks import _test_lock
+
+_FACT_TABLE = StudentResponse._meta.db_table
+_SHEET_TABLE = StudentAnswerSheet._meta.db_table
+_STAGED_SHEET_TABLE = StagedAnswerSheet._meta.db_table
+_STAGED_SHEET_COPY_TABLE = 'excelhandler_stagedanswersheet_copy'
+_PERFORMANCE_TABLE = StudentTestPerformance._meta.db_table
+_SUBJECT_PERFORMANCE_TABLE = StudentSubjectPerformance._meta.db_table
+_STAGED_MODELS = (StagedSubjectPerformance, StagedTestPerformance, StagedAnswerSheet, StagedQuestion, StagedTest)
+
+
+class _IngestionCheckpoint:
+    """
+    The committed progress of an ingestion job, kept in IngestionJob.checkpoint:
+    file pairs and SR rows of the current pair staged so far, whether all files are fully
+    staged, the tests to publish and the tests already published. save() must run in the transaction whose work it records.
+    """
+
+    def __init__(self, job):
+        self.job = job
+        self.resumed = bool(job.checkpoint)
+        self.state = {
+            'sr_pairs_staged': 0,
+            'sr_rows_staged': 0,
+            'ak_pairs_staged': 0,
+            'responses_staged': False,
+            'answer_key_staged': False,
+            'tests_touched': None,
+            'tests_to_publish': None,
+            'tests_published': [],
+            'student_responses_written': 0,
+            'skipped_test_codes': [],
+            'tests_reloaded': 0,
+            **(job.checkpoint or {}),
+        }
+
+    def __getitem__(self, key):
+        return self.state[key]
+
+    def save(self, **changes):
+        self.state.update(changes)
+        IngestionJob.objects.filter(pk=self.job.pk).update(checkpoint=self.state)
+        self.job.checkpoint = dict(self.state)
+
+    def published(self, result):
+        """Mirrors a test already recorded as published by _publish_test (in its transaction)."""
+        self.state['tests_published'] = self.state['tests_published'] + [result['test_code']]
+        self.state['student_responses_written'] += result['student_responses_written']
+        self.job.checkpoint = dict(self.state)
+
+
+def _stage_tests(job, test_values):
+    """Stages {test_code: (test_type, test_date, institution_name, batch_name)}; later rows of a test overwrite earlier ones."""
+    StagedTest.objects.bulk_create(
+        [
+            StagedTest(
+                job=job, test_code=code, test_type=test_type, test_date=test_date,
+                institution_name=institution_name, batch_name=batch_name,
+            )
+            for code, (test_type, test_date, institution_name, batch_name) in sorted(test_values.items())
+        ],
+        update_conflicts=True,
+        unique_fields=['job', 'test_code'],
+        update_fields=['test_type', 'test_date', 'institution_name', 'batch_name'],
+    )
+
+
+def _stage_students(job, students):
+    """Stages {sturecid: student defaults}; a student already staged by the job keeps its first values."""
+    StagedStudent.objects.bulk_create(
+        [StagedStudent(job=job, sturecid=sturecid, **defaults) for sturecid, defaults in sorted(students.items())],
+        ignore_conflicts=True,
+    )
+
+
+def _stage_answer_sheets(job, answer_sheets):
+    """Stages {(sturecid, test_code): [option for a1..aN]} with COPY + ON CONFLICT; returns the number of sheets staged."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            CREATE TEMPORARY TABLE IF NOT EXISTS {_STAGED_SHEET_COPY_TABLE} (
+                sturecid bigint NOT NULL,
+                test_code varchar(255) NOT NULL,
+                selected_options smallint[] NOT NULL
+            ) ON COMMIT DROP
+            """
+        )
+        _copy_rows(
+            cursor,
+            _STAGED_SHEET_COPY_TABLE,
+            ['sturecid', 'test_code', 'selected_options'],
+            (
+                (sturecid, test_code, '{' + ','.join(map(str, options)) + '}')
+                for (sturecid, test_code), options in answer_sheets.items()
+            ),
+        )
+        cursor.execute(
+            f"""
+            INSERT INTO {_STAGED_SHEET_TABLE} (job_id, sturecid, test_code, selected_options, carried)
+            SELECT %s, sturecid, test_code, selected_options, FALSE
+            FROM {_STAGED_SHEET_COPY_TABLE}
+            ON CONFLICT (job_id, test_code, sturecid) DO UPDATE
+            SET selected_options = EXCLUDED.selected_options
+            """,
+            [job.pk],
+        )
+        cursor.execute(f"TRUNCATE {_STAGED_SHEET_COPY_TABLE}")
+    return len(answer_sheets)
+
+
+def _stage_questions(job, pending_questions):
+    """Stages answer-key rows; same input and return value as scoring._upsert_questions."""
+    StagedQuestion.objects.bulk_create(
+        [
+            StagedQuestion(job=job, test_code=test_code, question_number=question_number, subject_tag=subject_tag, correct_option=correct_option)
+            for (test_code, question_number), (subject_tag, correct_option) in pending_questions.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['job', 'test_code', 'question_number'],
+        update_fields=['correct_option', 'subject_tag'],
+    )
+    return {test_code for test_code, _ in pending_questions}, len(pending_questions)
+
+
+def _staged_test_codes(job):
+    """Test codes with staged SR rows or answer-key rows for `job`."""
+    return (
+        set(StagedTest.objects.filter(job=job).values_list('test_code', flat=True))
+        | set(StagedQuestion.objects.filter(job=job).values_list('test_code', flat=True).distinct())
+    )
+
+
+def _staged_sheet_counts(job):
+    """{test_code: staged answer sheets} for `job`, used to publish large tests first."""
+    return dict(
+        StagedAnswerSheet.objects.filter(job=job).values('test_code').annotate(sheets=Count('id')).values_list('test_code', 'sheets')
+    )
+
+
+def _discard_staging(job):
+    for model in _STAGED_MODELS + (StagedStudent,):
+        model.objects.filter(job=job).delete()
+
+
+def _discard_staged_slices(job, response_test_codes, answer_key_test_codes):
+    """Drops the staged SR rows of `response_test_codes` and the staged answer keys of `answer_key_test_codes`."""
+    StagedAnswerSheet.objects.filter(job=job, test_code__in=response_test_codes).delete()
+    StagedTest.objects.filter(job=job, test_code__in=response_test_codes).delete()
+    StagedQuestion.objects.filter(job=job, test_code__in=answer_key_test_codes).delete()
+
+
+def _publish_answer_sheets(job_id, test_code):
+    """
+    Merges the scored answer sheets staged for a test into the response storage with one
+    INSERT ... SELECT; rows that did not change are left alone. Returns (students,
+    responses) uploaded for the test, not counting the sheets carried over for rescoring.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT count(*), coalesce(sum(cardinality(selected_options)), 0)
+            FROM {_STAGED_SHEET_TABLE}
+            WHERE job_id = %s AND test_code = %s AND NOT carried
+            """,
+            [job_id, test_code],
+        )
+        students, responses_written = cursor.fetchone()
+        if _uses_answer_sheets():
+            cursor.execute(
+                f"""
+                INSERT INTO {_SHEET_TABLE} AS sheet (sturecid_id, test_code_id, selected_options, is_correct, score_awarded)
+                SELECT sturecid, test_code, selected_options, is_correct, score_awarded
+                FROM {_STAGED_SHEET_TABLE}
+                WHERE job_id = %s AND test_code = %s
+                ON CONFLICT (sturecid_id, test_code_id) DO UPDATE
+                SET selected_options = EXCLUDED.selected_options,
+                    is_correct = EXCLUDED.is_correct,
+                    score_awarded = EXCLUDED.score_awarded
+                WHERE (sheet.selected_options, sheet.is_correct, sheet.score_awarded)
+                      IS DISTINCT FROM (EXCLUDED.selected_options, EXCLUDED.is_correct, EXCLUDED.score_awarded)
+                """,
+                [job_id, test_code],
+            )
+        else:
+            cursor.execute(
+                f"""
+                INSERT INTO {_FACT_TABLE} AS fact
+                    (sturecid_id, test_code_id, question_number, selected_option, is_correct, score_awarded)
+                SELECT s.sturecid, s.test_code, o.question_number, o.selected_option, o.is_correct, o.score_awarded
+                FROM {_STAGED_SHEET_TABLE} AS s
+                CROSS JOIN LATERAL unnest(s.selected_options, s.is_correct, s.score_awarded)
+                    WITH ORDINALITY AS o(selected_option, is_correct, score_awarded, question_number)
+                WHERE s.job_id = %s AND s.test_code = %s
+                ON CONFLICT (sturecid_id, test_code_id, question_number) DO UPDATE
+                SET selected_option = EXCLUDED.selected_option,
+                    is_correct = EXCLUDED.is_correct,
+                    score_awarded = EXCLUDED.score_awarded
+                WHERE (fact.selected_option, fact.is_correct, fact.score_awarded)
+                      IS DISTINCT FROM (EXCLUDED.selected_option, EXCLUDED.is_correct, EXCLUDED.score_awarded)
+                """,
+                [job_id, test_code],
+            )
+    return students, responses_written
+
+
+def _publish_performance(job_id, test_code):
+    """
+    Merges the staged totals, subject totals and ranks of a test into the performance
+    tables, drops subject rows for tags no longer in its answer key and leaves unchanged
+    rows alone. Returns (ranks changed, subject ranks changed).
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT count(*)
+            FROM {StagedTestPerformance._meta.db_table} AS staged
+            LEFT JOIN {_PERFORMANCE_TABLE} AS live
+                ON live.student_id = staged.sturecid AND live.test_id = staged.test_code
+            WHERE staged.job_id = %s AND staged.test_code = %s AND live.rank IS DISTINCT FROM staged.rank
+            """,
+            [job_id, test_code],
+        )
+        ranks_updated = cursor.fetchone()[0]
+        cursor.execute(
+            f"""
+            INSERT INTO {_PERFORMANCE_TABLE} AS live (student_id, test_id, total_score, rank)
+            SELECT sturecid, test_code, total_score, rank
+            FROM {StagedTestPerformance._meta.db_table}
+            WHERE job_id = %s AND test_code = %s
+            ON CONFLICT (student_id, test_id) DO UPDATE
+            SET total_score = EXCLUDED.total_score,
+                rank = EXCLUDED.rank
+            WHERE (live.total_score, live.rank) IS DISTINCT FROM (EXCLUDED.total_score, EXCLUDED.rank)
+            """,
+            [job_id, test_code],
+        )
+        cursor.execute(
+            f"""
+            DELETE FROM {_SUBJECT_PERFORMANCE_TABLE} AS live
+            WHERE live.test_id = %s
+              AND NOT EXISTS (
+                  SELECT 1 FROM {Question._meta.db_table} AS q
+                  WHERE q.test_code_id = live.test_id AND q.subject_tag = live.subject_tag
+              )
+            """,
+            [test_code],
+        )
+        cursor.execute(
+            f"""
+            SELECT count(*)
+            FROM {StagedSubjectPerformance._meta.db_table} AS staged
+            LEFT JOIN {_SUBJECT_PERFORMANCE_TABLE} AS live
+                ON live.student_id = staged.sturecid AND live.test_id = staged.test_code AND live.subject_tag = staged.subject_tag
+            WHERE staged.job_id = %s AND staged.test_code = %s AND live.subject_rank IS DISTINCT FROM staged.subject_rank
+            """,
+            [job_id, test_code],
+        )
+        subject_ranks_updated = cursor.fetchone()[0]
+        cursor.execute(
+            f"""
+            INSERT INTO {_SUBJECT_PERFORMANCE_TABLE} AS live (student_id, test_id, subject_tag, subject_score, subject_rank)
+            SELECT sturecid, test_code, subject_tag, subject_score, subject_rank
+            FROM {StagedSubjectPerformance._meta.db_table}
+            WHERE job_id = %s AND test_code = %s
+            ON CONFLICT (student_id, test_id, subject_tag) DO UPDATE
+            SET subject_score = EXCLUDED.subject_score,
+                subject_rank = EXCLUDED.subject_rank
+            WHERE (live.subject_score, live.subject_rank) IS DISTINCT FROM (EXCLUDED.subject_score, EXCLUDED.subject_rank)
+            """,
+            [job_id, test_code],
+        )
+    return ranks_updated, subject_ranks_updated
+
+
+def _record_published(cursor, job_id, test_code, responses_written):
+    """Appends a test to the job's published tests in the checkpoint, in the publishing transaction."""
+    cursor.execute(
+        f"""
+        UPDATE {IngestionJob._meta.db_table}
+        SET checkpoint = jsonb_set(
+            jsonb_set(checkpoint, '{{tests_published}}', (checkpoint -> 'tests_published') || to_jsonb(%s::text)),
+            '{{student_responses_written}}', to_jsonb((checkpoint ->> 'student_responses_written')::bigint + %s)
+        )
+        WHERE id = %s
+        """,
+        [test_code, responses_written, job_id],
+    )
+
+
+def _publish_test(test_code, job_id, fingerprint_fields, replace=False):
+    """
+    Scores one staged test in staging (_score_staged_test), then publishes it in a single
+    short transaction of set-based merges: its Test row, answer key, responses, totals,
+    subject scores and ranks, its response cube cells, the `fingerprint_fields` on Test, and the test in the job's
+    checkpoint; its staged rows are dropped. A test without staged rows (full rebuild) is
+    only rescored. With `replace` everything stored for the test is deleted first, in the
+    same transaction, instead of being merged with. The test's advisory lock is held
+    from scoring to commit, so a concurrent job publishing the same test waits instead
+    of merging over a stale score. Safe to repeat after a failure.
+    Returns the test's counts and timing, with the time the live tables were written in
+    under 'merge_seconds'.
+    """
+    started = time.perf_counter()
+    query_count = 0
+
+    def count_query(execute, sql, params, many, context):
+        nonlocal query_count
+        query_count += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(count_query), _test_lock(test_code):
+        responses_rescored, performance_records, subject_performance_records, responses_scored = _score_staged_test(job_id, test_code, replace)
+        merge_started = time.perf_counter()
+        deleted = None
+        with transaction.atomic():
+            if replace:
+                with connection.cursor() as cursor:
+                    deleted = _delete_test_facts(cursor, test_code)
+                    cursor.execute(f"DELETE FROM {Question._meta.db_table} WHERE test_code_id = %s", [test_code])
+                    deleted['questions'] = cursor.rowcount
+            staged_test = StagedTest.objects.filter(job_id=job_id, test_code=test_code).first()
+            if staged_test is not None:
+                # The dimensions were created once the upload passed validation (see dimensions.py).
+                batch_id, institution_id = Batch.objects.filter(
+                    name=staged_test.batch_name, institution__name=staged_test.institution_name,
+                ).values_list('id', 'institution_id').get()
+                Test.objects.bulk_create(
+                    [Test(
+                        test_code=test_code, test_type=staged_test.test_type, test_date=staged_test.test_date,
+                        institution_id=institution_id, batch_id=batch_id,
+                    )],
+                    update_conflicts=True,
+                    unique_fields=['test_code'],
+                    update_fields=['test_type', 'test_date', 'institution', 'batch'],
+                )
+            questions = {
+                (test_code, question_number): (subject_tag, correct_option)
+                for question_number, subject_tag, correct_option in StagedQuestion.objects.filter(
+                    job_id=job_id, test_code=test_code
+                ).values_list('question_number', 'subject_tag', 'correct_option')
+            }
+            if questions:
+                _upsert_questions(questions)
+
+            students, responses_written = _publish_answer_sheets(job_id, test_code)
+            ranks_updated, subject_ranks_updated = _publish_performance(job_id, test_code)
+            response_cube_cells = _refresh_response_cube([test_code])
+            if fingerprint_fields:
+                Test.objects.filter(test_code=test_code).update(**fingerprint_fields)
+            for model in _STAGED_MODELS:
+                model.objects.filter(job_id=job_id, test_code=test_code).delete()
+            # Last, so the job row stays locked only for the commit.
+            with connection.cursor() as cursor:
+                _record_published(cursor, job_id, test_code, responses_written)
+    result = {
+        'test_code': test_code,
+        'students': students,
+        'student_responses_written': responses_written,
+        'student_responses_scored': responses_scored,
+        'student_responses_rescored': responses_rescored,
+        'performance_records': performance_records,
+        'ranks_updated': ranks_updated,
+        'subject_performance_records': subject_performance_records,
+        'subject_ranks_updated': subject_ranks_updated,
+        'response_cube_cells': response_cube_cells,
+        'queries': query_count,
+        'merge_seconds': round(time.perf_counter() - merge_started, 3),
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+    if deleted is not None:
+        result['deleted'] = deleted
+    return result
@@ -0,0 +1,241 @@
+# uploads.py
+# Resumable chunked uploads in the spirit of tus: create an upload, PUT its numbered
+# chunks (retrying any that fail), then finalize it. An ingestion job can reference an
+# upload instead of a file; _ChunkedUploadFile then feeds the parser each chunk as soon
+# as it has been stored, while later chunks are still in flight.
+import io
+import json
+import os
+import shutil
+import time
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+
+from excelhandler.models import ChunkedUpload
+
+# Seconds between two checks for a chunk that has not arrived yet.
+CHUNK_POLL_INTERVAL = 0.5
+
+
+def _upload_dir(upload):
+    return os.path.join(settings.MEDIA_ROOT, 'chunked_uploads', str(upload.pk))
+
+
+def _part_path(upload, number):
+    return os.path.join(_upload_dir(upload), f'{number}.part')
+
+
+def _received_chunks(upload):
+    """Numbers of the chunks stored so far, in order."""
+    try:
+        names = os.listdir(_upload_dir(upload))
+    except FileNotFoundError:
+        return []
+    return sorted(int(name[:-len('.part')]) for name in names if name.endswith('.part'))
+
+
+def _delete_upload_files(upload):
+    shutil.rmtree(_upload_dir(upload), ignore_errors=True)
+
+
+class _UploadIncompleteError(RuntimeError):
+    """Raised when a chunk of an unfinished upload does not arrive within CHUNKED_UPLOAD_WAIT_TIMEOUT."""
+
+
+class _ChunkedUploadFile(io.RawIOBase):
+    """
+    Read-only, seekable file object over the chunks of a ChunkedUpload, in chunk order.
+    Reading past the chunks stored so far waits for the next one until the upload is
+    finalized; seeking relative to the end waits for the whole upload.
+    """
+
+    def __init__(self, upload, wait_timeout=None):
+        super().__init__()
+        self.upload = upload
+        self.name = upload.filename
+        self.wait_timeout = settings.CHUNKED_UPLOAD_WAIT_TIMEOUT if wait_timeout is None else wait_timeout
+        self._part_sizes = []  # Sizes of chunks 0..n-1, known once each has arrived
+        self._position = 0
+        self._open_part, self._open_number = None, None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def _part_size(self, number):
+        """Size of chunk `number`, waiting for it to arrive; None past the last chunk of a finalized upload."""
+        if number < len(self._part_sizes):
+            return self._part_sizes[number]
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            try:
+                size = os.path.getsize(_part_path(self.upload, number))
+            except FileNotFoundError:
+                self.upload.refresh_from_db(fields=['status', 'chunk_count'])
+                if self.upload.status == ChunkedUpload.STATUS_COMPLETE and number >= self.upload.chunk_count:
+                    return None
+                if time.monotonic() > deadline:
+                    raise _UploadIncompleteError(
+                        f"Chunk {number} of upload {self.upload.pk} ({self.upload.filename}) did not arrive within {self.wait_timeout:.0f}s."
+                    )
+                time.sleep(CHUNK_POLL_INTERVAL)
+                continue
+            self._part_sizes.append(size)
+            return size
+
+    def readinto(self, buffer):
+        number, part_start = 0, 0
+        while True:
+            size = self._part_size(number)
+            if size is None:
+                return 0
+            if self._position < part_start + size:
+                break
+            number, part_start = number + 1, part_start + size
+        if self._open_number != number:
+            self._close_part()
+            self._open_part = open(_part_path(self.upload, number), 'rb')
+            self._open_number = number
+        self._open_part.seek(self._position - part_start)
+        data = self._open_part.read(len(buffer))
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self._position = offset
+        elif whence == io.SEEK_CUR:
+            self._position += offset
+        else:
+            number = len(self._part_sizes)
+            while self._part_size(number) is not None:
+                number += 1
+            self._position = sum(self._part_sizes) + offset
+        return self._position
+
+    def _close_part(self):
+        if self._open_part is not None:
+            self._open_part.close()
+            self._open_part, self._open_number = None, None
+
+    def close(self):
+        self._close_part()
+        super().close()
+
+    def tell(self):
+        return self._position
+
+
+def _serialize_upload(upload):
+    received = _received_chunks(upload)
+    return {
+        'upload_id': upload.pk,
+        'filename': upload.filename,
+        'status': upload.status,
+        'chunks_received': received,
+        'bytes_received': sum(os.path.getsize(_part_path(upload, number)) for number in received),
+        'chunk_count': upload.chunk_count,
+        'created_at': upload.created_at.isoformat() if upload.created_at else None,
+        'completed_at': upload.completed_at.isoformat() if upload.completed_at else None,
+    }
+
+
+def _request_data(request):
+    """Form fields, or the JSON body when the client sends JSON."""
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError:
+            return {}
+    return request.POST
+
+
+@csrf_exempt
+def create_upload(request):
+    """Starts a chunked upload for one file (`filename`, e.g. SR.csv) and returns its ID."""
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Only POST requests are allowed.'}, status=405)
+    filename = str(_request_data(request).get('filename', '')).strip()
+    if not filename:
+        return JsonResponse({'status': 'error', 'message': "'filename' is required."}, status=400)
+    upload = ChunkedUpload.objects.create(filename=os.path.basename(filename))
+    os.makedirs(_upload_dir(upload), exist_ok=True)
+    return JsonResponse(_serialize_upload(upload), status=201)
+
+
+def _get_upload(upload_id):
+    try:
+        return ChunkedUpload.objects.get(pk=upload_id), None
+    except ChunkedUpload.DoesNotExist:
+        return None, JsonResponse({'status': 'error', 'message': f'Upload {upload_id} not found.'}, status=404)
+
+
+def get_upload(request, upload_id):
+    """Returns the status of an upload and the chunk numbers received, so a client knows what to resend."""
+    upload, error = _get_upload(upload_id)
+    return error or JsonResponse(_serialize_upload(upload))
+
+
+@csrf_exempt
+def put_upload_chunk(request, upload_id, number):
+    """
+    Stores the raw request body as chunk `number` (0-based). The body is streamed to a
+    temporary file and renamed into place, so readers only ever see complete chunks.
+    Re-sending a chunk replaces it while the upload is unfinished.
+    """
+    if request.method != 'PUT':
+        return JsonResponse({'status': 'error', 'message': 'Only PUT requests are allowed.'}, status=405)
+    upload, error = _get_upload(upload_id)
+    if error:
+        return error
+    if upload.status == ChunkedUpload.STATUS_COMPLETE:
+        return JsonResponse({'status': 'error', 'message': f'Upload {upload_id} is already finalized.'}, status=409)
+    os.makedirs(_upload_dir(upload), exist_ok=True)
+    temporary_path = f'{_part_path(upload, number)}.tmp'
+    with open(temporary_path, 'wb') as part:
+        shutil.copyfileobj(request, part)
+        size = part.tell()
+    if not size:
+        os.remove(temporary_path)
+        return JsonResponse({'status': 'error', 'message': 'Chunk body is empty.'}, status=400)
+    os.replace(temporary_path, _part_path(upload, number))
+    return JsonResponse({'upload_id': upload.pk, 'chunk': number, 'size': size})
+
+
+@csrf_exempt
+def finalize_upload(request, upload_id):
+    """
+    Marks an upload complete once chunks 0..chunk_count-1 have all been stored. Chunks
+    numbered chunk_count or above are refused rather than ignored: readers take every
+    stored chunk in order, so they would silently become part of the file.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Only POST requests are allowed.'}, status=405)
+    upload, error = _get_upload(upload_id)
+    if error:
+        return error
+    chunk_count_val = str(_request_data(request).get('chunk_count', '')).strip()
+    try:
+        chunk_count = int(chunk_count_val)
+    except ValueError:
+        chunk_count = 0
+    if chunk_count < 1:
+        return JsonResponse({'status': 'error', 'message': f"'chunk_count' must be a positive integer, got '{chunk_count_val}'."}, status=400)
+    received = _received_chunks(upload)
+    missing = sorted(set(range(chunk_count)) - set(received))
+    if missing:
+        return JsonResponse({'status': 'error', 'message': 'Some chunks have not been received.', 'missing_chunks': missing}, status=400)
+    unexpected = [number for number in received if number >= chunk_count]
+    if unexpected:
+        return JsonResponse({'status': 'error', 'message': f'Chunks beyond chunk_count {chunk_count} were received.', 'unexpected_chunks': unexpected}, status=400)
+    upload.status = ChunkedUpload.STATUS_COMPLETE
+    upload.chunk_count = chunk_count
+    upload.completed_at = timezone.now()
+    upload.save(update_fields=['status', 'chunk_count', 'completed_at'])
+    return JsonResponse(_serialize_upload(upload))
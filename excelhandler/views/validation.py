@@ -0,0 +1,312 @@
+# validation.py
+# Pre-flight checks of SR/AK uploads (missing keys, types, dates, duplicates, option
+# ranges and AK/SR test-code coverage), so a bad upload is rejected with a structured
+# report instead of failing half-way through Phase 1 or 2. Each file is checked in one
+# streaming pass, row by row: only per-file counters, the first rows of each issue and
+# the (sturecid, test) and (test, question) keys seen so far are kept, never the file.
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from excelhandler.models import Test
+from .row_readers import _RowIndex, _cell, _iter_upload_rows
+
+# Answer columns a1..a180 read by Phase 1, and the question numbers an answer key may use.
+QUESTIONS_PER_SHEET = 180
+# A selected or correct option is 0 (unattempted / no key) or the marked options, e.g. 2 or 23.
+OPTION_DIGITS = set('1234')
+SR_REQUIRED_COLUMNS = ('Institution', 'Batch', 'sturecid', 'testid')
+SR_DATE_FORMAT = '%d-%m-%Y'
+# AK.csv columns, by position; their header texts are not checked.
+AK_COLUMNS = ('Question Number', 'Test Code', 'Subject', 'Correct Ans')
+# Issues listed per (file, code) in a report; the counts always cover all of them.
+MAX_LISTED_ISSUES = 20
+
+
+class _ValidationReport:
+    """Errors (which stop the load) and warnings found in an upload, with per-code and per-file, per-column counts."""
+
+    def __init__(self):
+        self.errors = []
+        self.warnings = []
+        self.error_counts = Counter()
+        self.warning_counts = Counter()
+        self.files = []
+        self._listed = Counter()
+        self._column_counts = defaultdict(Counter)
+
+    def add(self, file_name, code, message, rows=(), values=(), column=None, warning=False):
+        """
+        Records one issue per row in `rows` (one issue without a row when empty); `values`
+        and a list `column` give each issue its cell value and column.
+        """
+        issues, counts = (self.warnings, self.warning_counts) if warning else (self.errors, self.error_counts)
+        rows = list(rows) or [None]
+        values = list(values) or [None] * len(rows)
+        columns = column if isinstance(column, list) else [column] * len(rows)
+        listed = self._listed[(warning, file_name, code)]
+        for row, value, column in zip(rows[:max(MAX_LISTED_ISSUES - listed, 0)], values, columns):
+            issues.append({'file': file_name, 'row': row, 'column': column, 'code': code, 'value': value, 'message': message})
+        self._listed[(warning, file_name, code)] = min(listed + len(rows), MAX_LISTED_ISSUES)
+        counts[code] += len(rows)
+        self._column_counts[file_name].update(column for column in columns[:len(rows)] if column)
+
+    @property
+    def valid(self):
+        return not self.errors
+
+    def summary(self):
+        """One line naming the error counts, for exception messages and logs."""
+        return ', '.join(f"{count} {code}" for code, count in sorted(self.error_counts.items()))
+
+    def as_dict(self, seconds):
+        return {
+            'valid': self.valid,
+            'error_count': sum(self.error_counts.values()),
+            'error_counts': dict(self.error_counts),
+            'errors': self.errors,
+            'warning_count': sum(self.warning_counts.values()),
+            'warning_counts': dict(self.warning_counts),
+            'warnings': self.warnings,
+            'files': [{**file, 'issues_by_column': dict(self._column_counts[file['file']])} for file in self.files],
+            'seconds': round(seconds, 3),
+        }
+
+
+def _is_option(token):
+    if not token:
+        return True
+    try:
+        value = float(token)
+    except ValueError:
+        return False
+    return value.is_integer() and (value == 0 or set(str(int(value))) <= OPTION_DIGITS)
+
+
+def _is_date(token):
+    if not token:
+        return True
+    try:
+        datetime.strptime(token, SR_DATE_FORMAT)
+    except ValueError:
+        return False
+    return True
+
+
+def _is_valid(token, is_valid, valid_tokens):
+    """is_valid(token.strip()), remembered for valid tokens (a handful of option codes or test dates per file)."""
+    if token in valid_tokens:
+        return True
+    if not is_valid(token.strip()):
+        return False
+    valid_tokens.add(token)
+    return True
+
+
+def _duplicate_of(seen, key, file_name, row_num):
+    """
+    Records the first row of `key` in `seen` ({key: (file, row)}, shared by the files of an
+    upload); for a repeated key, returns the issue value naming that first row.
+    """
+    first = seen.setdefault(key, (file_name, row_num))
+    if first == (file_name, row_num):
+        return None
+    return f'duplicate of row {first[1]}' if first[0] == file_name else f'duplicate of {first[0]} row {first[1]}'
+
+
+class _ResponseChecks:
+    """
+    Checks the data rows of one SR file as they are read, one row at a time. `seen_pairs`
+    holds, per testid, the first row of each sturecid already checked in this or an
+    earlier file of the upload; it is the only state that grows with the file, by one
+    entry per (student, test). finish() records the file in the report and returns its
+    test codes.
+    """
+
+    def __init__(self, report, sr_name, headers, seen_pairs):
+        self.report = report
+        self.sr_name = sr_name
+        self.seen_pairs = seen_pairs
+        self.rows = 0
+        self.test_codes = set()
+        self._valid_options = set()
+        self._valid_dates = set()
+        row_index = _RowIndex(headers)
+        missing_columns = [name for name in SR_REQUIRED_COLUMNS if row_index.position(name) is None]
+        if missing_columns:
+            report.add(sr_name, 'missing_column', f"{sr_name} has no {', '.join(missing_columns)} column.", values=[', '.join(missing_columns)])
+        self.usable = not missing_columns
+        self._required_positions = [(name, row_index.position(name)) for name in SR_REQUIRED_COLUMNS]
+        self._sturecid_position = row_index.position('sturecid')
+        self._test_code_position = row_index.position('testid')
+        self._date_position = row_index.position('exdate')
+        if self.usable and self._date_position is None:
+            report.add(sr_name, 'missing_column', f'{sr_name} has no exdate column; test dates will be empty.', values=['exdate'], warning=True)
+        self._answer_positions = [
+            (f'a{i}', row_index.position(f'a{i}')) for i in range(1, QUESTIONS_PER_SHEET + 1) if row_index.position(f'a{i}') is not None
+        ]
+        if self.usable and not self._answer_positions:
+            report.add(sr_name, 'missing_column', f'{sr_name} has no answer columns (a1..a{QUESTIONS_PER_SHEET}).', values=['a1'])
+
+    def check(self, row_num, row):
+        """Checks data row `row_num` (1-based); returns False when the row has an error."""
+        self.rows += 1
+        if not self.usable:
+            return False
+        report, sr_name = self.report, self.sr_name
+        valid = True
+        for name, position in self._required_positions:
+            if not _cell(row, position, '').strip():
+                report.add(sr_name, 'missing_value', f"Row has no {name}.", rows=[row_num], column=name)
+                valid = False
+        sturecid = _cell(row, self._sturecid_position, '').strip()
+        test_code = _cell(row, self._test_code_position, '').strip()
+        if sturecid and not sturecid.isdigit():
+            report.add(sr_name, 'invalid_sturecid', 'sturecid is not a whole number.', rows=[row_num], values=[sturecid], column='sturecid')
+            valid = False
+        exdate = _cell(row, self._date_position, '')
+        if exdate and not _is_valid(exdate, _is_date, self._valid_dates):
+            report.add(sr_name, 'invalid_date', 'exdate is not a DD-MM-YYYY date.', rows=[row_num], values=[exdate.strip()], column='exdate')
+            valid = False
+        for name, position in self._answer_positions:
+            option = row[position] if position < len(row) else ''
+            if option and not _is_valid(option, _is_option, self._valid_options):
+                report.add(sr_name, 'invalid_option', f"Selected option is not 0 or a combination of options {''.join(sorted(OPTION_DIGITS))}.",
+                           rows=[row_num], values=[option.strip()], column=name)
+                valid = False
+        if sturecid.isdigit() and test_code:
+            duplicate = _duplicate_of(self.seen_pairs.setdefault(test_code, {}), int(sturecid), sr_name, row_num)
+            if duplicate:
+                report.add(sr_name, 'duplicate_response', 'Student already has a row for this test.', rows=[row_num], values=[duplicate])
+                valid = False
+        if test_code:
+            self.test_codes.add(test_code)
+        return valid
+
+    def finish(self):
+        self.report.files.append({'file': self.sr_name, 'rows': self.rows})
+        return self.test_codes
+
+
+class _AnswerKeyChecks:
+    """
+    Checks the data rows of one AK file as they are read, like _ResponseChecks; `seen_questions`
+    holds the (test, question) keys already checked. finish() returns {test_code: first row number}.
+    """
+
+    def __init__(self, report, ak_name, headers, seen_questions):
+        self.report = report
+        self.ak_name = ak_name
+        self.seen_questions = seen_questions
+        self.rows = 0
+        self.first_rows = {}
+        self._valid_options = set()
+        self.usable = len(headers) >= len(AK_COLUMNS)
+        if not self.usable:
+            report.add(ak_name, 'missing_column', f"{ak_name} needs {len(AK_COLUMNS)} columns: {', '.join(AK_COLUMNS)}.")
+
+    def check(self, row_num, row):
+        """Checks data row `row_num` (1-based); returns False when the row has an error."""
+        self.rows += 1
+        if not self.usable:
+            return False
+        report, ak_name = self.report, self.ak_name
+        question_number, test_code = _cell(row, 0, '').strip(), _cell(row, 1, '').strip()
+        correct_option = _cell(row, 3, '')
+        valid = True
+        if not question_number or not test_code:
+            report.add(ak_name, 'missing_value', 'Row has no question number or test code.', rows=[row_num])
+            valid = False
+        number_in_range = question_number.isdigit() and 1 <= int(question_number) <= QUESTIONS_PER_SHEET
+        if question_number and not number_in_range:
+            report.add(ak_name, 'invalid_question_number', f'Question number is not between 1 and {QUESTIONS_PER_SHEET}.',
+                       rows=[row_num], values=[question_number], column=AK_COLUMNS[0])
+            valid = False
+        if correct_option and not _is_valid(correct_option, _is_option, self._valid_options):
+            report.add(ak_name, 'invalid_option', f"Correct option is not 0 or a combination of options {''.join(sorted(OPTION_DIGITS))}.",
+                       rows=[row_num], values=[correct_option.strip()], column=AK_COLUMNS[3])
+            valid = False
+        if test_code and number_in_range:
+            duplicate = _duplicate_of(self.seen_questions, (test_code, question_number.lstrip('0')), ak_name, row_num)
+            if duplicate:
+                report.add(ak_name, 'duplicate_question', 'Question already has an answer key row.', rows=[row_num], values=[duplicate])
+                valid = False
+        if test_code:
+            self.first_rows.setdefault(test_code, row_num)
+        return valid
+
+    def finish(self):
+        self.report.files.append({'file': self.ak_name, 'rows': self.rows})
+        return self.first_rows
+
+
+def _file_checks(report, file_name, headers, checks_class, seen):
+    """checks_class(...) for a file whose header row is `headers`; None, reported, for an empty file (no header)."""
+    if headers is None:
+        report.add(file_name, 'empty_file', f'{file_name} is empty or unreadable.')
+        return None
+    return checks_class(report, file_name, headers, seen)
+
+
+def _check_rows(report, file_name, uploaded_file, checks_class, seen, empty_result):
+    """Streams an upload through `checks_class` and returns its finish() result (`empty_result` for an empty file)."""
+    rows = _iter_upload_rows(uploaded_file)
+    checks = _file_checks(report, file_name, next(rows, None), checks_class, seen)
+    if checks is None:
+        return empty_result
+    for row_num, row in enumerate(rows, start=1):
+        checks.check(row_num, row)
+    return checks.finish()
+
+
+def _validate_responses(report, sr_name, sr_file, seen_pairs):
+    """Checks one SR file; returns its test codes. `seen_pairs` collects the sturecids of each testid across files."""
+    return _check_rows(report, sr_name, sr_file, _ResponseChecks, seen_pairs, set())
+
+
+def _validate_answer_key(report, ak_name, ak_file, seen_questions):
+    """Checks one AK file; returns {test_code: first row number}. `seen_questions` collects (test, question) across files."""
+    return _check_rows(report, ak_name, ak_file, _AnswerKeyChecks, seen_questions, {})
+
+
+def _check_coverage(report, response_test_codes, answer_key_rows, known_test_codes):
+    """AK tests must be in the SR files or stored already; SR tests without any answer key only warn."""
+    for ak_name, first_rows in answer_key_rows:
+        unknown = sorted(set(first_rows) - response_test_codes - known_test_codes)
+        if unknown:
+            report.add(ak_name, 'unknown_test', 'Answer key row for a test that is neither in the SR file nor loaded.',
+                       rows=[first_rows[test_code] for test_code in unknown], values=unknown, column=AK_COLUMNS[1])
+    keyed_test_codes = {test_code for _, first_rows in answer_key_rows for test_code in first_rows}
+    unkeyed = sorted(response_test_codes - keyed_test_codes - known_test_codes)
+    if unkeyed:
+        report.add(None, 'missing_answer_key', 'Test has no answer key in the upload or the database; its responses will score as incorrect.',
+                   values=unkeyed, rows=[None] * len(unkeyed), column='testid', warning=True)
+
+
+def _upload_report(report, response_test_codes, answer_key_rows, started):
+    """
+    Adds the coverage checks to the report of a whole upload, once its files are checked
+    (`answer_key_rows` holds (ak_name, first rows) per AK file), and returns it as a dict.
+    """
+    all_test_codes = response_test_codes | {test_code for _, first_rows in answer_key_rows for test_code in first_rows}
+    known_test_codes = set(Test.objects.filter(test_code__in=all_test_codes).values_list('test_code', flat=True))
+    _check_coverage(report, response_test_codes, answer_key_rows, known_test_codes)
+    return report.as_dict(time.perf_counter() - started)
+
+
+def _validate_file_pairs(file_pairs):
+    """
+    Validates the SR/AK file pairs of an upload (anything with sr_name, sr_file, ak_name,
+    ak_file, e.g. _FilePair) without writing to the database. Returns the report as a dict;
+    report['valid'] is False when the load must not start. Ingestion runs the same checks
+    in the pass that stages the files (see pipeline.py).
+    """
+    started = time.perf_counter()
+    report = _ValidationReport()
+    response_test_codes = set()
+    answer_key_rows = []
+    seen_pairs, seen_questions = {}, {}
+    for pair in file_pairs:
+        response_test_codes |= _validate_responses(report, pair.sr_name, pair.sr_file, seen_pairs)
+        answer_key_rows.append((pair.ak_name, _validate_answer_key(report, pair.ak_name, pair.ak_file, seen_questions)))
+    return _upload_report(report, response_test_codes, answer_key_rows, started)
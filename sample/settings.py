@@ -111,6 +111,9 @@ DATABASES = {
         'PORT': env('DATABASE_PORT'),
     }
 }
+# Second connection to the same database, used by the ingestion worker to publish job
+# progress while the ingestion transaction on 'default' is still open.
+DATABASES['jobs'] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
 
 
 # --- Password validation ---
@@ -142,6 +145,37 @@ STATIC_URL = "/static/"
 # In production, you'll likely need STATIC_ROOT for collectstatic
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# --- Media files (uploads persisted for background ingestion jobs) ---
+MEDIA_URL = "/media/"
+MEDIA_ROOT = env.str('MEDIA_ROOT', default=os.path.join(BASE_DIR, 'media'))
+
+# --- Ingestion ---
+# Default number of worker processes for partitioned (per-test) ingestion; 1 runs serially.
+INGESTION_WORKERS = env.int('INGESTION_WORKERS', default=1)
+# Storage for student responses: 'rows' (one StudentResponse row per question) or
+# 'sheets' (one packed StudentAnswerSheet row per student and test).
+RESPONSE_STORAGE = env.str('RESPONSE_STORAGE', default='rows')
+# Marks per response by test type; unlisted test types use NEET marking (+4 / -1 / 0).
+# Example: {'JEE MAIN': {'correct': 4, 'incorrect': -1, 'unattempted': 0}}
+SCORING_POLICIES = {}
+# Seconds ingestion waits for the next chunk of an unfinished chunked upload before failing the job.
+CHUNKED_UPLOAD_WAIT_TIMEOUT = env.float('CHUNKED_UPLOAD_WAIT_TIMEOUT', default=600.0)
+# Trace peak Python memory per ingestion phase (tracemalloc). It slows ingestion down
+# noticeably, so it is off by default; turn it on to debug, or with `ingest --trace-memory`.
+INGESTION_TRACE_MEMORY = env.bool('INGESTION_TRACE_MEMORY', default=False)
+
+# --- Logging: one structured metrics record per ingestion run ---
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'excelhandler.ingestion': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
+
 
 # --- Default primary key field type ---
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"